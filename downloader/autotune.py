@@ -0,0 +1,202 @@
+"""
+Link calibration that finds the best performance profile for a segment host
+"""
+
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import m3u8
+
+from .transport import create_transport, TRANSPORT_AUTO, TRANSPORT_ERRORS
+from .playlist import iter_media_segments
+from .variant_selector import variant_quality_key
+from utils.config import PERFORMANCE_SETTINGS, validate_performance
+
+logger = logging.getLogger('video_downloader')
+
+CONCURRENCY_STEPS = (1, 2, 4, 8, 16, 32)
+CHUNK_SIZE_STEPS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024)
+
+# A higher setting must beat the best one so far by this much to be kept
+MIN_GAIN = 0.05
+
+
+def resolve_segment_urls(url, transport, timeout=30):
+    """Segment URLs from a master or media playlist URL, taking the best variant of a master"""
+    response = transport.get(url, timeout=timeout)
+    response.raise_for_status()
+    playlist = m3u8.loads(response.text)
+    if playlist.is_variant:
+        best = max(playlist.playlists, key=variant_quality_key)
+        url = urljoin(url, best.uri)
+        response = transport.get(url, timeout=timeout)
+        response.raise_for_status()
+    return [urljoin(url, uri) for _, uri in iter_media_segments(response.text.splitlines())]
+
+
+class TrialResult:
+    def __init__(self, concurrency, chunk_size):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.bytes = 0
+        self.segments = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self.segment_times = []
+        # The unexpected exception a request of this trial raised, which discards the trial
+        self.failure = None
+        self._lock = threading.Lock()
+
+    def record(self, size, seconds):
+        with self._lock:
+            self.bytes += size
+            self.segments += 1
+            self.segment_times.append(seconds)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    @property
+    def throughput(self):
+        """Bytes per second, with every failed request costing a whole segment's worth"""
+        if self.failure is not None or not self.elapsed or not self.segments:
+            return 0.0
+        penalty = self.errors * self.bytes / self.segments
+        return max(self.bytes - penalty, 0) / self.elapsed
+
+    def __repr__(self):
+        if self.failure is not None:
+            return f"<trial concurrency={self.concurrency} chunk={self.chunk_size} failed: {self.failure}>"
+        return (f"<trial concurrency={self.concurrency} chunk={self.chunk_size} "
+                f"{self.throughput / 1024 ** 2:.2f} MiB/s errors={self.errors}>")
+
+
+class LinkTuner:
+    """Measures segment throughput for a grid of settings and picks the best profile
+
+    Concurrency is raised step by step until it stops paying off, then the
+    chunk size is tuned at that concurrency. Every trial downloads distinct
+    segments and discards the bytes.
+    """
+
+    def __init__(self, segment_urls, transport_kind=TRANSPORT_AUTO, headers=None,
+                 segments_per_trial=None, timeout=30):
+        if not segment_urls:
+            raise ValueError("No segments to calibrate against")
+        self.segment_urls = segment_urls
+        self.transport_kind = transport_kind
+        self.headers = headers
+        self.segments_per_trial = segments_per_trial
+        self.timeout = timeout
+        self.trials = []
+        self._next_segment = 0
+
+    def _take_segments(self, count):
+        urls = []
+        for _ in range(count):
+            urls.append(self.segment_urls[self._next_segment % len(self.segment_urls)])
+            self._next_segment += 1
+        return urls
+
+    def _fetch(self, transport, url, chunk_size, result):
+        started = time.monotonic()
+        try:
+            response = transport.get(url, stream=True, timeout=self.timeout)
+            try:
+                response.raise_for_status()
+                size = 0
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    size += len(chunk)
+            finally:
+                response.close()
+        except TRANSPORT_ERRORS as e:
+            logger.debug(f"Calibration request to {url} failed: {e}")
+            result.record_error()
+            return
+        result.record(size, time.monotonic() - started)
+
+    def run_trial(self, concurrency, chunk_size):
+        result = TrialResult(concurrency, chunk_size)
+        count = self.segments_per_trial or max(concurrency * 3, 6)
+        urls = self._take_segments(count)
+        transport = create_transport(self.transport_kind, self.headers, pool_size=concurrency)
+        try:
+            # Connection setup is part of every real job, so it stays inside the measurement
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(self._fetch, transport, url, chunk_size, result) for url in urls]
+            result.elapsed = time.monotonic() - started
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    result.failure = f"{type(e).__name__}: {e}"
+                    break
+        finally:
+            transport.close()
+        if result.failure is not None:
+            logger.warning(f"Calibration {result}, skipping it")
+        else:
+            logger.info(f"Calibration {result}")
+        self.trials.append(result)
+        return result
+
+    def tune(self, concurrency_steps=CONCURRENCY_STEPS, chunk_size_steps=CHUNK_SIZE_STEPS):
+        """Run the calibration, returns (profile dict, best TrialResult)"""
+        default_chunk = PERFORMANCE_SETTINGS['chunk_size'][3]
+        best = None
+        for concurrency in concurrency_steps:
+            result = self.run_trial(concurrency, default_chunk)
+            if result.failure is not None:
+                continue
+            if best is None or result.throughput > best.throughput * (1 + MIN_GAIN):
+                best = result
+            elif result.throughput < best.throughput:
+                # Past the knee: more connections only add contention
+                break
+        if best is None:
+            raise RuntimeError(f"Every calibration trial failed, last: {result.failure}")
+
+        for chunk_size in chunk_size_steps:
+            if chunk_size == default_chunk:
+                continue
+            result = self.run_trial(best.concurrency, chunk_size)
+            if result.throughput > best.throughput * (1 + MIN_GAIN):
+                best = result
+
+        return self._profile(best), best
+
+    def _profile(self, best):
+        segment_size = best.bytes / best.segments if best.segments else PERFORMANCE_SETTINGS['chunk_size'][3]
+        times = sorted(best.segment_times) or [self.timeout]
+        slowest = times[min(len(times) - 1, int(len(times) * 0.95))]
+        minimum, maximum = PERFORMANCE_SETTINGS['buffer_budget'][1:3]
+        return validate_performance({
+            'concurrency': best.concurrency,
+            'chunk_size': best.chunk_size,
+            # Room for four segments per worker ahead of the writer
+            'buffer_budget': int(min(max(segment_size * best.concurrency * 4, minimum), maximum)),
+            # Generous against the slowest observed segment, never below 10s
+            'timeout': round(min(max(slowest * 4, 10), PERFORMANCE_SETTINGS['timeout'][2]), 1),
+            # Retry more on links that dropped requests during calibration
+            'max_retries': min(PERFORMANCE_SETTINGS['max_retries'][3] + (1 if best.errors else 0),
+                               PERFORMANCE_SETTINGS['max_retries'][2])
+        })
+
+
+def autotune(segment_urls, config=None, transport_kind=TRANSPORT_AUTO, headers=None, save=True):
+    """Calibrate against segment_urls and store the profile for their host in config
+
+    Returns (host, profile, best TrialResult).
+    """
+    host = urlparse(segment_urls[0]).hostname
+    tuner = LinkTuner(segment_urls, transport_kind, headers)
+    profile, best = tuner.tune()
+    logger.info(f"Best profile for {host}: {profile} ({best.throughput / 1024 ** 2:.2f} MiB/s)")
+    if save and config is not None:
+        config.set_performance(profile, host=host)
+    return host, profile, best
@@ -0,0 +1,276 @@
+"""
+Local HLS benchmark server with configurable latency and bandwidth
+
+Serves the same API, master playlist, media playlist and segment endpoints
+the downloader uses, so tuning and throughput changes can be measured
+without touching a real host.
+"""
+
+import re
+import time
+import json
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger('video_downloader')
+
+
+class _TokenBucket:
+    """Shared bandwidth cap across every connection of the server"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        # Small burst allowance so short runs see the configured rate
+        self.capacity = max(rate / 20, 64 * 1024)
+        self._lock = threading.Lock()
+        self._available = 0.0
+        self._updated = time.monotonic()
+
+    def consume(self, amount):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate
+            time.sleep(wait)
+
+
+class _BenchmarkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    segment_re = re.compile(r'^/(seg|audio|subs)/(\d+)\.(?:ts|aac|vtt)$')
+    range_re = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type='application/octet-stream'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        bench = self.server.bench
+        path = self.path.split('?', 1)[0]
+        bench.count_request()
+
+        if path.startswith('/videos/') and path.endswith('/info'):
+            self._send(json.dumps({'success': True, 'data': {'title': 'benchmark'}}).encode(), 'application/json')
+        elif path.startswith('/videos/') and path.endswith('/stream'):
+            payload = {'success': True, 'data': {'url': f"{bench.url}/master.m3u8"}}
+            self._send(json.dumps(payload).encode(), 'application/json')
+        elif path == '/master.m3u8':
+            self._send(bench.master_playlist().encode(), 'application/vnd.apple.mpegurl')
+        elif path == '/media.m3u8':
+            self._send(bench.media_playlist().encode(), 'application/vnd.apple.mpegurl')
+        elif path == '/audio.m3u8' and bench.audio:
+            self._send(bench.rendition_playlist('audio', 'aac').encode(), 'application/vnd.apple.mpegurl')
+        elif path == '/subs.m3u8' and bench.subtitles:
+            self._send(bench.rendition_playlist('subs', 'vtt').encode(), 'application/vnd.apple.mpegurl')
+        elif path == '/video.ts':
+            self._send_file_range()
+        else:
+            match = self.segment_re.match(path)
+            if not match or int(match.group(2)) >= bench.segments:
+                self.send_error(404)
+                return
+            self._send_segment(match.group(1), int(match.group(2)))
+
+    def _send_segment(self, track, index):
+        bench = self.server.bench
+        if bench.latency:
+            time.sleep(bench.latency)
+        if track == 'audio':
+            self._stream_body(bench.audio_bytes(index))
+        elif track == 'subs':
+            self._stream_body(bench.subtitle_bytes(index))
+        else:
+            self._stream_body(bench.segment_bytes(index))
+
+    def _send_file_range(self):
+        """Every segment concatenated into one file, honouring a single Range header"""
+        bench = self.server.bench
+        if bench.latency:
+            time.sleep(bench.latency)
+        file_size = bench.segments * bench.segment_size
+        match = self.range_re.match(self.headers.get('Range', ''))
+        if not match:
+            self._stream_body(bench.file_bytes(0, file_size))
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2)) + 1 if match.group(2) else file_size, file_size)
+        if start >= end:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{file_size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._stream_body(bench.file_bytes(start, end), status=206,
+                          headers={'Content-Range': f"bytes {start}-{end - 1}/{file_size}"})
+
+    def _stream_body(self, body, status=200, headers=None):
+        bench = self.server.bench
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp2t')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        block = 16 * 1024
+        started = time.monotonic()
+        for offset in range(0, len(body), block):
+            chunk = body[offset:offset + block]
+            if bench.bucket:
+                bench.bucket.consume(len(chunk))
+            if bench.connection_bandwidth:
+                # Per-connection cap, like a TCP window limited by RTT
+                ahead = (offset + len(chunk)) / bench.connection_bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            self.wfile.write(chunk)
+
+
+def _vtt_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+
+class BenchmarkServer:
+    """HLS origin on 127.0.0.1 with first-byte latency, per-connection and total bandwidth limits
+
+    latency is seconds before each segment's first byte; connection_bandwidth
+    and total_bandwidth are bytes per second (None for unlimited).
+    """
+
+    def __init__(self, segments=60, segment_size=512 * 1024, segment_duration=4.0, latency=0.05,
+                 connection_bandwidth=None, total_bandwidth=None, port=0, byte_ranges=False,
+                 audio=False, subtitles=False):
+        self.segments = segments
+        # Separate EXT-X-MEDIA audio and subtitle renditions next to the video variant
+        self.audio = audio
+        self.subtitles = subtitles
+        # Serve the media playlist as EXT-X-BYTERANGE sub-ranges of one /video.ts file
+        self.byte_ranges = byte_ranges
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+        self.latency = latency
+        self.connection_bandwidth = connection_bandwidth
+        self.bucket = _TokenBucket(total_bandwidth) if total_bandwidth else None
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._port = port
+        self._server = None
+        self._thread = None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def api_url(self):
+        return self.url
+
+    @property
+    def media_url(self):
+        return f"{self.url}/media.m3u8"
+
+    def master_playlist(self):
+        bandwidth = int(self.segment_size * 8 / self.segment_duration)
+        lines = ["#EXTM3U"]
+        attributes = ""
+        if self.audio:
+            lines.append('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="English",LANGUAGE="en",'
+                         'DEFAULT=YES,AUTOSELECT=YES,URI="audio.m3u8"')
+            attributes += ',AUDIO="aud"'
+        if self.subtitles:
+            lines.append('#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="English",LANGUAGE="en",'
+                         'DEFAULT=YES,URI="subs.m3u8"')
+            attributes += ',SUBTITLES="subs"'
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION=1280x720{attributes}")
+        lines.append("media.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self):
+        # EXT-X-BYTERANGE needs protocol version 4
+        version = 4 if self.byte_ranges else 3
+        lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}", f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}"]
+        for index in range(self.segments):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            if self.byte_ranges:
+                lines.append(f"#EXT-X-BYTERANGE:{self.segment_size}@{index * self.segment_size}")
+                lines.append("video.ts")
+            else:
+                lines.append(f"seg/{index}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def rendition_playlist(self, track, extension):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}"]
+        for index in range(self.segments):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            lines.append(f"{track}/{index}.{extension}")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def audio_bytes(self, index):
+        # An eighth of a video segment, roughly the share of a typical audio track
+        pattern = f"audio-{index:06d}|".encode()
+        size = max(self.segment_size // 8, len(pattern))
+        return (pattern * (size // len(pattern) + 1))[:size]
+
+    def subtitle_bytes(self, index):
+        start = index * self.segment_duration
+        return (
+            "WEBVTT\n\n"
+            f"{_vtt_time(start)} --> {_vtt_time(start + self.segment_duration)}\n"
+            f"Line {index}\n"
+        ).encode()
+
+    def segment_bytes(self, index):
+        # Distinct, deterministic content per segment so hashes differ
+        pattern = f"segment-{index:06d}|".encode()
+        return (pattern * (self.segment_size // len(pattern) + 1))[:self.segment_size]
+
+    def file_bytes(self, start, end):
+        """Bytes start..end (exclusive) of the concatenation of every segment"""
+        pieces = []
+        position = start
+        while position < end:
+            index, offset = divmod(position, self.segment_size)
+            piece = self.segment_bytes(index)[offset:offset + end - position]
+            pieces.append(piece)
+            position += len(piece)
+        return b''.join(pieces)
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', self._port), _BenchmarkHandler)
+        self._server.daemon_threads = True
+        self._server.bench = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Benchmark server listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,172 @@
+"""
+Lean headless browser profile and per-extraction browser metrics
+
+Dynamic extraction only needs the page's scripts and the media requests
+they make. Images, fonts, stylesheets, ads and analytics are blocked through
+DevTools before navigation, and hosts whose players need some of them list
+allow patterns in the config's browser section. The block list covers the
+whole tab, so a player host's allow list is applied to any page that may
+embed that player.
+"""
+
+import os
+import time
+import fnmatch
+import logging
+from urllib.parse import urlparse
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger('video_downloader')
+
+# Network.setBlockedURLs wildcard patterns for requests that cannot carry media
+BLOCKED_RESOURCE_PATTERNS = (
+    # Images and icons
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico', '*.bmp',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Stylesheets
+    '*.css',
+    # Ads, analytics and social widgets
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*adservice.google.*', '*facebook.net*', '*connect.facebook.*',
+    '*hotjar.com*', '*scorecardresearch.com*', '*quantserve.com*', '*amazon-adsystem.com*',
+    '*adnxs.com*', '*taboola.com*', '*outbrain.com*', '*popads.net*', '*propellerads.com*',
+    '*yandex.ru/metrika*', '*mc.yandex.*', '*disqus.com*', '*gravatar.com*',
+)
+
+# Flags that keep a headless Chrome small: no images, fewer helper processes, a capped JS heap
+LEAN_CHROME_ARGUMENTS = (
+    '--blink-settings=imagesEnabled=false',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication',
+    '--mute-audio',
+    '--no-first-run',
+    '--renderer-process-limit=2',
+    '--js-flags=--max-old-space-size=256',
+    '--window-size=1280,720',
+)
+
+
+def _allow_list(allow, host):
+    host = host.lower()
+    return allow.get(host) or allow.get(host.removeprefix('www.')) or []
+
+
+def blocked_patterns(url, browser_settings=None, player_hosts=()):
+    """Patterns to block while loading url: the defaults plus extra ones, minus the allow lists
+
+    Network.setBlockedURLs applies to the whole tab, cross-origin player
+    iframes included, so the allow lists of player_hosts (players the page
+    may embed) are honoured along with that of url's own host.
+
+    Allow entries are matched with fnmatch against the block patterns, not
+    against request URLs: '*.css' lifts the '*.css' block, '*' lifts them all.
+    """
+    settings = browser_settings or {}
+    patterns = list(BLOCKED_RESOURCE_PATTERNS) + list(settings.get('blocked_urls', []))
+    hosts = [urlparse(url).hostname or ''] + list(player_hosts)
+    allow = [keep for host in hosts for keep in _allow_list(settings.get('allow', {}), host)]
+    if not allow:
+        return patterns
+    return [pattern for pattern in patterns if not any(fnmatch.fnmatch(pattern, keep) for keep in allow)]
+
+
+def _proc_children(pid):
+    """Child PIDs from /proc, for systems without psutil"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, the parent PID follows its closing parenthesis
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return children
+
+
+def _proc_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants, or None when it cannot be read"""
+    if pid is None:
+        return None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    if not os.path.isdir('/proc'):
+        return None
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        total += _proc_rss(current)
+        pending.extend(_proc_children(current))
+    return total
+
+
+class BrowserMetrics:
+    """Page-load time and browser memory for one dynamic extraction"""
+
+    def __init__(self, webpage_url, lean):
+        self.webpage_url = webpage_url
+        self.lean = lean
+        self.page_load = None
+        self.total = None
+        self.rss = None
+        self.blocked_patterns = 0
+        self._started = time.monotonic()
+        self._navigation_started = None
+
+    def navigation_started(self):
+        self._navigation_started = time.monotonic()
+
+    def navigation_finished(self):
+        self.page_load = time.monotonic() - self._navigation_started
+
+    def finish(self, driver_pid):
+        self.total = time.monotonic() - self._started
+        self.rss = process_tree_rss(driver_pid)
+        return self
+
+    def as_dict(self):
+        return {
+            'webpage_url': self.webpage_url,
+            'lean': self.lean,
+            'page_load': self.page_load,
+            'total': self.total,
+            'rss': self.rss,
+            'blocked_patterns': self.blocked_patterns
+        }
+
+    def __str__(self):
+        page_load = f"{self.page_load:.2f}s" if self.page_load is not None else "n/a"
+        rss = f"{self.rss / 1024 ** 2:.0f} MiB" if self.rss is not None else "n/a"
+        profile = "lean" if self.lean else "full"
+        return f"page load {page_load}, extraction {self.total:.2f}s, browser RSS {rss} ({profile} profile)"
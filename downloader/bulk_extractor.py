@@ -0,0 +1,176 @@
+"""
+Bulk page extraction: concurrent fetching, process-pool parsing and a bounded browser stage
+"""
+
+import os
+import time
+import threading
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+from .cancellation import CancellationToken, DownloadCancelled
+from .video_extractor import EnhancedVideoExtractor
+from utils.config import Config
+
+logger = logging.getLogger('video_downloader')
+
+STAGE_STATIC = 'static'
+STAGE_DYNAMIC = 'dynamic'
+
+
+class HostLimiter:
+    """Politeness limit: at most max_concurrent requests per host, started min_interval apart"""
+
+    def __init__(self, max_concurrent=4, min_interval=0.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._active = {}
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, url, cancel_token=None):
+        host = urlparse(url).netloc.lower()
+        with self._cond:
+            while True:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                now = time.monotonic()
+                delay = self._next_start.get(host, 0.0) - now
+                if self._active.get(host, 0) < self.max_concurrent and delay <= 0:
+                    break
+                # Short waits so a cancelled job does not sit here until a slot frees up
+                self._cond.wait(min(delay, 0.25) if delay > 0 else 0.25)
+            self._active[host] = self._active.get(host, 0) + 1
+            self._next_start[host] = now + self.min_interval
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[host] -= 1
+                self._cond.notify_all()
+
+
+class BulkExtractor:
+    """Resolves many web pages to video info, yielding results as they complete
+
+    Pages are fetched on fetch_workers threads (each with its own session),
+    HTML parsing runs in a pool of parse_workers processes, and only pages
+    the static pass could not resolve go to browser_workers Selenium workers.
+    """
+
+    def __init__(self, fetch_workers=16, per_host_limit=4, min_host_interval=0.0,
+                 parse_workers=None, browser_workers=1, max_in_flight=None, config=None):
+        self.config = config or Config()
+        self.fetch_workers = fetch_workers
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.browser_workers = browser_workers
+        self.max_in_flight = max_in_flight or fetch_workers * 2
+        self.host_limiter = HostLimiter(per_host_limit, min_host_interval)
+        self._local = threading.local()
+        self._parse_executor = None
+
+    def _extractor(self, cancel_token):
+        """Per-thread extractor sharing the parse pool and host limiter"""
+        extractor = getattr(self._local, 'extractor', None)
+        if extractor is None:
+            extractor = self._local.extractor = EnhancedVideoExtractor(config=self.config)
+            extractor.parse_executor = self._parse_executor
+            extractor.request_gate = self.host_limiter
+        extractor.cancel_token = cancel_token
+        return extractor
+
+    def _static_stage(self, webpage_url, cancel_token):
+        extractor = self._extractor(cancel_token)
+        error = None
+        try:
+            video_info = extractor._extract_without_browser(webpage_url)
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            logger.info(f"Static extraction failed for {webpage_url}: {e}")
+            video_info = None
+            error = str(e)
+        return {'webpage_url': webpage_url, 'video_info': video_info, 'error': error, 'stage': STAGE_STATIC,
+                'player_hosts': sorted(extractor._player_hosts)}
+
+    def _dynamic_stage(self, webpage_url, player_hosts, cancel_token):
+        extractor = self._extractor(cancel_token)
+        try:
+            video_info = extractor._extract_dynamic_content(webpage_url, player_hosts)
+            error = None
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            video_info = None
+            error = str(e)
+        return {'webpage_url': webpage_url, 'video_info': video_info, 'error': error, 'stage': STAGE_DYNAMIC}
+
+    def extract_many(self, urls, cancel_token=None):
+        """Yield a result dict per page URL, in completion order
+
+        The input iterable is consumed lazily, so it can be a file or a
+        generator of any length. Closing the generator cancels the work that
+        is still in flight.
+        """
+        job_token = cancel_token.child() if cancel_token is not None else CancellationToken()
+        if self.parse_workers > 0:
+            # spawn: forking a process that already runs fetch threads is not safe
+            self._parse_executor = ProcessPoolExecutor(
+                self.parse_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        fetch_pool = ThreadPoolExecutor(self.fetch_workers, thread_name_prefix='bulk-fetch')
+        browser_pool = ThreadPoolExecutor(self.browser_workers, thread_name_prefix='bulk-browser') \
+            if self.browser_workers > 0 else None
+
+        url_iter = iter(urls)
+        pending = set()
+        exhausted = False
+        started = time.monotonic()
+        counts = {STAGE_STATIC: 0, STAGE_DYNAMIC: 0, 'failed': 0}
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_in_flight:
+                    try:
+                        webpage_url = next(url_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    webpage_url = webpage_url.strip()
+                    if webpage_url:
+                        pending.add(fetch_pool.submit(self._static_stage, webpage_url, job_token))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    # Players found by the static pass, for the browser's allow lists
+                    player_hosts = result.pop('player_hosts', ())
+                    if result['video_info'] is None and result['stage'] == STAGE_STATIC and browser_pool:
+                        pending.add(browser_pool.submit(
+                            self._dynamic_stage, result['webpage_url'], player_hosts, job_token
+                        ))
+                        continue
+                    counts[result['stage'] if result['video_info'] else 'failed'] += 1
+                    yield result
+        finally:
+            job_token.cancel()
+            fetch_pool.shutdown(wait=True, cancel_futures=True)
+            if browser_pool:
+                browser_pool.shutdown(wait=True, cancel_futures=True)
+            if self._parse_executor is not None:
+                self._parse_executor.shutdown(wait=True, cancel_futures=True)
+                self._parse_executor = None
+            self._local = threading.local()
+
+            elapsed = time.monotonic() - started
+            total = sum(counts.values())
+            logger.info(
+                f"Bulk extraction: {total} page(s) in {elapsed:.1f}s "
+                f"({total / elapsed if elapsed else 0:.1f}/s), static {counts[STAGE_STATIC]}, "
+                f"browser {counts[STAGE_DYNAMIC]}, failed {counts['failed']}"
+            )
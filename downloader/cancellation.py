@@ -0,0 +1,104 @@
+"""
+Cooperative cancellation for extraction and download jobs
+"""
+
+import socket
+import threading
+import logging
+
+logger = logging.getLogger('video_downloader')
+
+
+class DownloadCancelled(Exception):
+    """Raised inside a job once its cancellation token has been triggered"""
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_handle = 0
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Trigger cancellation and run every registered abort callback once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancellation callback failed: {e}")
+
+    def register(self, callback):
+        """Register an abort callback, returns a handle for unregister()"""
+        with self._lock:
+            if not self._event.is_set():
+                handle = self._next_handle
+                self._next_handle += 1
+                self._callbacks[handle] = callback
+                return handle
+
+        # Already cancelled - abort straight away
+        try:
+            callback()
+        except Exception as e:
+            logger.debug(f"Cancellation callback failed: {e}")
+        return None
+
+    def unregister(self, handle):
+        """Remove a previously registered callback"""
+        if handle is None:
+            return
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    def child(self):
+        """New token that is cancelled together with this one but can also be cancelled alone"""
+        token = CancellationToken()
+        handle = self.register(token.cancel)
+        token.register(lambda: self.unregister(handle))
+        return token
+
+    def raise_if_cancelled(self):
+        """Raise DownloadCancelled if the token has been triggered"""
+        if self._event.is_set():
+            raise DownloadCancelled("Operation cancelled")
+
+    def sleep(self, seconds):
+        """Interruptible replacement for time.sleep()"""
+        if self._event.wait(seconds):
+            raise DownloadCancelled("Operation cancelled")
+
+
+def abort_response(response):
+    """Shut down the socket under a streaming response so blocked reads return at once"""
+    raw = getattr(response, 'raw', None)
+    sock = None
+    try:
+        connection = getattr(raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            sock = raw._fp.fp.raw._sock
+    except Exception:
+        pass
+
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    try:
+        response.close()
+    except Exception:
+        pass
@@ -0,0 +1,398 @@
+"""
+Opt-in capture of HTTP traffic into a size-bounded ring, and offline replay of it
+
+Captured records (pages, player pages, AJAX/API calls, playlists and
+segments) are compressed and appended to rotating log files by a background
+thread, so capturing adds no disk I/O to the request path. The oldest log
+files are deleted once the store grows past max_bytes.
+"""
+
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+import queue
+import logging
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .segment_store import normalize_segment_url, VOLATILE_PARAMS
+from .transport import ConnectionStats
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_CAPTURE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "captures")
+DEFAULT_CAPTURE_BYTES = 256 * 1024 ** 2
+# Bodies waiting for the writer thread, in bytes; records past it are dropped
+DEFAULT_QUEUE_BYTES = 64 * 1024 ** 2
+
+# Cache-busting parameters added per request by some players
+CAPTURE_VOLATILE_PARAMS = VOLATILE_PARAMS + ('_t', '_', 'ts')
+
+# Bodies of these types are already compressed, storing them as-is is cheaper
+INCOMPRESSIBLE_TYPES = ('video/', 'audio/', 'image/', 'application/octet-stream')
+
+# Headers that describe the wire encoding, which no longer applies to the stored body
+WIRE_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'connection')
+
+_HEADER_LENGTH = struct.Struct('>I')
+
+
+def capture_key(method, url, data=None):
+    """Replay lookup key: method, canonical URL and a digest of the request body"""
+    if isinstance(data, dict):
+        data = json.dumps(data, sort_keys=True)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    body_digest = hashlib.sha1(data).hexdigest() if data else ''
+    return f"{method.upper()} {normalize_segment_url(url, CAPTURE_VOLATILE_PARAMS)} {body_digest}"
+
+
+class CapturedResponse:
+    """A stored response with the parts of the requests API the downloaders use"""
+
+    raw = None
+
+    def __init__(self, header, body):
+        self.status_code = header['status']
+        self.headers = CaseInsensitiveDict(header['headers'])
+        self.headers['Content-Length'] = str(len(body))
+        self.url = header['final_url']
+        self.content = body
+        self.encoding = header.get('encoding') or 'utf-8'
+        self.reason = ''
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} Error (replayed) for url: {self.url}", response=self)
+
+    def iter_content(self, chunk_size=8192, decode_unicode=False):
+        size = chunk_size or len(self.content) or 1
+        for offset in range(0, len(self.content), size):
+            yield self.content[offset:offset + size]
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False):
+        return iter(self.content.splitlines())
+
+    def close(self):
+        pass
+
+
+class CaptureStore:
+    def __init__(self, root=DEFAULT_CAPTURE_DIR, max_bytes=DEFAULT_CAPTURE_BYTES, queue_size=256,
+                 queue_bytes=DEFAULT_QUEUE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Eight log files per ring, so eviction frees an eighth of the budget at a time
+        self.file_bytes = max(max_bytes // 8, 1024 ** 2)
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index = {}
+        self._files = []
+        self._file_sizes = {}
+        self.dropped = 0
+        self._load_index()
+
+        self._queue = queue.Queue(queue_size)
+        # Segment bodies are large, so the queue is bounded by their bytes as well as by count
+        self.queue_bytes = queue_bytes
+        self._queued_bytes = 0
+        self._queued_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name='capture-writer', daemon=True)
+        self._writer.start()
+
+    def _load_index(self):
+        """Rebuild the key index from the log files already on disk"""
+        names = sorted(name for name in os.listdir(self.root) if name.endswith('.capture'))
+        for name in names:
+            path = os.path.join(self.root, name)
+            self._files.append(name)
+            self._file_sizes[name] = os.path.getsize(path)
+            try:
+                with open(path, 'rb') as f:
+                    while True:
+                        prefix = f.read(_HEADER_LENGTH.size)
+                        if len(prefix) < _HEADER_LENGTH.size:
+                            break
+                        header = json.loads(f.read(_HEADER_LENGTH.unpack(prefix)[0]))
+                        self._index[header['key']] = (name, f.tell(), header)
+                        f.seek(header['stored_size'], os.SEEK_CUR)
+            except (OSError, ValueError, KeyError) as e:
+                # A record cut short by a crash ends the readable part of that file
+                logger.debug(f"Stopped reading capture file {name}: {e}")
+
+    def record(self, method, url, data, status, headers, body, final_url=None, encoding=None):
+        """Queue a request/response pair for capture; never blocks the caller
+
+        The record is dropped (and counted in dropped) while the queue is full
+        by count or by queue_bytes.
+        """
+        headers = {k: v for k, v in dict(headers).items() if k.lower() not in WIRE_HEADERS}
+        header = {
+            'key': capture_key(method, url, data),
+            'method': method.upper(),
+            'url': url,
+            'final_url': final_url or url,
+            'status': status,
+            'headers': headers,
+            'encoding': encoding
+        }
+        with self._queued_lock:
+            # One body larger than the whole budget is still taken when nothing else is waiting
+            if self._queued_bytes and self._queued_bytes + len(body) > self.queue_bytes:
+                self.dropped += 1
+                return
+            self._queued_bytes += len(body)
+        try:
+            self._queue.put_nowait((header, body))
+        except queue.Full:
+            with self._queued_lock:
+                self._queued_bytes -= len(body)
+                self.dropped += 1
+
+    def record_response(self, method, url, data, response):
+        """Capture a fully read requests-style response"""
+        self.record(
+            method, url, data, response.status_code, response.headers, response.content,
+            final_url=getattr(response, 'url', None), encoding=getattr(response, 'encoding', None)
+        )
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                logger.debug(f"Failed to write capture record: {e}")
+            finally:
+                if item is not None:
+                    with self._queued_lock:
+                        self._queued_bytes -= len(item[1])
+                self._queue.task_done()
+
+    def _write(self, header, body):
+        content_type = header['headers'].get('Content-Type', header['headers'].get('content-type', ''))
+        compressed = not content_type.startswith(INCOMPRESSIBLE_TYPES)
+        stored = zlib.compress(body, 6) if compressed else body
+        header['compressed'] = compressed
+        header['stored_size'] = len(stored)
+        header_bytes = json.dumps(header).encode('utf-8')
+
+        with self._lock:
+            name = self._files[-1] if self._files else None
+            if name is None or self._file_sizes[name] >= self.file_bytes:
+                sequence = int(name.split('.')[0]) + 1 if name else 1
+                name = f"{sequence:08d}.capture"
+                self._files.append(name)
+                self._file_sizes[name] = 0
+
+            with open(os.path.join(self.root, name), 'ab') as f:
+                f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+                f.write(header_bytes)
+                body_offset = f.tell()
+                f.write(stored)
+            self._file_sizes[name] = body_offset + len(stored)
+            self._index[header['key']] = (name, body_offset, header)
+            self._evict()
+
+    def _evict(self):
+        """Drop the oldest log files while the ring is over budget (caller holds the lock)"""
+        while len(self._files) > 1 and sum(self._file_sizes.values()) > self.max_bytes:
+            name = self._files.pop(0)
+            self._file_sizes.pop(name, None)
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+            for key in [key for key, entry in self._index.items() if entry[0] == name]:
+                del self._index[key]
+
+    def lookup(self, method, url, data=None):
+        """Stored (header, body) for a request, or None"""
+        with self._lock:
+            entry = self._index.get(capture_key(method, url, data))
+            if entry is None:
+                return None
+            name, offset, header = entry
+            try:
+                with open(os.path.join(self.root, name), 'rb') as f:
+                    f.seek(offset)
+                    stored = f.read(header['stored_size'])
+            except OSError:
+                return None
+        return header, zlib.decompress(stored) if header['compressed'] else stored
+
+    def replay(self, method, url, data=None):
+        """CapturedResponse for a request; a miss raises requests.ConnectionError like an unreachable host"""
+        found = self.lookup(method, url, data)
+        if found is None:
+            raise requests.ConnectionError(f"No captured response for {method.upper()} {url}")
+        return CapturedResponse(*found)
+
+    def size(self):
+        with self._lock:
+            return sum(self._file_sizes.values())
+
+    def flush(self):
+        """Wait until every queued record is on disk"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_capture_store(config):
+    """The process-wide capture store configured in config, or None when capture is off"""
+    settings = config.get('capture') or {}
+    if not settings.get('enabled'):
+        return None
+    root = settings.get('directory') or DEFAULT_CAPTURE_DIR
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = CaptureStore(root, settings.get('max_bytes') or DEFAULT_CAPTURE_BYTES,
+                                                 queue_bytes=settings.get('queue_bytes') or DEFAULT_QUEUE_BYTES)
+        return store
+
+
+def _lines(chunks):
+    """Split a stream of byte chunks into lines, like requests' iter_lines"""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith((b'\n', b'\r')) else b''
+        for line in lines:
+            yield line.rstrip(b'\r\n')
+    if pending:
+        yield pending
+
+
+class _TeeResponse:
+    """Streaming response that hands its body to the capture store once fully read
+
+    A reader may stop at the end of the body without hitting the end of the
+    stream, as range requests do, so a body that reached its Content-Length
+    is also recorded when the response is closed.
+    """
+
+    def __init__(self, response, store, url, data=None):
+        self._response = response
+        self._store = store
+        self._url = url
+        self._data = data
+        self._recorded = False
+        self._chunks = []
+        self._read = 0
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _record(self, body):
+        if not self._recorded:
+            self._recorded = True
+            self._store.record('GET', self._url, self._data, self._response.status_code,
+                               self._response.headers, body, final_url=self._response.url)
+
+    @property
+    def content(self):
+        content = self._response.content
+        self._record(content)
+        return content
+
+    @property
+    def text(self):
+        self.content
+        return self._response.text
+
+    def json(self):
+        self.content
+        return self._response.json()
+
+    def iter_content(self, chunk_size=8192, decode_unicode=False):
+        for chunk in self._response.iter_content(chunk_size=chunk_size):
+            self._chunks.append(chunk)
+            self._read += len(chunk)
+            yield chunk
+        self._record(b''.join(self._chunks))
+
+    def close(self):
+        expected = self._response.headers.get('Content-Length')
+        if self._chunks and not self._recorded and expected and expected.isdigit() and self._read == int(expected):
+            self._record(b''.join(self._chunks))
+        self._chunks = []
+        self._response.close()
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False):
+        return _lines(self.iter_content(chunk_size))
+
+
+class CaptureTransport:
+    """Wraps a transport and captures every response it returns"""
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+        self.name = inner.name
+        self.stats = inner.stats
+
+    @property
+    def headers(self):
+        return self.inner.headers
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        response = self.inner.get(url, stream=stream, timeout=timeout, headers=headers)
+        # Byte-range requests of one file are told apart by their Range header
+        data = (headers or {}).get('Range')
+        if stream:
+            return _TeeResponse(response, self.store, url, data)
+        self.store.record('GET', url, data, response.status_code, response.headers, response.content,
+                          final_url=response.url)
+        return response
+
+    def warm(self, url, connections=1):
+        self.inner.warm(url, connections)
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport:
+    """Serves GETs from a capture store instead of the network"""
+
+    name = 'replay'
+
+    def __init__(self, store):
+        self.store = store
+        self.stats = ConnectionStats()
+        self.headers = CaseInsensitiveDict()
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        self.stats.add(request_count=1)
+        return self.store.replay('GET', url, (headers or {}).get('Range'))
+
+    def warm(self, url, connections=1):
+        pass
+
+    def close(self):
+        pass
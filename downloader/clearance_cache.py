@@ -0,0 +1,148 @@
+"""
+Persistent anti-bot clearance and cookie cache shared across processes
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from http.cookiejar import Cookie
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "clearance.json")
+
+# Session cookies have no expiry of their own; reuse them for this long
+SESSION_COOKIE_TTL = 3600
+
+CHALLENGE_MARKERS = ('cf-browser-verification', 'cf_chl_opt', 'challenge-platform', 'jschl-answer')
+
+
+def is_challenge_response(response):
+    """Whether a response is an unsolved anti-bot challenge page"""
+    if response.status_code not in (403, 429, 503):
+        return False
+    if response.headers.get('cf-mitigated') == 'challenge':
+        return True
+    try:
+        text = response.text[:20000]
+    except Exception:
+        return False
+    return any(marker in text for marker in CHALLENGE_MARKERS)
+
+
+def _cookie_domain(cookie):
+    return cookie.domain.lstrip('.').lower()
+
+
+class ClearanceCache:
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fingerprint = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def load(self, session):
+        """Restore unexpired cookies issued to the session's current user agent"""
+        user_agent = session.headers.get('User-Agent')
+        now = time.time()
+        restored = 0
+        with self._lock:
+            for domain, entry in self._read().items():
+                if entry.get('user_agent') != user_agent:
+                    # Clearance is bound to the user agent it was issued for
+                    continue
+                for item in entry.get('cookies', []):
+                    expires = item.get('expires')
+                    if expires is None:
+                        expires = entry.get('saved_at', 0) + SESSION_COOKIE_TTL
+                    if expires <= now:
+                        continue
+                    session.cookies.set_cookie(self._make_cookie(item))
+                    restored += 1
+            self._fingerprint = self._cookie_fingerprint(session)
+
+        if restored:
+            logger.info(f"Restored {restored} cached cookie(s)")
+        return restored
+
+    def save_if_changed(self, session):
+        """Persist the session's cookies when any were added, renewed or removed"""
+        with self._lock:
+            fingerprint = self._cookie_fingerprint(session)
+            if fingerprint == self._fingerprint:
+                return False
+            self._fingerprint = fingerprint
+
+            user_agent = session.headers.get('User-Agent')
+            by_domain = {}
+            for cookie in session.cookies:
+                by_domain.setdefault(_cookie_domain(cookie), []).append({
+                    'name': cookie.name,
+                    'value': cookie.value,
+                    'domain': cookie.domain,
+                    'path': cookie.path,
+                    'secure': cookie.secure,
+                    'expires': cookie.expires
+                })
+
+            # Merge with what other processes wrote in the meantime
+            data = self._read()
+            now = time.time()
+            for domain, cookies in by_domain.items():
+                data[domain] = {'user_agent': user_agent, 'saved_at': now, 'cookies': cookies}
+            try:
+                self._write(data)
+            except OSError as e:
+                logger.debug(f"Could not save clearance cache: {e}")
+                return False
+            return True
+
+    def invalidate(self, session, domain):
+        """Forget a domain's clearance after the site challenged us again"""
+        domain = domain.lower()
+        with self._lock:
+            for cookie in list(session.cookies):
+                if _cookie_domain(cookie) == domain or domain.endswith('.' + _cookie_domain(cookie)):
+                    session.cookies.clear(cookie.domain, cookie.path, cookie.name)
+            data = self._read()
+            stale = [d for d in data if d == domain or domain.endswith('.' + d)]
+            for d in stale:
+                del data[d]
+            if stale:
+                try:
+                    self._write(data)
+                except OSError:
+                    pass
+            self._fingerprint = self._cookie_fingerprint(session)
+        logger.info(f"Cleared cached clearance for {domain}")
+
+    @staticmethod
+    def _cookie_fingerprint(session):
+        return frozenset((c.domain, c.path, c.name, c.value, c.expires) for c in session.cookies)
+
+    @staticmethod
+    def _make_cookie(item):
+        domain = item['domain']
+        return Cookie(
+            version=0, name=item['name'], value=item['value'],
+            port=None, port_specified=False,
+            domain=domain, domain_specified=bool(domain), domain_initial_dot=domain.startswith('.'),
+            path=item.get('path') or '/', path_specified=True,
+            secure=item.get('secure', False), expires=item.get('expires'),
+            discard=item.get('expires') is None, comment=None, comment_url=None, rest={}
+        )
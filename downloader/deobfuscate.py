@@ -0,0 +1,193 @@
+"""
+Pure-Python deobfuscation of player scripts
+
+Unpacks Dean Edwards style eval(function(p,a,c,k,e,d)...) packers, inlines
+string-array lookups and folds simple string expressions (concatenation,
+atob, unescape/decodeURIComponent, String.fromCharCode, reversed strings)
+until nothing changes, then hands the expanded source to the URL scanners.
+Like scanners, everything here is a pure function of text so it can run in
+the parse process pool.
+"""
+
+import re
+import json
+import base64
+import binascii
+from urllib.parse import unquote
+
+from . import scanners
+
+# Rewriting passes over the whole source before giving up on a fixed point
+MAX_ROUNDS = 8
+
+# Packed payloads larger than this are not unpacked (a real player script is far smaller)
+MAX_PACKED_BYTES = 2 * 1024 ** 2
+
+BASE62_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _string(group):
+    """Pattern for a JavaScript string literal whose quote is capture group number group, body group + 1"""
+    return r"""(['"])((?:(?!\%d)[^\\\n]|\\.)*)\%d""" % (group, group)
+
+
+STRING_RE = re.compile(_string(1))
+
+PACKER_RE = re.compile(
+    r"\}\s*\(\s*" + _string(1) + r"\s*,\s*(\d+|\[\])\s*,\s*(\d+)\s*,\s*" + _string(5) +
+    r"\s*\.split\(\s*['\"]\|['\"]\s*\)",
+    re.DOTALL
+)
+PACKED_WORD_RE = re.compile(r'\b\w+\b')
+# What an unpacked packer's arguments are replaced with, so the next round does not unpack it again
+SPENT_PACKER = "}('',0,0,''.split('|')"
+
+STRING_ARRAY_RE = re.compile(
+    r"(?:var|let|const)\s+([A-Za-z_$][\w$]*)\s*=\s*\[\s*((?:" + _string(3) + r"\s*,?\s*)+)\]"
+)
+
+CONCAT_RE = re.compile(_string(1) + r"\s*\+\s*" + _string(3))
+ATOB_RE = re.compile(r"(?:window\.)?atob\(\s*" + _string(1) + r"\s*\)")
+UNQUOTE_RE = re.compile(r"(?:decodeURIComponent|unescape|decodeURI)\(\s*" + _string(1) + r"\s*\)")
+ESCAPE_RE = re.compile(r"\bescape\(\s*" + _string(1) + r"\s*\)")
+CHAR_CODES_RE = re.compile(r"String\.fromCharCode\(\s*((?:0x[0-9a-fA-F]+|\d+)(?:\s*,\s*(?:0x[0-9a-fA-F]+|\d+))*)\s*\)")
+REVERSE_RE = re.compile(_string(1) + r"""\.split\(\s*(['"])\3\s*\)\.reverse\(\)\.join\(\s*(['"])\4\s*\)""")
+
+JS_ESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|u\{[0-9a-fA-F]+\}|.)", re.DOTALL)
+SIMPLE_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+
+
+def js_unescape(body):
+    """Value of a JavaScript string literal's body"""
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == 'x' and len(escape) == 3:
+            return chr(int(escape[1:], 16))
+        if escape[0] == 'u' and len(escape) > 1:
+            return chr(int(escape[1:].strip('{}'), 16))
+        return SIMPLE_ESCAPES.get(escape, escape)
+    return JS_ESCAPE_RE.sub(replace, body) if '\\' in body else body
+
+
+def js_literal(value):
+    """A double-quoted JavaScript literal for value"""
+    return json.dumps(value)
+
+
+def _unbase(word, radix):
+    if radix <= 36:
+        return int(word, radix)
+    value = 0
+    for char in word:
+        value = value * radix + BASE62_ALPHABET.index(char)
+    return value
+
+
+def unpack_packer(match):
+    """Source of a p,a,c,k,e,d packed script from a PACKER_RE match"""
+    payload = js_unescape(match.group(2))
+    radix = 62 if match.group(3) == '[]' else int(match.group(3))
+    count = int(match.group(4))
+    symbols = js_unescape(match.group(6)).split('|')
+    if radix > len(BASE62_ALPHABET) or len(payload) > MAX_PACKED_BYTES:
+        return None
+
+    def replace(word_match):
+        word = word_match.group(0)
+        try:
+            index = _unbase(word, radix)
+        except ValueError:
+            return word
+        if index < len(symbols) and index < count and symbols[index]:
+            return symbols[index]
+        return word
+
+    return PACKED_WORD_RE.sub(replace, payload)
+
+
+def unpack_all(source):
+    """Source with the unpacked text of every packed script appended (packers may nest)"""
+    for _ in range(MAX_ROUNDS):
+        unpacked = []
+        for match in PACKER_RE.finditer(source):
+            try:
+                text = unpack_packer(match)
+            except (ValueError, IndexError):
+                text = None
+            if text:
+                unpacked.append(text)
+        if not unpacked:
+            break
+        # Unpacked code is appended for the scanners, packers inside it are unpacked next round
+        source = PACKER_RE.sub(SPENT_PACKER, source) + '\n' + '\n'.join(unpacked)
+    return source
+
+
+def inline_string_arrays(source):
+    """Replace name[index] lookups into literal string arrays with the literal"""
+    for array in STRING_ARRAY_RE.finditer(source):
+        name = array.group(1)
+        values = [js_unescape(item.group(2)) for item in STRING_RE.finditer(array.group(2))]
+        lookup = re.compile(re.escape(name) + r"\[\s*(0x[0-9a-fA-F]+|\d+)\s*\]")
+
+        def replace(match):
+            index = int(match.group(1), 0)
+            return js_literal(values[index]) if index < len(values) else match.group(0)
+
+        source = lookup.sub(replace, source)
+    return source
+
+
+def _decode_base64(value):
+    value = value.strip()
+    try:
+        decoded = base64.b64decode(value + '=' * (-len(value) % 4), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    try:
+        return decoded.decode('utf-8')
+    except UnicodeDecodeError:
+        return decoded.decode('latin-1')
+
+
+def fold_strings(source):
+    """Evaluate simple string expressions over literals, one pass"""
+    source = CONCAT_RE.sub(lambda m: js_literal(js_unescape(m.group(2)) + js_unescape(m.group(4))), source)
+
+    def atob(match):
+        decoded = _decode_base64(js_unescape(match.group(2)))
+        return js_literal(decoded) if decoded is not None else match.group(0)
+
+    source = ATOB_RE.sub(atob, source)
+    source = ESCAPE_RE.sub(lambda m: js_literal(js_unescape(m.group(2))), source)
+    source = UNQUOTE_RE.sub(lambda m: js_literal(unquote(js_unescape(m.group(2)))), source)
+    source = CHAR_CODES_RE.sub(
+        lambda m: js_literal(''.join(chr(int(code, 0)) for code in m.group(1).replace(' ', '').split(','))),
+        source
+    )
+    source = REVERSE_RE.sub(lambda m: js_literal(js_unescape(m.group(2))[::-1]), source)
+    return source
+
+
+def deobfuscate(html):
+    """html with packers unpacked, string arrays inlined and string expressions folded"""
+    source = inline_string_arrays(unpack_all(html))
+    for _ in range(MAX_ROUNDS):
+        folded = fold_strings(source)
+        if folded == source:
+            break
+        source = folded
+    return source
+
+
+def scan_obfuscated(html):
+    """First video URL in html once deobfuscated, or None (pure, for the parse pool)"""
+    source = deobfuscate(html)
+    if source == html:
+        return None
+    # Player configs often escape slashes, which the plain URL pattern does not expect
+    plain = source.replace('\\/', '/')
+    urls = scanners.find_media_urls(plain)
+    if urls:
+        return urls[0]
+    return scanners.scan_player_html(plain)
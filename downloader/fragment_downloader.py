@@ -2,36 +2,279 @@
 Fragment-based video downloading
 """
 
-import requests
 import os
 import base64
 import json
 import time
+import shutil
+import hashlib
 from urllib.parse import urljoin, urlparse
 import m3u8
+import logging
+import threading
+import itertools
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from .cancellation import CancellationToken, DownloadCancelled, abort_response
+from .muxer import create_output, mux_tracks, find_ffmpeg, ConcatOutput, WebVTTOutput, FFmpegRemuxOutput
+from .renditions import select_renditions, KIND_SUBTITLES
+from .variant_selector import VariantSelector, SELECTION_MODES, MODE_BEST, variant_quality_key
+from .host_health import HostHealthTracker
+from .transport import create_transport, TRANSPORT_AUTO, TRANSPORT_ERRORS
+from .playlist import iter_media_entries, iter_text_lines, resolve_time_range, clip_segments, SegmentTable
+from .integrity import SegmentIntegrityError, check_length, write_manifest, load_manifest, hash_range
+from .capture import get_capture_store, CaptureTransport, ReplayTransport
+from .profiling import create_profiler, NULL_PROFILER
+from .segment_workers import SegmentWorkerPool, WorkerTransferError
+from utils.config import Config
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Origin': 'https://abyss.to',
+    'Referer': 'https://abyss.to/',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin'
+}
+
+def segment_key(fragment):
+    """Segment store key of a fragment: its URL, plus the sub-range for byte-range segments"""
+    byte_range = fragment.get('byte_range')
+    if not byte_range:
+        return fragment['url']
+    offset, length = byte_range
+    return f"{fragment['url']}#bytes={offset}-{offset + length - 1}"
+
+class _FragmentFeed:
+    """Drains the fragment generator on its own thread and counts fragments discovered so far
+    
+    Reading the whole media playlist up front releases its connection at once,
+    while segment workers already start on the first entries. Fragments waiting
+    for a worker are kept in a SegmentTable and only become dicts when taken,
+    so a long playlist does not sit in memory as one dict per segment.
+    """
+    
+    def __init__(self, iterable):
+        self._table = SegmentTable()
+        self._alternates = {}
+        self._ready = threading.Condition()
+        self._taken = 0
+        self._finished = False
+        self._error = None
+        self.count = 0
+        self.first_item_at = None
+        thread = threading.Thread(target=self._produce, args=(iterable,), name='playlist', daemon=True)
+        thread.start()
+    
+    def _produce(self, iterable):
+        try:
+            for fragment in iterable:
+                if self.first_item_at is None:
+                    self.first_item_at = time.monotonic()
+                with self._ready:
+                    if fragment.get('alternates'):
+                        self._alternates[self.count] = fragment['alternates']
+                    self._table.append(fragment['duration'], fragment['url'], fragment.get('byte_range'))
+                    self.count += 1
+                    self._ready.notify()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._ready:
+                self._finished = True
+                self._ready.notify_all()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        with self._ready:
+            while self._taken >= self.count and not self._finished:
+                self._ready.wait()
+            if self._taken >= self.count:
+                # Every later next() call ends the same way
+                if self._error is not None:
+                    raise self._error
+                raise StopIteration
+            index = self._taken
+            self._taken += 1
+            fragment = {
+                'url': self._table.uri(index),
+                'duration': self._table.duration(index),
+                'alternates': self._alternates.pop(index, [])
+            }
+            byte_range = self._table.byte_range(index)
+        if byte_range:
+            fragment['byte_range'] = byte_range
+        return fragment
+
+
+class _FragmentPaths:
+    """Temp file paths of the fragments downloaded so far, derived from their index rather than stored"""
+    
+    __slots__ = ('temp_dir', 'count')
+    
+    def __init__(self, temp_dir):
+        self.temp_dir = temp_dir
+        self.count = 0
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("fragment index out of range")
+        return _fragment_temp_path(self.temp_dir, index + 1)
+    
+    def __iter__(self):
+        return (_fragment_temp_path(self.temp_dir, index) for index in range(1, self.count + 1))
+
+
+def _fragment_temp_path(temp_dir, index):
+    """Temp file of the index'th (1-based) fragment of a download"""
+    return os.path.join(temp_dir, f"fragment_{index}.ts")
+
+
+def _manifest_entry(url, alternates, duration, size, digest, byte_range):
+    entry = {'url': url, 'alternates': alternates, 'duration': duration, 'size': size, 'sha256': digest}
+    if byte_range:
+        entry['byte_range'] = list(byte_range)
+    return entry
 
 class FragmentDownloader:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Origin': 'https://abyss.to',
-            'Referer': 'https://abyss.to/',
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin'
-        })
+    def __init__(self, segment_store=None, transport=TRANSPORT_AUTO, concurrency=None, config=None):
+        """transport is a transport kind ('auto', 'http1', 'http2') or a ready transport such as ReplayTransport"""
+        # Performance settings come from the config's performance section, with
+        # per-host tuned profiles applied when a job starts on that host
+        self.config = config or Config()
+        # An explicit concurrency overrides the configured one for every host
+        self._concurrency_override = concurrency
+        self._apply_performance(self.config.performance())
+        # The pool leaves room for playlist and probe requests so segment workers
+        # never wait on each other for a connection
+        pool_size = (concurrency or self.config.max_concurrency()) + 4
+        # Segment worker processes build their own transport, so they need its kind
+        self._worker_transport = transport if isinstance(transport, str) else None
+        if isinstance(transport, str):
+            transport = create_transport(transport, DEFAULT_HEADERS, pool_size=pool_size)
+        # Opt-in traffic capture for offline replay (never of a replay itself)
+        capture_store = get_capture_store(self.config)
+        if capture_store is not None and not isinstance(transport, ReplayTransport):
+            transport = CaptureTransport(transport, capture_store)
+            # Captured segments have to pass through this process
+            self._worker_transport = None
+        self.transport = transport
         self.base_url = "https://abyss.to"
         self.api_url = "https://api.abyss.to"
+        # Wall-time budget in seconds for the 'deadline' quality mode
+        self.target_time = 600
+        self.remux = True
+        # Shared across jobs so a tripped host stays avoided until it recovers
+        self.host_health = HostHealthTracker()
+        # Optional SegmentStore consulted before any segment goes to the network
+        self.segment_store = segment_store
+        self.cancel_token = CancellationToken()
+        # Runs start-up work (info call, connection warm-up, mirror playlists) off the critical path
+        self._background = ThreadPoolExecutor(max_workers=4, thread_name_prefix='startup')
+        self._metrics_lock = threading.Lock()
+        self._job_started = None
+        self.last_metrics = {}
+        # Profiles of runs sharing a scope (a service job id) go to one directory
+        self.profile_scope = None
+        self._profiler = NULL_PROFILER
+        # Started on the first job with 'processes' set and kept warm for later jobs
+        self._segment_workers = None
+        self._segment_workers_lock = threading.Lock()
+
+    def _apply_performance(self, settings):
+        """Use a set of validated performance settings for requests outside a track's segments"""
+        self.performance = dict(settings, concurrency=self._concurrency_override or settings['concurrency'])
+        self.concurrency = self.performance['concurrency']
+        self.chunk_size = settings['chunk_size']
+        self.timeout = settings['timeout']
+        self.max_retries = settings['max_retries']
+
+    def _track_performance(self, url):
+        """Performance settings for the segments of one track, tuned for url's host
+
+        Tracks of one download may sit on different hosts and run at the same
+        time, so these are passed down with the track instead of applied.
+        """
+        settings = self.config.performance(urlparse(url).hostname)
+        return dict(settings, concurrency=self._concurrency_override or settings['concurrency'])
+
+    def _worker_pool(self, processes):
+        """Segment worker processes for the running job, or None to transfer on threads"""
+        if not processes or self._worker_transport is None:
+            return None
+        with self._segment_workers_lock:
+            workers = self._segment_workers
+            if workers is None or workers.processes != processes:
+                if workers is not None:
+                    workers.close()
+                # Enough transfer threads for the highest concurrency any host may use
+                threads = -(-(self._concurrency_override or self.config.max_concurrency()) // processes)
+                workers = self._segment_workers = SegmentWorkerPool(
+                    processes, threads, self._worker_transport, DEFAULT_HEADERS, self.config
+                )
+            return workers
+
+    def close_workers(self):
+        """Stop the segment worker processes, if any were started"""
+        with self._segment_workers_lock:
+            workers, self._segment_workers = self._segment_workers, None
+        if workers is not None:
+            workers.close()
+
+    def cancel_download(self):
+        """Cancel the running job, aborting in-flight segment reads"""
+        self.cancel_token.cancel()
+
+    def _open(self, url, cancel_token, headers=None, timeout=None):
+        """Open a streaming GET whose reads abort as soon as the token is cancelled"""
+        cancel_token.raise_if_cancelled()
+        try:
+            response = self.transport.get(url, stream=True, timeout=timeout or self.timeout, headers=headers)
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+
+        handle = cancel_token.register(lambda: abort_response(response))
+        try:
+            response.raise_for_status()
+        except Exception:
+            cancel_token.unregister(handle)
+            response.close()
+            raise
+        return response, handle
+
+    def _get(self, url, cancel_token):
+        """GET the whole body, abortable mid-transfer"""
+        response, handle = self._open(url, cancel_token)
+        try:
+            response.content
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            cancel_token.unregister(handle)
+        return response
     
-    def get_video_info(self, video_id):
+    def get_video_info(self, video_id, cancel_token=None):
         """Get video metadata and available qualities"""
+        if cancel_token is None:
+            cancel_token = CancellationToken()
         try:
             info_url = f"{self.api_url}/videos/{video_id}/info"
-            response = self.session.get(info_url)
-            response.raise_for_status()
+            response = self._get(info_url, cancel_token)
             
             data = response.json()
             if not data.get('success'):
@@ -39,62 +282,287 @@ class FragmentDownloader:
                 
             return data['data']
             
+        except DownloadCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Failed to get video info: {str(e)}")
     
-    def get_fragment_urls(self, video_id, quality='auto'):
-        """Get HLS playlist and fragment URLs"""
+    def get_fragment_urls(self, video_id, quality='auto', cancel_token=None, target_time=None,
+                          start_time=None, end_time=None, duration=None):
+        """Get HLS playlist and fragment URLs
+        
+        quality is 'auto'/'best' (highest quality), 'fastest' (quickest to finish
+        on the measured link), 'deadline' (best quality finishing within
+        target_time seconds) or a height such as '720p'. start_time, end_time
+        and duration (seconds) limit the result to the segments covering that clip.
+        """
+        if cancel_token is None:
+            cancel_token = CancellationToken()
+        fragments = self._iter_fragments(video_id, quality, cancel_token, target_time, wait_for_mirrors=True)
+        if start_time is not None or end_time is not None or duration is not None:
+            fragments = self._clip_fragments(fragments, *resolve_time_range(start_time, end_time, duration))
+        return list(fragments)
+    
+    def _report_variant_failure(self, fragments, variant_ready):
+        """Pass fragments through, failing variant_ready if the stream ends before a variant was resolved"""
         try:
-            # Get stream URL
-            stream_url = f"{self.api_url}/videos/{video_id}/stream"
-            response = self.session.get(stream_url)
-            response.raise_for_status()
+            yield from fragments
+        except BaseException as e:
+            if not variant_ready.done():
+                variant_ready.set_exception(e)
+            raise
+        finally:
+            if not variant_ready.done():
+                variant_ready.set_exception(ValueError("Media playlist stream ended before a variant was chosen"))
+    
+    def _clip_fragments(self, fragments, start, end):
+        """Fragments overlapping [start, end), closing the playlist stream once past end"""
+        with closing(fragments):
+            yield from clip_segments(fragments, start, end, duration_key='duration')
+    
+    def _resolve_variant(self, video_id, quality, cancel_token, target_time=None):
+        """(playlist_url, master_playlist, media_url, media_text) of the variant to download
+        
+        media_text is the media playlist when choosing the variant already fetched it, else None.
+        """
+        # Get stream URL
+        stream_url = f"{self.api_url}/videos/{video_id}/stream"
+        stream_response = self._get(stream_url, cancel_token)
+        
+        data = stream_response.json()
+        if not data.get('success'):
+            raise ValueError(f"Failed to get stream URL: {data.get('message', 'Unknown error')}")
+        
+        # Get master playlist
+        playlist_url = data['data']['url']
+        master_response = self._get(playlist_url, cancel_token)
+        
+        master_playlist = m3u8.loads(master_response.text)
+        
+        # Select quality
+        media_url, media_text = playlist_url, master_response.text
+        if master_playlist.is_variant:
+            media_url, media_text = self._select_variant(
+                master_playlist.playlists, playlist_url, quality, target_time, cancel_token
+            )
+        return playlist_url, master_playlist, media_url, media_text
+    
+    def _select_renditions(self, variant, audio_language=None, subtitles=False):
+        """Alternate audio (and subtitle) renditions that belong with the resolved variant"""
+        playlist_url, master_playlist, media_url, _ = variant
+        if not master_playlist.is_variant:
+            return []
+        selected = next((p for p in master_playlist.playlists if urljoin(playlist_url, p.uri) == media_url), None)
+        if selected is None:
+            return []
+        return select_renditions(master_playlist, selected, playlist_url, audio_language, subtitles)
+    
+    def _iter_fragments(self, video_id, quality, cancel_token, target_time=None, wait_for_mirrors=False,
+                        on_variant=None):
+        """Yield fragments as soon as media playlist entries arrive, so downloading can start early
+        
+        on_variant, if given, is called with the resolved variant (see
+        _resolve_variant) before its media playlist is read.
+        """
+        response = handle = None
+        try:
+            variant = self._resolve_variant(video_id, quality, cancel_token, target_time)
+            if on_variant is not None:
+                on_variant(variant)
+            playlist_url, master_playlist, media_url, media_text = variant
             
-            data = response.json()
-            if not data.get('success'):
-                raise ValueError(f"Failed to get stream URL: {data.get('message', 'Unknown error')}")
+            # Open connections to the media host while its playlist is still loading
+            self._warm(media_url)
             
-            # Get master playlist
-            playlist_url = data['data']['url']
-            response = self.session.get(playlist_url)
-            response.raise_for_status()
+            # Equivalent renditions on other hosts become per-segment failover targets
+            mirrors = None
+            mirrors_future = None
+            if master_playlist.is_variant:
+                mirror_urls = self._find_mirrors(master_playlist.playlists, playlist_url, media_url)
+                if mirror_urls:
+                    mirrors_future = self._background.submit(self._load_mirrors, mirror_urls, cancel_token)
             
-            master_playlist = m3u8.loads(response.text)
-            
-            # Select quality
-            selected_playlist = None
-            if quality == 'auto':
-                # Choose highest quality
-                selected_playlist = sorted(
-                    master_playlist.playlists,
-                    key=lambda p: p.stream_info.resolution[0] if p.stream_info.resolution else 0,
-                    reverse=True
-                )[0]
+            # Get fragment playlist (the probes may already have fetched it)
+            if media_text is not None:
+                segments = iter_media_entries(iter_text_lines(media_text))
             else:
-                # Find closest matching quality
-                target_height = int(quality.rstrip('p'))
-                selected_playlist = min(
-                    master_playlist.playlists,
-                    key=lambda p: abs(p.stream_info.resolution[1] - target_height) if p.stream_info.resolution else float('inf')
-                )
-            
-            # Get fragment playlist
-            response = self.session.get(selected_playlist.uri)
-            response.raise_for_status()
-            
-            fragment_playlist = m3u8.loads(response.text)
-            base_url = os.path.dirname(selected_playlist.uri) + '/'
+                try:
+                    response, handle = self._open(media_url, cancel_token)
+                    segments = iter_media_entries(response.iter_lines())
+                except DownloadCancelled:
+                    raise
+                except Exception as e:
+                    # Selected host is down: promote the first mirror that answered
+                    mirrors = mirrors_future.result() if mirrors_future else []
+                    if not mirrors:
+                        raise
+                    media_url, primary_segments = mirrors.pop(0)
+                    logger.warning(f"Media playlist failed ({e}), using mirror {media_url}")
+                    segments = iter(primary_segments)
             
-            return [{
-                'url': urljoin(base_url, segment.uri),
-                'duration': segment.duration
-            } for segment in fragment_playlist.segments]
+            for index, (duration, uri, byte_range) in enumerate(segments):
+                url = urljoin(media_url, uri)
+                if index == 0 and urlparse(url).netloc != urlparse(media_url).netloc:
+                    self._warm(url)
+                if mirrors is None and mirrors_future and (wait_for_mirrors or mirrors_future.done()):
+                    mirrors = mirrors_future.result()
+                
+                fragment = {
+                    'url': url,
+                    'duration': duration,
+                    'alternates': self._alternates(mirrors, index, duration, byte_range)
+                }
+                if byte_range:
+                    fragment['byte_range'] = byte_range
+                yield fragment
             
+        except DownloadCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Failed to get fragment URLs: {str(e)}")
+        finally:
+            if response is not None:
+                cancel_token.unregister(handle)
+                response.close()
     
-    def download_video(self, video_id, quality='auto', download_dir=None, progress_callback=None):
-        """Download video by ID"""
+    def _iter_rendition_fragments(self, rendition, cancel_token):
+        """Yield the fragments of an alternate rendition's media playlist as its entries arrive"""
+        response, handle = self._open(rendition.url, cancel_token)
+        try:
+            for duration, uri, byte_range in iter_media_entries(response.iter_lines()):
+                fragment = {'url': urljoin(rendition.url, uri), 'duration': duration, 'alternates': []}
+                if byte_range:
+                    fragment['byte_range'] = byte_range
+                yield fragment
+        finally:
+            cancel_token.unregister(handle)
+            response.close()
+    
+    def _warm(self, url):
+        """Pre-open connections to url's host in the background"""
+        self._background.submit(self.transport.warm, url, min(self.concurrency, 4))
+    
+    def _load_mirrors(self, mirror_urls, cancel_token):
+        """Fetch and parse mirror media playlists, returns [(url, SegmentTable)]"""
+        texts = self._fetch_media_playlists(mirror_urls, {}, cancel_token)
+        return [
+            (url, SegmentTable.parse(iter_text_lines(text), url))
+            for url, text in zip(mirror_urls, texts) if text is not None
+        ]
+    
+    def _alternates(self, mirrors, index, duration, byte_range=None):
+        """Mirror URLs for segment index whose duration (and byte range) match the primary segment"""
+        alternates = []
+        for _, mirror_segments in mirrors or ():
+            if index >= len(mirror_segments):
+                continue
+            if mirror_segments.byte_range(index) != byte_range:
+                continue
+            mirror_duration = mirror_segments.duration(index)
+            if duration is None or mirror_duration is None or abs(mirror_duration - duration) < 0.01:
+                alternates.append(mirror_segments.url(index))
+        return alternates
+    
+    def _find_mirrors(self, playlists, playlist_url, media_url):
+        """Variants with the same resolution and bitrate as the selected one, served by other hosts"""
+        selected = next((p for p in playlists if urljoin(playlist_url, p.uri) == media_url), None)
+        if selected is None:
+            return []
+        
+        pixels, bandwidth = variant_quality_key(selected)
+        primary_host = urlparse(media_url).netloc
+        mirrors = []
+        for playlist in playlists:
+            uri = urljoin(playlist_url, playlist.uri)
+            other_pixels, other_bandwidth = variant_quality_key(playlist)
+            if uri == media_url or urlparse(uri).netloc == primary_host or other_pixels != pixels:
+                continue
+            if abs(other_bandwidth - bandwidth) > 0.1 * max(bandwidth, 1):
+                continue
+            mirrors.append(uri)
+        return mirrors
+    
+    def _fetch_media_playlists(self, urls, known, cancel_token):
+        """Fetch media playlists in parallel, None for any that fail"""
+        def fetch(url):
+            if known.get(url) is not None:
+                return known[url]
+            try:
+                text = self._get(url, cancel_token).text
+                return text
+            except DownloadCancelled:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to fetch media playlist {url}: {e}")
+                return None
+        
+        if len(urls) == 1:
+            return [fetch(urls[0])]
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            return list(pool.map(fetch, urls))
+    
+    def _select_variant(self, playlists, playlist_url, quality, target_time, cancel_token):
+        """Choose a variant, returns (media playlist URL, media playlist text or None)"""
+        if quality == 'auto':
+            quality = MODE_BEST
+        
+        if quality in SELECTION_MODES:
+            def open_stream(url):
+                response, handle = self._open(url, cancel_token)
+                return response, lambda: cancel_token.unregister(handle)
+            
+            selector = VariantSelector(open_stream, lambda url: self._get(url, cancel_token).text)
+            media_url, media_text = selector.select(playlists, playlist_url, quality, target_time or self.target_time)
+            cancel_token.raise_if_cancelled()
+            return media_url, media_text
+        
+        # Find closest matching quality
+        target_height = int(quality.rstrip('p'))
+        selected_playlist = min(
+            playlists,
+            key=lambda p: abs(p.stream_info.resolution[1] - target_height) if p.stream_info.resolution else float('inf')
+        )
+        return urljoin(playlist_url, selected_playlist.uri), None
+    
+    def download_video(self, video_id, quality='auto', download_dir=None, progress_callback=None, cancel_token=None, remux=None, target_time=None,
+                       start_time=None, end_time=None, duration=None, audio_language=None, subtitles=False):
+        """Download video by ID
+        
+        start_time with end_time or duration (seconds) downloads only the
+        segments covering that clip; the clip starts and ends on segment
+        boundaries.
+        
+        When the variant has a separate (EXT-X-MEDIA) audio track, it is
+        downloaded alongside the video and muxed in: the group's default, or
+        audio_language if given. subtitles (True or a language code) adds a
+        subtitle track the same way.
+        """
+        profiler = create_profiler(self.config, 'download', video_id, self.profile_scope)
+        args = (video_id, quality, download_dir, progress_callback, cancel_token, remux, target_time,
+                start_time, end_time, duration, audio_language, subtitles)
+        if profiler is None:
+            return self._download_video(*args)
+        with profiler:
+            self._profiler = profiler
+            try:
+                return self._download_video(*args)
+            finally:
+                self._profiler = NULL_PROFILER
+
+    def _download_video(self, video_id, quality, download_dir, progress_callback, cancel_token, remux, target_time,
+                        start_time, end_time, duration, audio_language, subtitles):
+        clip = None
+        if start_time is not None or end_time is not None or duration is not None:
+            clip = resolve_time_range(start_time, end_time, duration)
+        if cancel_token is None:
+            cancel_token = CancellationToken()
+        if remux is None:
+            remux = self.remux
+        self.cancel_token = cancel_token
+        output = None
+        segment_pool = track_pool = tracks_token = None
+        self._apply_performance(self.config.performance())
+        
         try:
             if not download_dir:
                 download_dir = os.getcwd()
@@ -103,62 +571,549 @@ class FragmentDownloader:
             temp_dir = os.path.join(download_dir, f"temp_{video_id}")
             os.makedirs(temp_dir, exist_ok=True)
             
-            # Get video information
-            video_info = self.get_video_info(video_id)
-            output_filename = f"{video_id}_{int(time.time())}.mp4"
-            output_path = os.path.join(download_dir, output_filename)
+            self.last_metrics = {}
+            self._job_started = time.monotonic()
+            
+            # The info call only validates the video, so run it alongside playlist resolution
+            info_future = self._background.submit(self.get_video_info, video_id, cancel_token)
+            output_base = os.path.join(download_dir, f"{video_id}_{int(time.time())}")
             
-            # Get fragment URLs
-            fragments = self.get_fragment_urls(video_id, quality)
-            total_fragments = len(fragments)
+            # The variant is resolved on the feed thread, while the output stage starts here
+            variant_ready = Future()
+            segments = self._iter_fragments(video_id, quality, cancel_token, target_time,
+                                            on_variant=variant_ready.set_result)
+            segments = self._report_variant_failure(segments, variant_ready)
+            if clip:
+                segments = self._clip_fragments(segments, *clip)
+                self.last_metrics['clip'] = clip
+            # Fragments stream in from the media playlist while the first segments download
+            fragments = _FragmentFeed(segments)
+            # Segments are handed to the output stage as soon as they land, so the
+            # file is finished together with the last segment
+            output = create_output(output_base, remux)
+            
+            variant = variant_ready.result()
+            renditions = self._select_renditions(variant, audio_language, subtitles)
+            track_futures = []
+            if renditions:
+                self.last_metrics['renditions'] = [rendition.as_dict() for rendition in renditions]
+                # Every track draws on one segment pool, sized for the video's host
+                segment_pool = ThreadPoolExecutor(max_workers=self._track_performance(variant[2])['concurrency'],
+                                                  thread_name_prefix='segment')
+                track_pool = ThreadPoolExecutor(max_workers=len(renditions), thread_name_prefix='rendition')
+                tracks_token = cancel_token.child()
+                track_futures = [
+                    track_pool.submit(self._download_rendition, rendition, clip, temp_dir, segment_pool, tracks_token)
+                    for rendition in renditions
+                ]
             
             if progress_callback:
-                progress_callback(0, total_fragments)
+                progress_callback(0, fragments.count)
             
-            # Download fragments
-            fragment_paths = []
-            for i, fragment in enumerate(fragments, 1):
-                fragment_path = os.path.join(temp_dir, f"fragment_{i}.ts")
-                fragment_paths.append(fragment_path)
-                
-                response = self.session.get(fragment['url'], stream=True)
-                response.raise_for_status()
-                
-                with open(fragment_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                
-                if progress_callback:
-                    progress_callback(i, total_fragments)
+            fragment_paths = _FragmentPaths(temp_dir)
+            # Tuples rather than dicts, turned into manifest entries only when it is written
+            manifest_segments = []
+            with self._profiler.phase('segments'), \
+                    closing(self._fetch_fragments_in_order(fragments, temp_dir, cancel_token, segment_pool)) as results:
+                for i, (fragment, _, (digest, size)) in enumerate(results, 1):
+                    if info_future.done():
+                        info_future.result()
+                    for future in track_futures:
+                        if future.done():
+                            future.result()
+                    fragment_paths.count = i
+                    manifest_segments.append((
+                        fragment['url'], fragment.get('alternates', []), fragment['duration'],
+                        size, digest, fragment.get('byte_range')
+                    ))
+                    output = self._write_to_output(output, output_base, fragment_paths)
+                    
+                    if progress_callback:
+                        progress_callback(i, fragments.count)
+            
+            info_future.result()
+            if not fragment_paths:
+                if clip:
+                    raise ValueError(f"Start time {clip[0]}s is past the end of the video")
+                raise ValueError("Media playlist contains no segments")
+            tracks = [(rendition, future.result()) for rendition, future in zip(renditions, track_futures)]
             
-            # Combine fragments
-            with open(output_path, 'wb') as outfile:
-                for fragment_path in fragment_paths:
-                    with open(fragment_path, 'rb') as infile:
-                        outfile.write(infile.read())
+            self.last_metrics['time_to_first_segment_url'] = fragments.first_item_at - self._job_started
+            self.last_metrics['total_time'] = time.monotonic() - self._job_started
+            logger.info(f"Download metrics: {self.last_metrics}")
+            logger.info(f"Transport ({self.transport.name}) stats: {self.transport.stats.snapshot()}")
+            logger.info(f"Host health: {self.host_health.snapshot()}")
             
-            # Clean up temp files
-            for fragment_path in fragment_paths:
+            with self._profiler.phase('finalize'):
                 try:
-                    os.remove(fragment_path)
-                except:
-                    pass
-            try:
-                os.rmdir(temp_dir)
-            except:
-                pass
+                    output_path = output.close()
+                except RuntimeError as e:
+                    logger.warning(f"{e} - falling back to concatenation")
+                    output = self._fallback_to_concat(output, output_base, fragment_paths)
+                    output_path = output.close()
+                container = output.container
+                if tracks:
+                    output = None
+                    output_path, container = self._mux_renditions(output_path, output_base, temp_dir, tracks, remux)
+                write_manifest(output_path, video_id, container,
+                               (_manifest_entry(*segment) for segment in manifest_segments))
+            output = None
             
             return output_path
             
+        except DownloadCancelled:
+            if output:
+                output.abort()
+            raise
+            
         except Exception as e:
+            if output:
+                output.abort()
+            if cancel_token.cancelled:
+                raise DownloadCancelled("Download cancelled")
             raise Exception(f"Failed to download video: {str(e)}")
             
         finally:
+            self._job_started = None
+            if tracks_token is not None:
+                tracks_token.cancel()
+                track_pool.shutdown(wait=True)
+                segment_pool.shutdown(wait=True, cancel_futures=True)
+            
             # Ensure temp directory is cleaned up
             if 'temp_dir' in locals():
                 try:
-                    import shutil
                     shutil.rmtree(temp_dir, ignore_errors=True)
                 except:
                     pass
+    
+    def _fetch_fragments_in_order(self, fragments, temp_dir, cancel_token, pool=None):
+        """Fetch fragments on a worker pool, yielding (fragment, path, (sha256, size)) in playlist order
+        
+        pool is a segment pool shared with other tracks of the download; by
+        default the fetch gets a pool of its own.
+        """
+        # A job-scoped token lets a failed segment abort its siblings without
+        # touching the caller's token
+        job_token = cancel_token.child()
+        fragment_iter = iter(enumerate(fragments, 1))
+        try:
+            first = next(fragment_iter, None)
+        except BaseException:
+            job_token.cancel()
+            raise
+        if first is None:
+            job_token.cancel()
+            return
+        
+        # The segment host's tuned profile (if any) applies to the whole track
+        settings = self._track_performance(first[1]['url'])
+        concurrency = settings['concurrency']
+        range_request_size = settings['range_request_size']
+        fragment_iter = itertools.chain([first], fragment_iter)
+        workers = self._worker_pool(settings['processes'])
+        if workers is not None:
+            self.last_metrics['segment_processes'] = workers.processes
+        
+        # Finished segments may run ahead of the writer by up to buffer_budget bytes;
+        # until sizes are known the window is two segments per worker
+        window = concurrency * 2
+        pending = deque()
+        queued = 0
+        received_bytes = 0
+        received_count = 0
+        lookahead = []
+        
+        def next_unit():
+            """Next fetch unit: one fragment, or adjacent byte ranges of one file up to range_request_size"""
+            item = lookahead.pop() if lookahead else next(fragment_iter, None)
+            if item is None:
+                return None
+            unit = [item]
+            byte_range = item[1].get('byte_range')
+            if not byte_range or not range_request_size:
+                return unit
+            end = byte_range[0] + byte_range[1]
+            size = byte_range[1]
+            for candidate in fragment_iter:
+                candidate_range = candidate[1].get('byte_range')
+                if (candidate_range and candidate[1]['url'] == item[1]['url'] and candidate_range[0] == end
+                        and size + candidate_range[1] <= range_request_size):
+                    unit.append(candidate)
+                    end += candidate_range[1]
+                    size += candidate_range[1]
+                else:
+                    lookahead.append(candidate)
+                    break
+            return unit
+        
+        def submit_next():
+            nonlocal queued
+            unit = next_unit()
+            if unit is None:
+                return False
+            entries = [(fragment, _fragment_temp_path(temp_dir, i)) for i, fragment in unit]
+            pending.append((entries, pool.submit(self._fetch_unit, entries, job_token, workers, settings)))
+            queued += len(entries)
+            return True
+        
+        def has_room():
+            # Merged range requests hold many segments each, so keep every worker busy regardless
+            return queued < window or len(pending) < concurrency
+        
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='segment')
+        try:
+            while has_room() and submit_next():
+                pass
+            while pending:
+                entries, future = pending.popleft()
+                results = future.result()
+                queued -= len(entries)
+                for _, (_, size) in zip(entries, results):
+                    received_bytes += size
+                    received_count += 1
+                window = max(concurrency, settings['buffer_budget'] * received_count // max(received_bytes, 1))
+                while has_room() and submit_next():
+                    pass
+                for (fragment, fragment_path), result in zip(entries, results):
+                    yield fragment, fragment_path, result
+        except BaseException:
+            job_token.cancel()
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            job_token.cancel()
+            if own_pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+    
+    def _download_rendition(self, rendition, clip, temp_dir, pool, cancel_token):
+        """Fetch an alternate rendition on the shared segment pool into one file in temp_dir, returns its path"""
+        track_dir = os.path.join(temp_dir, rendition.label)
+        os.makedirs(track_dir, exist_ok=True)
+        segments = self._iter_rendition_fragments(rendition, cancel_token)
+        if clip:
+            segments = self._clip_fragments(segments, *clip)
+        output = None
+        try:
+            with closing(self._fetch_fragments_in_order(_FragmentFeed(segments), track_dir, cancel_token, pool)) as results:
+                for fragment, fragment_path, _ in results:
+                    if output is None:
+                        path = os.path.join(temp_dir, rendition.label + rendition.extension(fragment['url']))
+                        output = WebVTTOutput(path) if rendition.kind == KIND_SUBTITLES else ConcatOutput(path)
+                    output.write_segment(fragment_path)
+        except BaseException:
+            if output:
+                output.abort()
+            raise
+        if output is None:
+            raise ValueError(f"The {rendition.kind} rendition {rendition.url} has no segments")
+        logger.info(f"Downloaded {rendition.label} track")
+        return output.close()
+    
+    def _mux_renditions(self, video_path, output_base, temp_dir, tracks, remux):
+        """Mux the finished video with its [(rendition, path)] tracks, returns (output path, container)
+        
+        Without ffmpeg (or with remux off) the tracks are saved next to the video instead.
+        """
+        ffmpeg_path = find_ffmpeg() if remux else None
+        if ffmpeg_path:
+            # The video may already be the remuxed MP4, so mux into temp_dir and move over it
+            output_path = output_base + FFmpegRemuxOutput.extension
+            muxed_path = os.path.join(temp_dir, 'muxed' + FFmpegRemuxOutput.extension)
+            try:
+                mux_tracks(video_path, [(path, rendition.kind) for rendition, path in tracks], muxed_path, ffmpeg_path)
+                os.replace(muxed_path, output_path)
+                if video_path != output_path:
+                    os.remove(video_path)
+                return output_path, FFmpegRemuxOutput.container
+            except RuntimeError as e:
+                logger.warning(f"{e} - keeping the tracks as separate files")
+        else:
+            logger.info("Saving the alternate tracks as separate files next to the video")
+        for rendition, path in tracks:
+            target = f"{output_base}.{rendition.label}{os.path.splitext(path)[1]}"
+            shutil.move(path, target)
+            logger.info(f"Saved {rendition.kind} track to {target}")
+        return video_path, (FFmpegRemuxOutput if video_path.endswith(FFmpegRemuxOutput.extension) else ConcatOutput).container
+    
+    def _write_to_output(self, output, output_base, fragment_paths):
+        """Feed the newest segment to the output, switching to concatenation if ffmpeg dies"""
+        try:
+            output.write_segment(fragment_paths[-1])
+            return output
+        except RuntimeError as e:
+            logger.warning(f"{e} - falling back to concatenation")
+            return self._fallback_to_concat(output, output_base, fragment_paths)
+    
+    def _fallback_to_concat(self, output, output_base, fragment_paths):
+        """Replay every segment downloaded so far into a plain concatenated output"""
+        output.abort()
+        output = create_output(output_base, remux=False)
+        for fragment_path in fragment_paths:
+            output.write_segment(fragment_path)
+        return output
+    
+    def _fetch_unit(self, entries, cancel_token, workers=None, settings=None):
+        """Fetch a unit of [(fragment, path)], returns [(sha256, size)] in the same order
+        
+        With workers (a SegmentWorkerPool) the transfers run on its processes,
+        while retries and failover stay here. settings are the track's
+        performance settings, by default those of the job.
+        """
+        if entries[0][0].get('byte_range'):
+            return self._fetch_range_group(entries, cancel_token, workers, settings)
+        fragment, fragment_path = entries[0]
+        return [self._fetch_fragment(fragment, fragment_path, cancel_token, workers, settings)]
+    
+    def _fetch_range_group(self, entries, cancel_token, workers=None, settings=None):
+        """Fetch adjacent byte-range segments of one file with a single range request, split locally"""
+        if self.segment_store:
+            stored = [self.segment_store.materialize(segment_key(fragment), path) for fragment, path in entries]
+            if all(stored):
+                self._record_first_byte()
+                return [(entry[1], entry[2]) for entry in stored]
+        
+        # Only mirrors that serve every sub-range of the group can take over the whole request
+        first = entries[0][0]
+        alternates = [
+            url for url in first.get('alternates', [])
+            if all(url in fragment.get('alternates', []) for fragment, _ in entries[1:])
+        ]
+        parts = [(fragment['byte_range'], path) for fragment, path in entries]
+        results = self._with_retry(
+            [first['url']] + alternates, cancel_token,
+            lambda url: self._worker_transfer(workers, url, parts, cancel_token, settings) if workers is not None
+            else self._download_range(url, parts, cancel_token, settings),
+            settings
+        )
+        if self.segment_store:
+            for (fragment, path), (digest, size) in zip(entries, results):
+                self.segment_store.add(segment_key(fragment), path, digest, size)
+        return results
+    
+    def _fetch_fragment(self, fragment, fragment_path, cancel_token, workers=None, settings=None):
+        """Place a fragment at fragment_path, from the segment store when possible"""
+        url = fragment['url']
+        if self.segment_store:
+            entry = self.segment_store.materialize(url, fragment_path)
+            if entry:
+                self._record_first_byte()
+                return entry[1], entry[2]
+        
+        urls = [url] + fragment.get('alternates', [])
+        if workers is not None:
+            digest, size = self._with_retry(
+                urls, cancel_token,
+                lambda url: self._worker_transfer(workers, url, [(None, fragment_path)], cancel_token, settings)[0],
+                settings
+            )
+        else:
+            digest, size = self._download_fragment_with_retry(urls, fragment_path, cancel_token, settings=settings)
+        if self.segment_store:
+            self.segment_store.add(url, fragment_path, digest, size)
+        return digest, size
+    
+    def _download_fragment_with_retry(self, urls, fragment_path, cancel_token, expected_sha256=None, byte_range=None,
+                                      settings=None):
+        """Download a fragment (or one byte range of a file) from the healthiest of its mirror URLs"""
+        def attempt(url):
+            if byte_range:
+                digest, size = self._download_range(url, [(byte_range, fragment_path)], cancel_token, settings)[0]
+            else:
+                digest, size = self._download_fragment(url, fragment_path, cancel_token, settings)
+            if expected_sha256 and digest != expected_sha256:
+                raise SegmentIntegrityError(f"Segment hash mismatch for {url}")
+            return digest, size
+        
+        return self._with_retry(urls, cancel_token, attempt, settings)
+    
+    def _worker_transfer(self, workers, url, parts, cancel_token, settings=None):
+        """Run one transfer on a worker process with the track's chunk size and timeout"""
+        settings = settings or self.performance
+        results = workers.fetch(url, parts, (settings['chunk_size'], settings['timeout']), cancel_token)
+        # Workers do not report their first byte, so the first finished transfer stands in for it
+        self._record_first_byte()
+        return results
+    
+    def _with_retry(self, urls, cancel_token, attempt, settings=None):
+        """Run attempt(url) on the healthiest of urls, retrying failed transfers with failover and backoff"""
+        retry_delay = 1
+        attempts = (settings or self.performance)['max_retries'] * len(urls)
+        for attempt_number in range(attempts):
+            url = self.host_health.choose(urls)
+            start = time.monotonic()
+            try:
+                result = attempt(url)
+            except (SegmentIntegrityError, WorkerTransferError) + TRANSPORT_ERRORS as e:
+                self.host_health.record_failure(url)
+                if attempt_number == attempts - 1:
+                    raise
+                logger.warning(f"Segment attempt {attempt_number + 1} on {urlparse(url).netloc} failed ({e}), retrying")
+                # Fail over straight away when another host is usable, otherwise back off
+                if self.host_health.choose(urls, reserve=False) == url:
+                    cancel_token.sleep(retry_delay)
+                    retry_delay *= 2
+            except BaseException:
+                # Cancelled, or failed locally: says nothing about the host, but a
+                # reserved trial must not stay claimed
+                self.host_health.release(url)
+                raise
+            else:
+                self.host_health.record_success(url, time.monotonic() - start)
+                return result
+    
+    def _download_fragment(self, url, fragment_path, cancel_token, settings=None):
+        """Stream one fragment to disk, checking for cancellation between chunks"""
+        settings = settings or self.performance
+        # Never write through a hard link into the segment store
+        if os.path.exists(fragment_path):
+            os.remove(fragment_path)
+        
+        response, handle = self._open(url, cancel_token, timeout=settings['timeout'])
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(fragment_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=settings['chunk_size']):
+                    cancel_token.raise_if_cancelled()
+                    if chunk:
+                        if not size:
+                            self._record_first_byte()
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
+            check_length(response, size)
+            return hasher.hexdigest(), size
+        except DownloadCancelled:
+            raise
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            cancel_token.unregister(handle)
+            response.close()
+    
+    def _download_range(self, url, parts, cancel_token, settings=None):
+        """Fetch contiguous byte ranges of url with one request, writing each to its own file
+        
+        parts is [((offset, length), path)] in file order; returns [(sha256, size)].
+        """
+        settings = settings or self.performance
+        for _, path in parts:
+            if os.path.exists(path):
+                os.remove(path)
+        
+        start = parts[0][0][0]
+        end = parts[-1][0][0] + parts[-1][0][1] - 1
+        response, handle = self._open(url, cancel_token, headers={'Range': f"bytes={start}-{end}"},
+                                      timeout=settings['timeout'])
+        results = []
+        try:
+            chunks = response.iter_content(chunk_size=settings['chunk_size'])
+            buffer = b''
+            if response.status_code != 206:
+                # The server ignored the range and sent the whole file: skip to the first part
+                skipped = 0
+                while skipped < start:
+                    buffer = next(chunks, b'')
+                    if not buffer:
+                        break
+                    skipped += len(buffer)
+                buffer = buffer[len(buffer) - (skipped - start):] if skipped > start else b''
+            
+            for (offset, length), path in parts:
+                hasher = hashlib.sha256()
+                remaining = length
+                with open(path, 'wb') as f:
+                    while remaining:
+                        if not buffer:
+                            buffer = next(chunks, b'')
+                            cancel_token.raise_if_cancelled()
+                            if not buffer:
+                                raise SegmentIntegrityError(
+                                    f"Range response from {urlparse(url).netloc} ended {remaining} bytes short"
+                                )
+                            self._record_first_byte()
+                        piece, buffer = buffer[:remaining], buffer[remaining:]
+                        f.write(piece)
+                        hasher.update(piece)
+                        remaining -= len(piece)
+                results.append((hasher.hexdigest(), length))
+            return results
+        except DownloadCancelled:
+            raise
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            cancel_token.unregister(handle)
+            response.close()
+    
+    def _record_first_byte(self):
+        """Note the time to the first segment byte of the running job"""
+        started = self._job_started
+        if started is None or 'time_to_first_byte' in self.last_metrics:
+            return
+        with self._metrics_lock:
+            if 'time_to_first_byte' not in self.last_metrics:
+                self.last_metrics['time_to_first_byte'] = time.monotonic() - started
+    
+    def verify_output(self, output_path):
+        """Check an output against its segment manifest, returns indices of bad segments"""
+        manifest = load_manifest(output_path)
+        if manifest['container'] != 'mpegts':
+            raise ValueError("Only concatenated MPEG-TS outputs can be verified segment by segment")
+        
+        bad_segments = []
+        with open(output_path, 'rb') as f:
+            for index, segment in enumerate(manifest['segments']):
+                digest, size = hash_range(f, segment['offset'], segment['size'])
+                if size != segment['size'] or digest != segment['sha256']:
+                    bad_segments.append(index)
+        return bad_segments
+    
+    def repair_output(self, output_path, progress_callback=None, cancel_token=None):
+        """Re-fetch only the damaged segments of an output and patch them in place"""
+        if cancel_token is None:
+            cancel_token = CancellationToken()
+        self.cancel_token = cancel_token
+        
+        manifest = load_manifest(output_path)
+        bad_segments = self.verify_output(output_path)
+        if not bad_segments:
+            return 0
+        
+        logger.info(f"Repairing {len(bad_segments)} of {len(manifest['segments'])} segments in {output_path}")
+        if progress_callback:
+            progress_callback(0, len(bad_segments))
+        
+        temp_path = output_path + '.repair'
+        try:
+            with open(output_path, 'r+b') as f:
+                for done, index in enumerate(bad_segments, 1):
+                    segment = manifest['segments'][index]
+                    self._download_fragment_with_retry(
+                        [segment['url']] + segment.get('alternates', []), temp_path, cancel_token, segment['sha256'],
+                        byte_range=tuple(segment['byte_range']) if segment.get('byte_range') else None
+                    )
+                    
+                    f.seek(segment['offset'])
+                    with open(temp_path, 'rb') as infile:
+                        shutil.copyfileobj(infile, f)
+                    
+                    if progress_callback:
+                        progress_callback(done, len(bad_segments))
+                f.truncate(manifest['size'])
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            if cancel_token.cancelled:
+                raise DownloadCancelled("Repair cancelled")
+            raise Exception(f"Failed to repair video: {str(e)}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        return len(bad_segments)
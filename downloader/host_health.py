@@ -0,0 +1,157 @@
+"""
+Per-host health tracking with circuit breakers for segment failover
+"""
+
+import time
+import threading
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger('video_downloader')
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class HostHealth:
+    def __init__(self, host):
+        self.host = host
+        self.state = STATE_CLOSED
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.recovery_successes = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started_at = 0.0
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'latency_ewma': self.latency_ewma,
+            'error_rate': round(self.error_ewma, 3),
+            'samples': self.samples
+        }
+
+
+class HostHealthTracker:
+    """Opens a host's breaker on repeated errors and only closes it after sustained recovery"""
+
+    def __init__(self, alpha=0.2, failure_threshold=3, error_rate_threshold=0.5, min_samples=5,
+                 cooldown=15.0, recovery_successes=3, trial_timeout=60.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        # Successful trial requests needed before a recovered host gets traffic back
+        self.recovery_successes = recovery_successes
+        # Seconds after which an unanswered trial request no longer blocks the next one
+        self.trial_timeout = trial_timeout
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _get(self, host):
+        health = self._hosts.get(host)
+        if health is None:
+            health = self._hosts[host] = HostHealth(host)
+        return health
+
+    def record_success(self, url, latency):
+        with self._lock:
+            health = self._get(urlparse(url).netloc)
+            health.samples += 1
+            health.consecutive_failures = 0
+            health.error_ewma = (1 - self.alpha) * health.error_ewma
+            health.latency_ewma = latency if health.latency_ewma is None else \
+                self.alpha * latency + (1 - self.alpha) * health.latency_ewma
+
+            if health.state == STATE_HALF_OPEN:
+                health.trial_in_flight = False
+                health.recovery_successes += 1
+                if health.recovery_successes >= self.recovery_successes:
+                    health.state = STATE_CLOSED
+                    health.error_ewma = 0.0
+                    logger.info(f"Host {health.host} recovered, circuit closed")
+
+    def record_failure(self, url):
+        with self._lock:
+            health = self._get(urlparse(url).netloc)
+            health.samples += 1
+            health.consecutive_failures += 1
+            health.error_ewma = self.alpha + (1 - self.alpha) * health.error_ewma
+
+            if health.state == STATE_HALF_OPEN:
+                self._open(health)
+            elif health.state == STATE_CLOSED and (
+                    health.consecutive_failures >= self.failure_threshold or
+                    (health.samples >= self.min_samples and health.error_ewma >= self.error_rate_threshold)):
+                self._open(health)
+
+    def release(self, url):
+        """Give back a trial reserved by choose() when its request ended with neither success nor failure"""
+        with self._lock:
+            health = self._get(urlparse(url).netloc)
+            if health.state == STATE_HALF_OPEN:
+                health.trial_in_flight = False
+
+    def _open(self, health):
+        health.state = STATE_OPEN
+        health.opened_at = time.monotonic()
+        health.trial_in_flight = False
+        health.recovery_successes = 0
+        logger.warning(f"Host {health.host} unhealthy (error rate {health.error_ewma:.2f}), circuit opened")
+
+    def _available(self, health):
+        """Whether a request may go to this host right now (caller holds the lock)"""
+        if health.state == STATE_CLOSED:
+            return True
+        if health.state == STATE_OPEN and time.monotonic() - health.opened_at >= self.cooldown:
+            health.state = STATE_HALF_OPEN
+            health.trial_in_flight = False
+        if health.state == STATE_HALF_OPEN and health.trial_in_flight and \
+                time.monotonic() - health.trial_started_at >= self.trial_timeout:
+            health.trial_in_flight = False
+        if health.state == STATE_HALF_OPEN and not health.trial_in_flight:
+            return True
+        return False
+
+    def choose(self, urls, reserve=True):
+        """Pick the URL to try next; the first URL is the preferred host
+
+        With reserve=False a half-open host is only looked at, not claimed for
+        its single trial request.
+        """
+        with self._lock:
+            healthy = []
+            trials = []
+            for index, url in enumerate(urls):
+                health = self._get(urlparse(url).netloc)
+                if not self._available(health):
+                    continue
+                if health.state == STATE_CLOSED:
+                    healthy.append((index, url, health))
+                else:
+                    trials.append((index, url, health))
+
+            # A recovering host that ranks above every healthy one gets single trial
+            # requests; it only takes full traffic again once its breaker closes
+            if trials and (not healthy or trials[0][0] < healthy[0][0]):
+                if reserve:
+                    trials[0][2].trial_in_flight = True
+                    trials[0][2].trial_started_at = time.monotonic()
+                return trials[0][1]
+            if healthy:
+                # Keep the preferred host while it is healthy, otherwise the fastest mirror
+                if healthy[0][0] == 0:
+                    return urls[0]
+                return min(healthy, key=lambda h: h[2].latency_ewma or 0)[1]
+
+            # Every host is tripped: go to the one whose breaker opened first
+            return min(urls, key=lambda u: self._get(urlparse(u).netloc).opened_at)
+
+    def snapshot(self):
+        with self._lock:
+            return {host: health.snapshot() for host, health in self._hosts.items()}
@@ -0,0 +1,84 @@
+"""
+Segment integrity checks and the segment manifest saved next to each output
+"""
+
+import os
+import json
+import hashlib
+
+MANIFEST_SUFFIX = '.segments.json'
+MANIFEST_VERSION = 1
+
+
+class SegmentIntegrityError(Exception):
+    """A segment arrived truncated or with unexpected content"""
+
+
+def check_length(response, size):
+    """Compare the streamed byte count with Content-Length when it is meaningful"""
+    expected = response.headers.get('Content-Length')
+    encoding = response.headers.get('Content-Encoding', 'identity').lower()
+    if expected is None or encoding != 'identity':
+        return
+    try:
+        expected = int(expected)
+    except ValueError:
+        return
+    if size != expected:
+        raise SegmentIntegrityError(f"Segment truncated: got {size} of {expected} bytes")
+
+
+def manifest_path(output_path):
+    """Path of the manifest belonging to an output file"""
+    return output_path + MANIFEST_SUFFIX
+
+
+def write_manifest(output_path, video_id, container, segments):
+    """Save the segment manifest; segments are dicts with url, duration, size and sha256"""
+    offset = 0
+    entries = []
+    for segment in segments:
+        entry = dict(segment)
+        entry['offset'] = offset
+        offset += entry['size']
+        entries.append(entry)
+
+    data = {
+        'version': MANIFEST_VERSION,
+        'video_id': video_id,
+        'output': os.path.basename(output_path),
+        'container': container,
+        'size': offset,
+        'segments': entries
+    }
+    tmp_path = manifest_path(output_path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, manifest_path(output_path))
+    return manifest_path(output_path)
+
+
+def load_manifest(output_path):
+    """Load the manifest for an output file"""
+    path = manifest_path(output_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No segment manifest found for {output_path}")
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {data.get('version')}")
+    return data
+
+
+def hash_range(f, offset, size, chunk_size=1024 * 1024):
+    """SHA-256 and actual length of a byte range of an open file"""
+    hasher = hashlib.sha256()
+    f.seek(offset)
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        remaining -= len(chunk)
+    return hasher.hexdigest(), size - remaining
@@ -0,0 +1,193 @@
+"""
+Output stages that receive downloaded segments in playlist order
+"""
+
+import os
+import shutil
+import subprocess
+import logging
+
+try:
+    import ffmpeg
+    if not hasattr(ffmpeg, 'input'):
+        # A different package called "ffmpeg" is installed
+        ffmpeg = None
+except ImportError:
+    ffmpeg = None
+
+logger = logging.getLogger('video_downloader')
+
+
+def find_ffmpeg():
+    """Return the ffmpeg executable path or None if it is not installed"""
+    return shutil.which('ffmpeg')
+
+
+class ConcatOutput:
+    """Appends raw MPEG-TS segments to the output file as they arrive"""
+
+    extension = '.ts'
+    container = 'mpegts'
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._file = open(output_path, 'wb')
+        # Segments are appended by the kernel where possible, without passing through this process
+        self._copy_in_kernel = hasattr(os, 'copy_file_range')
+
+    def write_segment(self, segment_path):
+        """Append one finished segment"""
+        with open(segment_path, 'rb') as infile:
+            if self._copy_in_kernel:
+                self._file.flush()
+                try:
+                    while os.copy_file_range(infile.fileno(), self._file.fileno(), 64 * 1024 * 1024):
+                        pass
+                    return
+                except OSError as e:
+                    # Unsupported by the kernel or filesystem; both file offsets
+                    # stay consistent, so a plain copy picks up where it stopped
+                    logger.debug(f"copy_file_range unavailable ({e}), copying segments in Python")
+                    self._copy_in_kernel = False
+            shutil.copyfileobj(infile, self._file, 1024 * 1024)
+
+    def close(self):
+        """Finish the output and return its path"""
+        self._file.close()
+        return self.output_path
+
+    def abort(self):
+        """Stop writing and delete the incomplete output"""
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        _remove(self.output_path)
+
+
+class WebVTTOutput(ConcatOutput):
+    """Joins WebVTT subtitle segments, keeping only the first segment's header"""
+
+    extension = '.vtt'
+    container = 'webvtt'
+
+    def __init__(self, output_path):
+        super().__init__(output_path)
+        self._header_written = False
+
+    def write_segment(self, segment_path):
+        with open(segment_path, 'rb') as infile:
+            data = infile.read()
+        if self._header_written:
+            # The header block runs up to the first blank line
+            data = data.replace(b'\r\n', b'\n')
+            _, separator, cues = data.partition(b'\n\n')
+            data = cues if separator else b''
+            if data and not data.endswith(b'\n\n'):
+                data = data.rstrip(b'\n') + b'\n\n'
+        elif data:
+            self._header_written = True
+            if not data.endswith(b'\n\n'):
+                data = data.rstrip(b'\n') + b'\n\n'
+        self._file.write(data)
+
+
+class FFmpegRemuxOutput:
+    """Pipes segments into a stream-copy ffmpeg process producing an MP4"""
+
+    extension = '.mp4'
+    container = 'mp4'
+
+    def __init__(self, output_path, ffmpeg_path):
+        self.output_path = output_path
+        if ffmpeg is not None:
+            stream = (
+                ffmpeg
+                .input('pipe:0', format='mpegts')
+                .output(output_path, map='0', c='copy', format='mp4', **{'bsf:a': 'aac_adtstoasc'})
+                .global_args('-hide_banner', '-loglevel', 'error')
+                .overwrite_output()
+            )
+            self._process = stream.run_async(cmd=ffmpeg_path, pipe_stdin=True, pipe_stderr=True)
+        else:
+            args = [
+                ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+                '-f', 'mpegts', '-i', 'pipe:0',
+                '-map', '0', '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+                '-f', 'mp4', output_path
+            ]
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write_segment(self, segment_path):
+        """Feed one finished segment to ffmpeg's stdin"""
+        try:
+            with open(segment_path, 'rb') as infile:
+                shutil.copyfileobj(infile, self._process.stdin, 1024 * 1024)
+        except (BrokenPipeError, ValueError):
+            raise RuntimeError(f"ffmpeg exited early: {self._error_output()}")
+
+    def close(self):
+        """Close stdin, wait for ffmpeg to finalise the MP4 and return its path"""
+        _, stderr = self._process.communicate()
+        if self._process.returncode != 0:
+            raise RuntimeError(f"ffmpeg remux failed: {(stderr or b'').decode(errors='replace').strip()}")
+        return self.output_path
+
+    def abort(self):
+        """Kill ffmpeg and delete the incomplete output"""
+        try:
+            self._process.kill()
+            self._process.communicate()
+        except Exception:
+            pass
+        _remove(self.output_path)
+
+    def _error_output(self):
+        try:
+            self._process.kill()
+            _, stderr = self._process.communicate(timeout=5)
+            return (stderr or b'').decode(errors='replace').strip()
+        except Exception:
+            return 'unknown error'
+
+
+def create_output(output_base, remux=True):
+    """Create the output stage, falling back to concatenation without ffmpeg"""
+    if remux:
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path:
+            try:
+                return FFmpegRemuxOutput(output_base + FFmpegRemuxOutput.extension, ffmpeg_path)
+            except Exception as e:
+                logger.warning(f"Could not start ffmpeg, falling back to concatenation: {e}")
+        else:
+            logger.info("ffmpeg not found, saving concatenated MPEG-TS instead of MP4")
+    return ConcatOutput(output_base + ConcatOutput.extension)
+
+
+def mux_tracks(video_path, tracks, output_path, ffmpeg_path):
+    """Stream-copy a video file and alternate tracks into one MP4
+
+    tracks is [(path, kind)] with kind 'audio' or 'subtitles'; subtitles are
+    converted to MP4 text tracks. Raises RuntimeError when ffmpeg fails.
+    """
+    args = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y', '-i', video_path]
+    for path, _ in tracks:
+        args += ['-i', path]
+    args += ['-map', '0']
+    for index, (_, kind) in enumerate(tracks, 1):
+        args += ['-map', f"{index}:{'s' if kind == 'subtitles' else 'a'}"]
+    args += ['-c', 'copy', '-c:s', 'mov_text', '-bsf:a', 'aac_adtstoasc', '-f', 'mp4', output_path]
+    result = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        _remove(output_path)
+        raise RuntimeError(f"ffmpeg mux failed: {result.stderr.decode(errors='replace').strip()}")
+    return output_path
+
+
+def _remove(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove partial output {path}: {e}")
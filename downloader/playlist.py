@@ -0,0 +1,185 @@
+"""
+Lightweight HLS media playlist parsing
+"""
+
+import math
+from array import array
+from urllib.parse import urljoin
+
+
+def iter_media_entries(lines):
+    """Yield (duration, uri, byte_range) for each segment as playlist lines arrive
+
+    byte_range is (offset, length) for an EXT-X-BYTERANGE sub-range, else None.
+    A range without an offset continues where the previous range of the same
+    URI ended.
+    """
+    duration = None
+    byte_range = None
+    range_ends = {}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            try:
+                duration = float(line[8:].split(',', 1)[0])
+            except ValueError:
+                duration = None
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line[17:].partition('@')
+            try:
+                byte_range = (int(offset) if offset else None, int(length))
+            except ValueError:
+                byte_range = None
+        elif not line.startswith('#'):
+            if byte_range is not None:
+                offset, length = byte_range
+                if offset is None:
+                    offset = range_ends.get(line, 0)
+                range_ends[line] = offset + length
+                byte_range = (offset, length)
+            yield duration, line, byte_range
+            duration = None
+            byte_range = None
+
+
+def iter_text_lines(text):
+    """Lines of a playlist already in memory, without building a list or a copy of them"""
+    start = 0
+    find = text.find
+    while True:
+        end = find('\n', start)
+        if end < 0:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_media_segments(lines):
+    """Yield (duration, uri) for each segment as playlist lines arrive"""
+    for duration, uri, _ in iter_media_entries(lines):
+        yield duration, uri
+
+
+def resolve_time_range(start=None, end=None, duration=None):
+    """Normalise a clip request to (start, end) seconds; end None means to the end of the video"""
+    start = float(start or 0)
+    if duration is not None:
+        if end is not None:
+            raise ValueError("Give either an end time or a duration, not both")
+        end = start + float(duration)
+    end = float(end) if end is not None else None
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError(f"Invalid time range {start}-{end}")
+    return start, end
+
+
+class SegmentTable:
+    """Media playlist segments held in flat arrays rather than an object per segment
+
+    URIs are stored as written in the playlist, back to back in one buffer, and
+    only resolved against base_url when url() is called. Indexing and iteration
+    give the same (duration, uri, byte_range) entries as iter_media_entries.
+    """
+
+    __slots__ = ('base_url', 'total_duration', '_uris', '_uri_ends', '_durations',
+                 '_range_offsets', '_range_lengths')
+
+    def __init__(self, base_url=''):
+        self.base_url = base_url
+        self.total_duration = 0.0
+        self._uris = bytearray()
+        self._uri_ends = array('Q')
+        # NaN where the playlist gave no duration
+        self._durations = array('d')
+        # Allocated at the first byte range; -1 marks segments without one
+        self._range_offsets = None
+        self._range_lengths = None
+
+    @classmethod
+    def parse(cls, lines, base_url=''):
+        """Table of every segment in an iterable of playlist lines"""
+        table = cls(base_url)
+        append = table.append
+        for duration, uri, byte_range in iter_media_entries(lines):
+            append(duration, uri, byte_range)
+        return table
+
+    def append(self, duration, uri, byte_range=None):
+        self._uris += uri.encode('utf-8')
+        self._uri_ends.append(len(self._uris))
+        if duration is None:
+            self._durations.append(math.nan)
+        else:
+            self._durations.append(duration)
+            self.total_duration += duration
+        if byte_range is not None and self._range_offsets is None:
+            earlier = len(self._durations) - 1
+            self._range_offsets = array('q', [-1]) * earlier
+            self._range_lengths = array('q', [-1]) * earlier
+        if self._range_offsets is not None:
+            offset, length = byte_range or (-1, -1)
+            self._range_offsets.append(offset)
+            self._range_lengths.append(length)
+
+    def __len__(self):
+        return len(self._durations)
+
+    def _index(self, index):
+        if index < 0:
+            index += len(self._durations)
+        if not 0 <= index < len(self._durations):
+            raise IndexError("segment index out of range")
+        return index
+
+    def uri(self, index):
+        """Segment URI as written in the playlist"""
+        index = self._index(index)
+        start = self._uri_ends[index - 1] if index else 0
+        return self._uris[start:self._uri_ends[index]].decode('utf-8')
+
+    def url(self, index):
+        """Absolute segment URL"""
+        return urljoin(self.base_url, self.uri(index))
+
+    def duration(self, index):
+        duration = self._durations[self._index(index)]
+        return None if math.isnan(duration) else duration
+
+    def byte_range(self, index):
+        index = self._index(index)
+        if self._range_offsets is None or self._range_lengths[index] < 0:
+            return None
+        return self._range_offsets[index], self._range_lengths[index]
+
+    def __getitem__(self, index):
+        return self.duration(index), self.uri(index), self.byte_range(index)
+
+    def __iter__(self):
+        for index in range(len(self._durations)):
+            yield self[index]
+
+    def durations(self):
+        """Segment durations, None where the playlist gave none"""
+        return (None if math.isnan(duration) else duration for duration in self._durations)
+
+
+def clip_segments(segments, start, end=None, duration_key=None):
+    """Yield the items of a segment stream that overlap [start, end), stopping once past end
+
+    The stream is not read beyond the first segment starting at or after end,
+    so a streamed media playlist can be closed early.
+    """
+    position = 0.0
+    for item in segments:
+        duration = (item[duration_key] if duration_key is not None else item[0]) or 0.0
+        segment_start, position = position, position + duration
+        if end is not None and segment_start >= end:
+            return
+        if position > start or (duration == 0 and segment_start >= start):
+            yield item
@@ -0,0 +1,75 @@
+"""
+Parse time and memory of media playlist representations on a synthetic playlist
+
+Compares the m3u8 package's object model (plus the url/duration dicts the
+downloader used to build from it) with SegmentTable and with streaming the
+entries without keeping them.
+"""
+
+import gc
+import time
+import tracemalloc
+from urllib.parse import urljoin
+
+import m3u8
+
+from .bench_server import BenchmarkServer
+from .playlist import SegmentTable, iter_media_entries, iter_text_lines
+
+BASE_URL = 'https://cdn.example.com/hls/video/media.m3u8'
+
+
+def synthetic_playlist(segments, segment_duration=2.0):
+    """Media playlist text with segments entries, as served by the benchmark server"""
+    return BenchmarkServer(segments=segments, segment_duration=segment_duration).media_playlist()
+
+
+def _parse_m3u8(text):
+    playlist = m3u8.loads(text)
+    return playlist, [{'url': urljoin(BASE_URL, s.uri), 'duration': s.duration} for s in playlist.segments]
+
+
+def _parse_table(text):
+    return SegmentTable.parse(iter_text_lines(text), BASE_URL)
+
+
+def _stream_entries(text):
+    count = 0
+    for _ in iter_media_entries(iter_text_lines(text)):
+        count += 1
+    return count
+
+
+PARSERS = (
+    ('m3u8 objects', _parse_m3u8),
+    ('segment table', _parse_table),
+    ('streamed entries', _stream_entries),
+)
+
+
+def measure(parse, text):
+    """(seconds, peak bytes, retained bytes) of one parse
+
+    Time is taken on an untraced run since tracemalloc slows allocation down.
+    """
+    gc.collect()
+    started = time.perf_counter()
+    result = parse(text)
+    elapsed = time.perf_counter() - started
+    del result
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        result = parse(text)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return elapsed, peak, retained
+
+
+def run(segments=50000, segment_duration=2.0):
+    """[(name, seconds, peak bytes, retained bytes)] for each representation"""
+    text = synthetic_playlist(segments, segment_duration)
+    return [(name,) + measure(parse, text) for name, parse in PARSERS]
@@ -0,0 +1,240 @@
+"""
+Opt-in profiling of extraction and download runs
+
+With the config's profiling section enabled, each run writes to its own
+directory:
+
+    cpu.pstats          cProfile of the calling thread (snakeviz, gprof2dot, pstats);
+                        missing for a run that overlapped another on Python 3.12+
+    samples.folded      stacks of every thread sampled at a fixed interval, in the
+                        collapsed format read by flamegraph.pl, speedscope and inferno
+    threads.txt         samples per thread and their hottest frames
+    NN-<phase>.tracemalloc  tracemalloc snapshot at the end of each phase
+    memory.txt          traced memory per phase and the top allocation growth
+
+When profiling is off the entry points only read the setting and call
+straight through; phases are a shared no-op context manager.
+"""
+
+import os
+import re
+import sys
+import time
+import cProfile
+import threading
+import tracemalloc
+import logging
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "profiles")
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Frames kept per tracemalloc allocation: the per-line statistics only need the top one,
+# and each extra frame makes every allocation slower to trace
+TRACEMALLOC_FRAMES = 1
+TOP_ALLOCATIONS = 15
+
+# tracemalloc is process-wide while runs overlap (service workers), so the
+# runs share it: the first one starts tracing and the last one stops it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _acquire_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def _pool_name(name):
+    """Thread name without its worker number, so a pool's threads share one flame graph root"""
+    return re.sub(r'[_-]\d+$', '', name).replace(';', ':')
+
+
+class ThreadSampler(threading.Thread):
+    """Samples the stack of every other thread at a fixed interval"""
+
+    def __init__(self, interval, current_phase):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.current_phase = current_phase
+        self.stacks = Counter()
+        self.thread_samples = Counter()
+        self.thread_leaves = defaultdict(Counter)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            phase = self.current_phase()
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                name = names.get(ident, str(ident))
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self.stacks[';'.join([phase, _pool_name(name)] + stack[::-1])] += 1
+                self.thread_samples[name] += 1
+                self.thread_leaves[name][stack[0]] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, directory):
+        with open(os.path.join(directory, 'samples.folded'), 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(directory, 'threads.txt'), 'w') as f:
+            for name, count in self.thread_samples.most_common():
+                f.write(f"{name}: {count} samples ({count * self.interval:.2f}s)\n")
+                for leaf, leaf_count in self.thread_leaves[name].most_common(5):
+                    f.write(f"    {leaf_count:6d}  {leaf}\n")
+
+
+class RunProfiler:
+    """CPU profile, per-phase tracemalloc snapshots and thread sampling for one run"""
+
+    def __init__(self, directory, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.phase_name = 'run'
+        self._snapshots = 0
+        self._previous_snapshot = None
+        self._memory_report = []
+        self._profile = None
+        self._sampler = None
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Python 3.12+ allows one cProfile per process, so overlapping runs
+        # after the first go without a CPU profile rather than failing
+        self._profile = cProfile.Profile()
+        try:
+            self._profile.enable()
+        except ValueError as e:
+            logger.warning(f"No CPU profile for {self.directory}: {e}")
+            self._profile = None
+        tracing = False
+        try:
+            _acquire_tracing()
+            tracing = True
+            self._sampler = ThreadSampler(self.sample_interval, lambda: self.phase_name)
+            self._sampler.start()
+        except BaseException:
+            if self._sampler is not None and self._sampler.is_alive():
+                self._sampler.stop()
+            if tracing:
+                _release_tracing()
+            if self._profile is not None:
+                self._profile.disable()
+            raise
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profile is not None:
+            self._profile.disable()
+        self._sampler.stop()
+        try:
+            self._snapshot('end')
+            if self._profile is not None:
+                self._profile.dump_stats(os.path.join(self.directory, 'cpu.pstats'))
+            self._sampler.write(self.directory)
+            with open(os.path.join(self.directory, 'memory.txt'), 'w') as f:
+                f.write('\n'.join(self._memory_report) + '\n')
+        finally:
+            _release_tracing()
+        logger.info(f"Profile of {time.monotonic() - self._started:.2f}s run written to {self.directory}")
+
+    @contextmanager
+    def phase(self, name):
+        """Label samples with name while inside, and snapshot memory when it ends"""
+        previous, self.phase_name = self.phase_name, name
+        try:
+            yield
+        finally:
+            self._snapshot(name)
+            self.phase_name = previous
+
+    def _snapshot(self, name):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        self._snapshots += 1
+        snapshot.dump(os.path.join(self.directory, f"{self._snapshots:02d}-{name}.tracemalloc"))
+
+        current, peak = tracemalloc.get_traced_memory()
+        self._memory_report.append(
+            f"== {name}: traced {current / 1024 ** 2:.1f} MiB, peak {peak / 1024 ** 2:.1f} MiB"
+        )
+        if self._previous_snapshot is None:
+            top = [(stat.traceback, stat.size, stat.size) for stat in snapshot.statistics('lineno')]
+        else:
+            top = [(stat.traceback, stat.size_diff, stat.size)
+                   for stat in snapshot.compare_to(self._previous_snapshot, 'lineno')]
+            top.sort(key=lambda entry: entry[1], reverse=True)
+        for traceback, growth, size in top[:TOP_ALLOCATIONS]:
+            self._memory_report.append(f"  {growth / 1024:+10.1f} KiB  (now {size / 1024:.1f} KiB)  {traceback}")
+        self._previous_snapshot = snapshot
+
+
+class NullProfiler:
+    """Stands in for RunProfiler when profiling is off"""
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+NULL_PROFILER = NullProfiler()
+
+
+def create_profiler(config, kind, label, scope=None):
+    """RunProfiler for a run of kind ('extract' or 'download'), or None when profiling is off
+
+    Runs with the same scope (e.g. a service job id) share a parent directory.
+    """
+    settings = config.get('profiling') or {}
+    if not settings.get('enabled'):
+        return None
+    root = settings.get('directory') or DEFAULT_PROFILE_DIR
+    safe_label = re.sub(r'[^\w.-]+', '_', str(label))[:60]
+    if scope:
+        directory = os.path.join(root, str(scope), f"{kind}-{safe_label}")
+    else:
+        directory = os.path.join(root, f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{safe_label}")
+    return RunProfiler(directory, settings.get('sample_interval') or DEFAULT_SAMPLE_INTERVAL)
+
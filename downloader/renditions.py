@@ -0,0 +1,77 @@
+"""
+Alternate audio and subtitle renditions (EXT-X-MEDIA) of an HLS variant
+"""
+
+import os
+from urllib.parse import urljoin, urlparse
+
+KIND_AUDIO = 'audio'
+KIND_SUBTITLES = 'subtitles'
+
+# File extension of a joined rendition when its segment URIs do not give one
+DEFAULT_EXTENSIONS = {KIND_AUDIO: '.ts', KIND_SUBTITLES: '.vtt'}
+
+
+class Rendition:
+    """One alternate track to download alongside the video"""
+
+    def __init__(self, kind, url, language=None, name=None):
+        self.kind = kind
+        self.url = url
+        self.language = language
+        self.name = name
+
+    @property
+    def label(self):
+        """Short name for file names and logs, e.g. 'audio-en'"""
+        return f"{self.kind}-{self.language or self.name or 'default'}".replace(os.sep, '_').replace(' ', '_')
+
+    def extension(self, segment_url):
+        """Extension for the joined track, taken from a segment URL"""
+        extension = os.path.splitext(urlparse(segment_url).path)[1].lower()
+        if self.kind == KIND_SUBTITLES:
+            return DEFAULT_EXTENSIONS[KIND_SUBTITLES]
+        return extension if extension in ('.ts', '.aac', '.ac3', '.ec3', '.mp3') else DEFAULT_EXTENSIONS[self.kind]
+
+    def as_dict(self):
+        return {'kind': self.kind, 'url': self.url, 'language': self.language, 'name': self.name}
+
+    def __repr__(self):
+        return f"Rendition({self.kind!r}, {self.url!r}, language={self.language!r})"
+
+
+def _pick(media, media_type, group_id, language=None):
+    """The group's rendition for language, else its DEFAULT, AUTOSELECT or first one"""
+    if not group_id:
+        return None
+    candidates = [m for m in media if m.type == media_type and m.group_id == group_id]
+    if not candidates:
+        return None
+    chosen = None
+    if language:
+        wanted = language.lower()
+        chosen = next((m for m in candidates if (m.language or '').lower().startswith(wanted)), None)
+    if chosen is None:
+        chosen = (next((m for m in candidates if m.default == 'YES'), None)
+                  or next((m for m in candidates if m.autoselect == 'YES'), None)
+                  or candidates[0])
+    # A rendition without a URI is carried inside the variant's own stream
+    return chosen if chosen.uri else None
+
+
+def select_renditions(master_playlist, variant, playlist_url, audio_language=None, subtitles=False):
+    """Renditions to fetch with variant: its audio group's track and, if asked, a subtitle track
+
+    subtitles is False for none, True for the group's default, or a language code.
+    """
+    renditions = []
+    audio = _pick(master_playlist.media, 'AUDIO', variant.stream_info.audio, audio_language)
+    if audio is not None:
+        renditions.append(Rendition(KIND_AUDIO, urljoin(playlist_url, audio.uri), audio.language, audio.name))
+    if subtitles:
+        language = subtitles if isinstance(subtitles, str) else None
+        subtitle = _pick(master_playlist.media, 'SUBTITLES', variant.stream_info.subtitles, language)
+        if subtitle is not None:
+            renditions.append(Rendition(KIND_SUBTITLES, urljoin(playlist_url, subtitle.uri),
+                                        subtitle.language, subtitle.name))
+    return renditions
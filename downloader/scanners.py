@@ -0,0 +1,254 @@
+"""
+Pure HTML/JS scanners used to find player and media URLs
+
+Everything here is a module-level function of its inputs only, so it can run
+in a worker process as well as inline.
+"""
+
+import re
+import base64
+from urllib.parse import unquote
+from bs4 import BeautifulSoup
+import json5
+
+MEDIA_URL_RE = re.compile(r'https?://[^\s<>"\']+?\.(?:mp4|m3u8)[^\s<>"\']*')
+VIDEO_EXTENSION_RE = re.compile(r'\.(?:mp4|m3u8)(?:\?[^&]*)?$', re.IGNORECASE)
+
+# Common script and library URLs that look like media but are not
+EXCLUDE_RE = re.compile('|'.join([
+    r'jwplayer\.js',
+    r'player\.js',
+    r'\.min\.js',
+    r'/assets/',
+    r'/static/',
+    r'/lib/',
+    r'/cdn-cgi/',
+    r'/wp-content/plugins/',
+    r'/wp-includes/'
+]), re.IGNORECASE)
+
+JSON_SOURCE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+    r'sources?\s*[:=]\s*(\[{[^}]+}\])',
+    r'playbackConfig\s*[:=]\s*({[^}]+})',
+    r'playerConfig\s*[:=]\s*({[^}]+})'
+]]
+
+PLAYER_CONFIG_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+    r'file\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
+    r'source\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
+    r'src\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
+    r'["\']?url["\']?\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']'
+]]
+
+ENCODED_PATTERNS = [(re.compile(p), encoding) for p, encoding in [
+    (r'atob\(["\']([^"\']+)["\']\)', 'base64'),
+    (r'decodeURIComponent\(escape\(atob\(["\']([^"\']+)["\']\)\)\)', 'base64'),
+    (r'decodeURIComponent\(["\']([^"\']+)["\']\)', 'uri'),
+    (r'unescape\(["\']([^"\']+)["\']\)', 'uri')
+]]
+
+SCRIPT_VARIABLE_PATTERNS = [re.compile(p) for p in [
+    r'var\s+videoUrl\s*=\s*["\']([^"\']+)["\']',
+    r'var\s+videoSrc\s*=\s*["\']([^"\']+)["\']',
+    r'var\s+videoFile\s*=\s*["\']([^"\']+)["\']',
+    r'var\s+mp4Url\s*=\s*["\']([^"\']+)["\']'
+]]
+
+NONCE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+    r'nonce["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'_wpnonce["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'<input[^>]+?name=["\']\w*nonce\w*["\']\s+value=["\']([\w-]+)["\']'
+]]
+
+PLAYER_CLASS_TERMS = ('player', 'video-container', 'video-wrapper')
+
+# Streaming scan of a page: complete opening tags that decide the extraction on their own
+PLAYER_TAG_RE = re.compile(r'<(?:iframe|div)\b[^>]*>', re.IGNORECASE)
+MEDIA_TAG_RE = re.compile(r'<(?:video|source)\b[^>]*?\ssrc=["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+TAG_CLASS_RE = re.compile(r'\sclass=["\']([^"\']*)["\']', re.IGNORECASE)
+TAG_SOURCE_RE = re.compile(r'\s((?:data-[\w-]*(?:src|url|source)[\w-]*)|src)=["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def is_valid_video_url(url):
+    """Check if URL points to a valid video file"""
+    if not url or not isinstance(url, str):
+        return False
+
+    if not url.startswith(('http://', 'https://')):
+        return False
+
+    # Check extensions and paths
+    if not VIDEO_EXTENSION_RE.search(url):
+        return False
+
+    return not EXCLUDE_RE.search(url)
+
+
+def find_media_urls(text):
+    """Valid media URLs appearing literally in text"""
+    return [url for url in MEDIA_URL_RE.findall(text) if is_valid_video_url(url)]
+
+
+def extract_from_json_sources(html):
+    """Extract video URL from JSON sources in page"""
+    for pattern in JSON_SOURCE_PATTERNS:
+        for match in pattern.finditer(html):
+            try:
+                data = json5.loads(match.group(1))
+                if isinstance(data, list):
+                    for item in data:
+                        if isinstance(item, dict):
+                            url = item.get('file') or item.get('src') or item.get('url')
+                            if url and is_valid_video_url(url):
+                                return url
+                elif isinstance(data, dict):
+                    url = data.get('file') or data.get('videoUrl') or data.get('url')
+                    if url and is_valid_video_url(url):
+                        return url
+            except Exception:
+                continue
+    return None
+
+
+def extract_from_player_config(html):
+    """Extract video URL from player configuration"""
+    for pattern in PLAYER_CONFIG_PATTERNS:
+        for match in pattern.finditer(html):
+            url = match.group(1)
+            if is_valid_video_url(url):
+                return url
+    return None
+
+
+def extract_from_encoded_sources(html):
+    """Extract video URL from encoded/encrypted sources"""
+    for pattern, encoding in ENCODED_PATTERNS:
+        for match in pattern.finditer(html):
+            try:
+                encoded = match.group(1)
+                if encoding == 'base64':
+                    decoded = base64.b64decode(encoded).decode('utf-8')
+                else:  # uri
+                    decoded = unquote(encoded)
+
+                # Look for URLs in decoded content
+                urls = find_media_urls(decoded)
+                if urls:
+                    return urls[0]
+
+                # Try parsing as JSON
+                try:
+                    data = json5.loads(decoded)
+                    if isinstance(data, dict):
+                        url = data.get('file') or data.get('url') or data.get('src')
+                        if url and is_valid_video_url(url):
+                            return url
+                except Exception:
+                    pass
+            except Exception:
+                continue
+    return None
+
+
+def extract_from_script_variables(html):
+    """Extract video URL from JavaScript variables"""
+    for pattern in SCRIPT_VARIABLE_PATTERNS:
+        for match in pattern.finditer(html):
+            url = match.group(1)
+            if is_valid_video_url(url):
+                return url
+    return None
+
+
+def scan_player_html(html):
+    """Run every player-page scanner in order, returns the first video URL found"""
+    return (
+        extract_from_json_sources(html) or
+        extract_from_player_config(html) or
+        extract_from_encoded_sources(html) or
+        extract_from_script_variables(html)
+    )
+
+
+def extract_nonce(html):
+    """Extract WordPress nonce from page"""
+    for pattern in NONCE_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            return match.group(1)
+    return ''
+
+
+def extract_post_id(soup):
+    """Extract WordPress post ID from page"""
+    for element in soup.find_all(['article', 'div']):
+        classes = element.get('class', [])
+        if any('post-' in cls for cls in classes):
+            for cls in classes:
+                if cls.startswith('post-'):
+                    return cls.replace('post-', '')
+    return None
+
+
+def find_player_urls(soup):
+    """Player URLs from iframes and player divs, in page order"""
+    player_elements = soup.find_all(
+        ['iframe', 'div'],
+        class_=lambda x: x and any(term in str(x).lower() for term in PLAYER_CLASS_TERMS)
+    )
+
+    player_urls = []
+    for player_elem in player_elements:
+        player_url = player_elem.get('src') if player_elem.name == 'iframe' else None
+
+        if not player_url and player_elem.name == 'div':
+            # Try to find player URL in div's data attributes
+            for attr in player_elem.attrs:
+                if attr.startswith('data-') and any(x in attr for x in ['src', 'url', 'source']):
+                    player_url = player_elem[attr]
+                    break
+
+        if player_url:
+            player_urls.append(player_url)
+    return player_urls
+
+
+def scan_page_window(text):
+    """Earliest high-confidence hit in a window of a page being streamed
+
+    Returns ('player', url) for an iframe or div with a player class and a
+    source attribute, ('media', url) for a video or source tag pointing at a
+    valid media URL, or None. Matches the rules of find_player_urls, so an
+    early player is the one the full parse would have tried first.
+    """
+    hits = []
+    for tag in PLAYER_TAG_RE.finditer(text):
+        classes = TAG_CLASS_RE.search(tag.group(0))
+        if not classes or not any(term in classes.group(1).lower() for term in PLAYER_CLASS_TERMS):
+            continue
+        is_iframe = tag.group(0)[1:7].lower() == 'iframe'
+        for source in TAG_SOURCE_RE.finditer(tag.group(0)):
+            if (source.group(1).lower() == 'src') == is_iframe:
+                hits.append((tag.start(), 'player', source.group(2)))
+                break
+        if hits:
+            break
+    for tag in MEDIA_TAG_RE.finditer(text):
+        if is_valid_video_url(tag.group(1)):
+            hits.append((tag.start(), 'media', tag.group(1)))
+            break
+    if not hits:
+        return None
+    _, kind, url = min(hits)
+    return kind, url
+
+
+def parse_page(html):
+    """Parse a web page once, returning everything the static extraction needs"""
+    soup = BeautifulSoup(html, 'html.parser')
+    post_id = extract_post_id(soup)
+    return {
+        'player_urls': find_player_urls(soup),
+        'post_id': post_id,
+        'nonce': extract_nonce(html) if post_id else ''
+    }
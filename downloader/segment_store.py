@@ -0,0 +1,215 @@
+"""
+Local segment store shared by all download jobs on this host
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "segments")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Query parameters that change between sessions without changing the segment bytes
+VOLATILE_PARAMS = ('token', 'expires', 'signature', 'sig')
+
+# Linux FICLONE ioctl (btrfs, xfs, ...)
+FICLONE = 0x40049409
+HASH_CHUNK = 1024 * 1024
+
+
+def normalize_segment_url(url, ignore_params=VOLATILE_PARAMS):
+    """Canonical form of a segment URL used as the store key"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in ignore_params
+    )
+    # The fragment is kept: byte-range segments of one file are told apart by a #bytes= suffix
+    return urlunsplit((parts.scheme.lower(), host, parts.path, urlencode(query), parts.fragment))
+
+
+def link_or_copy(source, dest):
+    """Materialise source at dest with a hard link, a reflink, or a copy as last resort"""
+    try:
+        os.link(source, dest)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        pass
+
+    shutil.copyfile(source, dest)
+    return 'copy'
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class SegmentStore:
+    def __init__(self, root=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES, ignore_params=VOLATILE_PARAMS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ignore_params = tuple(p.lower() for p in ignore_params)
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # sqlite serialises concurrent jobs and processes sharing the store
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_lru ON segments (last_used)")
+        self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, url):
+        """Store key for a segment URL"""
+        return hashlib.sha256(normalize_segment_url(url, self.ignore_params).encode('utf-8')).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def lookup(self, url):
+        """Return (path, sha256, size) for a stored segment or None"""
+        key = self.key_for(url)
+        with self._lock:
+            row = self._db.execute("SELECT sha256, size FROM segments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            path = self._object_path(key)
+            try:
+                if os.path.getsize(path) != row[1]:
+                    raise OSError("size mismatch")
+            except OSError:
+                # Entry whose file disappeared or was damaged
+                self._forget(key)
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE segments SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return path, row[0], row[1]
+
+    def _forget(self, key):
+        """Drop an entry and its object file (caller holds the lock)"""
+        try:
+            os.remove(self._object_path(key))
+        except OSError:
+            pass
+        self._db.execute("DELETE FROM segments WHERE key = ?", (key,))
+        self._db.commit()
+
+    def materialize(self, url, dest_path):
+        """Place a stored segment at dest_path, returns the entry or None on a miss
+
+        The placed bytes are checked against the recorded sha256, and an entry
+        that fails the check is evicted, so a damaged object is never linked
+        into an output.
+        """
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        try:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            link_or_copy(entry[0], dest_path)
+            digest = file_sha256(dest_path)
+        except OSError as e:
+            logger.debug(f"Could not materialise stored segment: {e}")
+            return None
+        if digest != entry[1]:
+            logger.warning(f"Stored segment for {url} failed its hash check, evicting it")
+            os.remove(dest_path)
+            with self._lock:
+                self._forget(self.key_for(url))
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return entry
+
+    def add(self, url, path, sha256, size):
+        """Record a freshly downloaded segment in the store"""
+        if size > self.max_bytes:
+            return
+        key = self.key_for(url)
+        object_path = self._object_path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+        tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(path, tmp_path)
+            os.replace(tmp_path, object_path)
+        except OSError as e:
+            logger.debug(f"Could not add segment to store: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO segments (key, url, sha256, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, normalize_segment_url(url, self.ignore_params), sha256, size, time.time())
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used segments until the store fits its size cap"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self._db.execute("SELECT key, size FROM segments ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._object_path(key))
+            except OSError:
+                pass
+            self._db.execute("DELETE FROM segments WHERE key = ?", (key,))
+            total -= size
+        self._db.commit()
+
+    def size(self):
+        """Total bytes currently held"""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
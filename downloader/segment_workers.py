@@ -0,0 +1,244 @@
+"""
+Segment transfers on a pool of worker processes
+
+A single process moving many segments at once is bound by the GIL: TLS
+decryption, chunk iteration and hashing of every transfer compete for one
+core. SegmentWorkerPool shards transfers across worker processes, each with
+its own transport and a few transfer threads. A worker streams a segment
+straight into its temp file and hands back only (sha256, size), so segment
+data never passes between processes. Ordering, retries, host health and
+progress stay with the downloader that submits the transfers.
+"""
+
+import time
+import queue
+import itertools
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .cancellation import CancellationToken, DownloadCancelled
+from .integrity import SegmentIntegrityError
+from .transport import create_transport, TRANSPORT_ERRORS
+
+logger = logging.getLogger('video_downloader')
+
+# Seconds between checks that every worker process is still running
+LIVENESS_INTERVAL = 1.0
+# Times a transfer is resubmitted after the worker running it died
+MAX_RESUBMITS = 2
+
+STATUS_OK = 'ok'
+STATUS_RETRY = 'retry'
+STATUS_CANCELLED = 'cancelled'
+STATUS_ERROR = 'error'
+# The worker died before reporting; not the host's fault, so the pool resubmits it
+STATUS_LOST = 'lost'
+
+
+class WorkerTransferError(Exception):
+    """A transfer failed on a worker process in a way worth retrying, possibly on another mirror"""
+
+
+def _worker_main(tasks, results, threads, transport_kind, headers, config):
+    """Worker process: run ('fetch', ...) messages on transfer threads until a None message"""
+    # Imported here since fragment_downloader imports this module
+    from .fragment_downloader import FragmentDownloader
+
+    transport = create_transport(transport_kind, headers, pool_size=threads)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='transfer')
+    lock = threading.Lock()
+    tokens = {}
+    downloader = FragmentDownloader(config=config, transport=transport, concurrency=threads)
+
+    def run(task_id, settings, url, parts, token):
+        try:
+            # Each transfer carries its track's chunk size and timeout
+            settings = dict(zip(('chunk_size', 'timeout'), settings))
+            if parts[0][0] is None:
+                result = [downloader._download_fragment(url, parts[0][1], token, settings)]
+            else:
+                result = downloader._download_range(url, parts, token, settings)
+            results.put((task_id, STATUS_OK, result))
+        except DownloadCancelled:
+            results.put((task_id, STATUS_CANCELLED, None))
+        except (SegmentIntegrityError,) + TRANSPORT_ERRORS as e:
+            results.put((task_id, STATUS_RETRY, str(e)))
+        except Exception as e:
+            results.put((task_id, STATUS_ERROR, f"{type(e).__name__}: {e}"))
+        finally:
+            with lock:
+                tokens.pop(task_id, None)
+
+    try:
+        while True:
+            message = tasks.get()
+            if message is None:
+                break
+            if message[0] == 'cancel':
+                with lock:
+                    token = tokens.get(message[1])
+                if token is not None:
+                    token.cancel()
+                continue
+            _, task_id, settings, url, parts = message
+            token = CancellationToken()
+            with lock:
+                tokens[task_id] = token
+            pool.submit(run, task_id, settings, url, parts, token)
+    finally:
+        with lock:
+            running = list(tokens.values())
+        for token in running:
+            token.cancel()
+        pool.shutdown(wait=True)
+        transport.close()
+
+
+class SegmentWorkerPool:
+    """processes worker processes running up to threads transfers each
+
+    fetch() is called from the downloader's segment threads and blocks until
+    the transfer finishes on the least busy worker. A worker that dies is
+    restarted and the transfers it held are resubmitted.
+    """
+
+    def __init__(self, processes, threads, transport_kind, headers, config):
+        self.processes = processes
+        self.threads = threads
+        self._worker_args = (threads, transport_kind, dict(headers), config)
+        # spawn: forking a process that already runs segment threads is not safe
+        self._context = multiprocessing.get_context('spawn')
+        self._results = self._context.Queue()
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        # task id -> (future, worker slot)
+        self._pending = {}
+        self._load = [0] * processes
+        self._closed = False
+        self._workers = [self._start_worker(slot) for slot in range(processes)]
+        self._collector = threading.Thread(target=self._collect, name='segment-workers', daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, slot):
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(tasks, self._results) + self._worker_args,
+            name=f"segment-worker-{slot}", daemon=True
+        )
+        process.start()
+        return process, tasks
+
+    def fetch(self, url, parts, settings, cancel_token):
+        """Transfer url into parts on a worker, returns [(sha256, size)] in the same order
+
+        parts is [(byte_range, path)] as for a range request, or [(None, path)]
+        to fetch the whole URL. settings is (chunk_size, timeout).
+        """
+        status, value = self._run(url, parts, settings, cancel_token)
+        for _ in range(MAX_RESUBMITS):
+            if status != STATUS_LOST:
+                break
+            logger.info(f"Resubmitting {url} after its worker exited")
+            status, value = self._run(url, parts, settings, cancel_token)
+
+        if status == STATUS_OK:
+            return value
+        if status == STATUS_CANCELLED:
+            cancel_token.raise_if_cancelled()
+            raise WorkerTransferError(f"Transfer of {url} was aborted")
+        if status == STATUS_RETRY:
+            raise WorkerTransferError(value)
+        raise RuntimeError(value)
+
+    def _run(self, url, parts, settings, cancel_token):
+        """One submission of a transfer, returns the worker's (status, value)"""
+        cancel_token.raise_if_cancelled()
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Segment worker pool is closed")
+            slot = min(range(self.processes), key=self._load.__getitem__)
+            task_id = next(self._task_ids)
+            self._pending[task_id] = (future, slot)
+            self._load[slot] += 1
+            tasks = self._workers[slot][1]
+        tasks.put(('fetch', task_id, settings, url, parts))
+
+        finished = threading.Event()
+        future.add_done_callback(lambda _: finished.set())
+        handle = cancel_token.register(finished.set)
+        try:
+            finished.wait()
+        finally:
+            cancel_token.unregister(handle)
+        if not future.done():
+            # Cancelled mid-transfer: abort it on the worker too
+            tasks.put(('cancel', task_id))
+            cancel_token.raise_if_cancelled()
+        return future.result()
+
+    def _collect(self):
+        """Hand results to the waiting fetch() calls and restart workers that died"""
+        checked = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                message = False
+            if message is None:
+                return
+            if message:
+                task_id, status, value = message
+                with self._lock:
+                    future, slot = self._pending.pop(task_id, (None, None))
+                    if future is not None:
+                        self._load[slot] -= 1
+                if future is not None:
+                    future.set_result((status, value))
+            if time.monotonic() - checked >= LIVENESS_INTERVAL:
+                checked = time.monotonic()
+                self._restart_dead_workers()
+
+    def _restart_dead_workers(self):
+        failed = []
+        with self._lock:
+            if self._closed:
+                return
+            for slot, (process, _) in enumerate(self._workers):
+                if process.is_alive():
+                    continue
+                logger.warning(f"Segment worker {process.name} exited with code {process.exitcode}, restarting it")
+                for task_id, (future, task_slot) in list(self._pending.items()):
+                    if task_slot == slot:
+                        del self._pending[task_id]
+                        failed.append((future, process.exitcode))
+                self._load[slot] = 0
+                self._workers[slot] = self._start_worker(slot)
+        for future, exitcode in failed:
+            future.set_result((STATUS_LOST, f"Segment worker exited with code {exitcode}"))
+
+    def snapshot(self):
+        with self._lock:
+            return {'processes': self.processes, 'threads': self.threads, 'in_flight': len(self._pending)}
+
+    def close(self):
+        """Stop the workers once their current transfers end"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for _, tasks in workers:
+            tasks.put(None)
+        for process, _ in workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join()
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for future, _ in pending:
+            future.set_result((STATUS_ERROR, "Segment worker pool closed"))
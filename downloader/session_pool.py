@@ -0,0 +1,94 @@
+"""
+Thread-safe pool of scraper sessions with per-site cookie jars
+
+A requests/cloudscraper session is not safe to share between threads: its
+headers are mutable and the scraper keeps per-request challenge state. The
+pool hands each request a session of its own, while cookies live in one jar
+per site that every session of the pool shares.
+"""
+
+import ipaddress
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+
+
+def site_key(host):
+    """Cookie jar key of a host: its last two labels, so www. and other subdomains share a jar"""
+    host = (host or '').lstrip('.').lower()
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        return '.'.join(host.split('.')[-2:])
+
+
+class SiteCookieJars:
+    """One cookie jar per site
+
+    Iteration, set_cookie and clear span every jar, so the clearance cache can
+    restore and persist them like a single session's cookies.
+    """
+
+    def __init__(self):
+        self._jars = {}
+        self._lock = threading.Lock()
+
+    def jar(self, host):
+        key = site_key(host)
+        with self._lock:
+            jar = self._jars.get(key)
+            if jar is None:
+                jar = self._jars[key] = RequestsCookieJar()
+            return jar
+
+    def for_url(self, url):
+        return self.jar(urlparse(url).hostname)
+
+    def set_cookie(self, cookie):
+        self.jar(cookie.domain).set_cookie(cookie)
+
+    def clear(self, domain, path=None, name=None):
+        self.jar(domain).clear(domain, path, name)
+
+    def __iter__(self):
+        with self._lock:
+            jars = list(self._jars.values())
+        for jar in jars:
+            # A snapshot, since other threads may add cookies meanwhile
+            yield from list(jar)
+
+
+class SessionPool:
+    """Sessions created by factory on demand and reused, each lent to one request at a time"""
+
+    def __init__(self, factory, headers=None):
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.cookies = SiteCookieJars()
+        self._factory = factory
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, url):
+        """A session for a request to url, using url's site cookie jar"""
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            session = self._factory()
+            session.headers.update(self.headers)
+        session.cookies = self.cookies.for_url(url)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                self._idle.append(session)
+
+    def close(self):
+        with self._lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            session.close()
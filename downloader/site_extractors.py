@@ -0,0 +1,183 @@
+"""
+Hostname-dispatched site extractors built from the site_configs configuration
+
+Each site_configs entry names a handler and the patterns it needs:
+
+    "example.com": {
+        "handler": "wordpress",            # default
+        "post_id_pattern": "post-(\\d+)",
+        "token_pattern": "nonce\\":\\"([^\\"]+)",
+        "ajax_url": "https://example.com/wp-admin/admin-ajax.php",
+        "ajax_actions": ["get_player"],
+        "video_patterns": ["https://cdn\\.example\\.com/[^\\"]+\\.m3u8"]
+    }
+
+Known hosts resolve in one targeted pass; only unknown hosts run the
+generic extraction cascade.
+"""
+
+import re
+import logging
+from urllib.parse import urljoin, urlparse
+
+from . import scanners
+
+logger = logging.getLogger('video_downloader')
+
+IFRAME_SRC_RE = re.compile(r'<iframe[^>]+?src=["\']([^"\']+)["\']', re.IGNORECASE)
+DEFAULT_AJAX_ACTIONS = ('get_player', 'load_player', 'get_video')
+
+
+class SiteExtractor:
+    """Base class: compiles a site's configured patterns once"""
+
+    handler = None
+
+    def __init__(self, host, settings):
+        self.host = host
+        self.settings = settings
+        self.video_patterns = [re.compile(p, re.IGNORECASE) for p in settings.get('video_patterns', [])]
+
+    def _compile(self, name, flags=re.IGNORECASE):
+        pattern = self.settings.get(name)
+        return re.compile(pattern, flags) if pattern else None
+
+    def match_video_url(self, html):
+        """First valid video URL matched by the site's video_patterns"""
+        for pattern in self.video_patterns:
+            for match in pattern.finditer(html):
+                url = match.group(1) if pattern.groups else match.group(0)
+                if scanners.is_valid_video_url(url):
+                    return url
+        return None
+
+    def extract(self, extractor, webpage_url):
+        """Video info for a page of this site, or None"""
+        raise NotImplementedError
+
+    def extract_player(self, extractor, player_url, referer):
+        """Video URL from an embedded player hosted on this site, or None"""
+        return None
+
+
+class WordPressSite(SiteExtractor):
+    """WordPress page: direct video patterns, registered players, then the admin-ajax endpoint"""
+
+    handler = 'wordpress'
+
+    def __init__(self, host, settings):
+        super().__init__(host, settings)
+        self.post_id_re = self._compile('post_id_pattern')
+        self.token_re = self._compile('token_pattern')
+        self.ajax_url = settings.get('ajax_url')
+        self.ajax_actions = tuple(settings.get('ajax_actions') or DEFAULT_AJAX_ACTIONS)
+
+    def extract(self, extractor, webpage_url):
+        response = extractor._request('GET', webpage_url, timeout=extractor.performance['page_timeout'],
+                                      allow_redirects=True)
+        response.raise_for_status()
+        html = response.text
+        extractor._remember_page(html)
+
+        video_url = self.match_video_url(html)
+        if video_url:
+            return extractor._create_video_info(video_url, webpage_url)
+
+        for src in IFRAME_SRC_RE.findall(html):
+            player_url = urljoin(webpage_url, src)
+            extractor._remember_player(player_url)
+            player_site = extractor.sites.lookup(player_url)
+            if player_site is not None and player_site is not self:
+                video_url = player_site.extract_player(extractor, player_url, webpage_url)
+                if video_url:
+                    return extractor._create_video_info(video_url, webpage_url)
+
+        post_id = self._search(self.post_id_re, html)
+        if post_id:
+            logger.info(f"Found post ID: {post_id}")
+            nonce = self._search(self.token_re, html) or scanners.extract_nonce(html)
+            video_url = extractor._try_wordpress_ajax(
+                webpage_url, post_id, nonce, ajax_url=self.ajax_url, actions=self.ajax_actions
+            )
+            if video_url and scanners.is_valid_video_url(video_url):
+                return extractor._create_video_info(video_url, webpage_url)
+        return None
+
+    @staticmethod
+    def _search(pattern, html):
+        if pattern is None:
+            return None
+        match = pattern.search(html)
+        return match.group(1) if match else None
+
+
+class PlayerPageSite(SiteExtractor):
+    """Embeddable player host whose page carries the video URL in its scripts"""
+
+    handler = 'player_page'
+
+    def extract(self, extractor, webpage_url):
+        video_url = self.extract_player(extractor, webpage_url, webpage_url)
+        return extractor._create_video_info(video_url, webpage_url) if video_url else None
+
+    def extract_player(self, extractor, player_url, referer):
+        parts = urlparse(referer)
+        response = extractor._request('GET', player_url, headers={
+            'Referer': referer,
+            'Origin': f"{parts.scheme}://{parts.netloc}",
+            'Sec-Fetch-Dest': 'iframe'
+        })
+        if not response.ok:
+            return None
+        html = response.text
+        extractor._remember_page(html)
+        return self.match_video_url(html) or extractor._run_parser(scanners.scan_player_html, html)
+
+
+class AsmrFreePlayerSite(PlayerPageSite):
+    """asmrfreeplayer.fun, which needs a tokenised request and has an API fallback"""
+
+    handler = 'asmrfree_player'
+
+    def extract_player(self, extractor, player_url, referer):
+        return extractor._handle_asmrfree_player(player_url, referer)
+
+
+HANDLERS = {cls.handler: cls for cls in (WordPressSite, PlayerPageSite, AsmrFreePlayerSite)}
+
+
+class SiteRegistry:
+    def __init__(self):
+        self._sites = {}
+
+    @classmethod
+    def from_config(cls, site_configs):
+        """Build the registry from site_configs, skipping (and logging) broken entries"""
+        registry = cls()
+        for host, settings in (site_configs or {}).items():
+            handler = settings.get('handler', WordPressSite.handler)
+            try:
+                if handler not in HANDLERS:
+                    raise ValueError(f"unknown handler '{handler}'")
+                registry.register(host, HANDLERS[handler](host.lower(), settings))
+            except (re.error, ValueError, TypeError) as e:
+                logger.warning(f"Ignoring site config for {host}: {e}")
+        return registry
+
+    def register(self, host, site):
+        self._sites[host.lower()] = site
+
+    def player_hosts(self):
+        """Hosts configured as embeddable players"""
+        return [host for host, site in self._sites.items() if isinstance(site, PlayerPageSite)]
+
+    def lookup(self, url):
+        """Site extractor for a URL's host (or its www-less form), or None"""
+        host = (urlparse(url).hostname or '').lower()
+        site = self._sites.get(host)
+        if site is None and host.startswith('www.'):
+            site = self._sites.get(host[4:])
+        return site
+
+    def __len__(self):
+        return len(self._sites)
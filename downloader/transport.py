@@ -0,0 +1,218 @@
+"""
+HTTP transports used for playlist and segment traffic
+"""
+
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+try:
+    import httpx
+    import h2  # noqa: F401 - httpx needs it for HTTP/2
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger('video_downloader')
+
+TRANSPORT_AUTO = 'auto'
+TRANSPORT_HTTP1 = 'http1'
+TRANSPORT_HTTP2 = 'http2'
+
+# Errors that mean "this request failed, try again or elsewhere"
+TRANSPORT_ERRORS = (requests.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+
+class ConnectionStats:
+    """Counts requests, new connections and TLS handshakes across worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    def add(self, request_count=0, connection_count=0, handshake_count=0):
+        with self._lock:
+            self.requests += request_count
+            self.connections += connection_count
+            self.tls_handshakes += handshake_count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'reused': max(self.requests - self.connections, 0),
+                'tls_handshakes': self.tls_handshakes
+            }
+
+
+def _counting_pool(base, stats, tls):
+    """Connection pool class that reports every new connection to stats"""
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.add(connection_count=1, handshake_count=1 if tls else 0)
+            return super()._new_conn()
+    return CountingPool
+
+
+class RequestsTransport:
+    """HTTP/1.1 keep-alive transport with an explicitly sized connection pool"""
+
+    name = TRANSPORT_HTTP1
+
+    def __init__(self, headers=None, pool_size=10):
+        self.stats = ConnectionStats()
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+
+        # pool_block makes extra workers wait for a free connection instead of
+        # opening (and handshaking) throwaway ones
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats, tls=False),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats, tls=True)
+        }
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        self.stats.add(request_count=1)
+        return self.session.get(url, stream=stream, timeout=timeout, headers=headers)
+
+    def warm(self, url, connections=1):
+        """Open keep-alive connections (DNS, TCP and TLS) to url's host ahead of use"""
+        adapter = self.session.get_adapter(url)
+        request = requests.Request('GET', url).prepare()
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            pool = adapter.get_connection_with_tls_context(request, verify=True)
+        else:
+            pool = adapter.get_connection(url)
+
+        opened = []
+        try:
+            for _ in range(connections):
+                try:
+                    conn = pool._get_conn(timeout=0.1)
+                except EmptyPoolError:
+                    break
+                opened.append(conn)
+                if not conn.is_connected:
+                    conn.connect()
+        except Exception as e:
+            logger.debug(f"Connection warm-up for {url} failed: {e}")
+        finally:
+            for conn in opened:
+                pool._put_conn(conn)
+
+    def close(self):
+        self.session.close()
+
+
+class HTTPXResponse:
+    """Gives an httpx response the parts of the requests API the downloader uses"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def ok(self):
+        return self._response.is_success
+
+    def raise_for_status(self):
+        try:
+            self._response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise requests.HTTPError(str(e), response=self) from e
+
+    def iter_content(self, chunk_size=8192):
+        return self._response.iter_bytes(chunk_size)
+
+    def iter_lines(self, decode_unicode=False):
+        return self._response.iter_lines()
+
+    @property
+    def content(self):
+        return self._response.read()
+
+    @property
+    def text(self):
+        self._response.read()
+        return self._response.text
+
+    def json(self):
+        self._response.read()
+        return self._response.json()
+
+    def close(self):
+        self._response.close()
+
+
+class HTTP2Transport:
+    """httpx transport multiplexing requests over HTTP/2 where the server negotiates it"""
+
+    name = TRANSPORT_HTTP2
+
+    def __init__(self, headers=None, pool_size=10):
+        if httpx is None:
+            raise RuntimeError("HTTP/2 transport needs the 'httpx[http2]' package")
+        self.stats = ConnectionStats()
+        self.client = httpx.Client(
+            http2=True,
+            headers=headers,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    def _trace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            self.stats.add(connection_count=1)
+        elif event == 'connection.start_tls.complete':
+            self.stats.add(handshake_count=1)
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        self.stats.add(request_count=1)
+        request = self.client.build_request(
+            'GET', url, headers=headers, timeout=timeout, extensions={'trace': self._trace}
+        )
+        response = HTTPXResponse(self.client.send(request, stream=True))
+        if not stream:
+            response.content
+        return response
+
+    def warm(self, url, connections=1):
+        """Establish the (multiplexed) connection to url's host ahead of use"""
+        try:
+            self.client.head(url, extensions={'trace': self._trace}).close()
+        except Exception as e:
+            logger.debug(f"Connection warm-up for {url} failed: {e}")
+
+    def close(self):
+        self.client.close()
+
+
+def create_transport(kind=TRANSPORT_AUTO, headers=None, pool_size=10):
+    """Build the requested transport; 'auto' prefers HTTP/2 when httpx is installed"""
+    if kind == TRANSPORT_AUTO:
+        kind = TRANSPORT_HTTP2 if httpx is not None else TRANSPORT_HTTP1
+
+    if kind == TRANSPORT_HTTP2:
+        return HTTP2Transport(headers, pool_size)
+    if kind == TRANSPORT_HTTP1:
+        return RequestsTransport(headers, pool_size)
+    raise ValueError(f"Unknown transport: {kind}")
@@ -0,0 +1,184 @@
+"""
+Throughput-aware selection of HLS variants
+"""
+
+import time
+import threading
+import logging
+from urllib.parse import urljoin, urlparse
+
+from .playlist import SegmentTable, iter_text_lines
+
+logger = logging.getLogger('video_downloader')
+
+MODE_BEST = 'best'
+MODE_FASTEST = 'fastest'
+MODE_DEADLINE = 'deadline'
+SELECTION_MODES = (MODE_BEST, MODE_FASTEST, MODE_DEADLINE)
+
+
+def variant_quality_key(playlist):
+    """Sort key for variants: pixel count, then advertised bandwidth"""
+    info = playlist.stream_info
+    pixels = info.resolution[0] * info.resolution[1] if info and info.resolution else 0
+    bandwidth = (info.average_bandwidth or info.bandwidth or 0) if info else 0
+    return pixels, bandwidth
+
+
+class ThroughputCache:
+    """Recent throughput measurements per host, smoothed with an EWMA"""
+
+    def __init__(self, ttl=600, alpha=0.5):
+        self.ttl = ttl
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, host):
+        """Bytes per second for host, or None when unknown or stale"""
+        with self._lock:
+            entry = self._entries.get(host)
+            if not entry or time.time() - entry[1] > self.ttl:
+                return None
+            return entry[0]
+
+    def record(self, host, bytes_per_second):
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry and time.time() - entry[1] <= self.ttl:
+                bytes_per_second = self.alpha * bytes_per_second + (1 - self.alpha) * entry[0]
+            self._entries[host] = (bytes_per_second, time.time())
+
+
+# Shared by every downloader in the process
+throughput_cache = ThroughputCache()
+
+
+class VariantCandidate:
+    def __init__(self, playlist, uri):
+        self.playlist = playlist
+        self.uri = uri
+        self.media_text = None
+        self.total_duration = None
+        self.bytes_per_second = None
+        self.estimated_bytes = None
+        self.error = None
+
+    @property
+    def estimated_time(self):
+        if not self.bytes_per_second or not self.estimated_bytes:
+            return float('inf')
+        return self.estimated_bytes / self.bytes_per_second
+
+
+class VariantSelector:
+    def __init__(self, open_stream, fetch_text, max_probes=3, probe_bytes=1024 * 1024, cache=throughput_cache):
+        # open_stream(url) -> (response, release callable); fetch_text(url) -> str
+        # max_probes is how many variants are tried in turn until one measures the link
+        self.open_stream = open_stream
+        self.fetch_text = fetch_text
+        self.max_probes = max_probes
+        self.probe_bytes = probe_bytes
+        self.cache = cache
+
+    def select(self, playlists, playlist_url, mode=MODE_BEST, target_time=None):
+        """Pick a variant, returns (uri, media playlist text or None)"""
+        if not playlists:
+            raise ValueError("Master playlist lists no variants")
+
+        ranked = sorted(playlists, key=variant_quality_key, reverse=True)
+        if mode == MODE_BEST:
+            return urljoin(playlist_url, ranked[0].uri), None
+        if mode not in SELECTION_MODES:
+            raise ValueError(f"Unknown variant selection mode: {mode}")
+        if mode == MODE_DEADLINE and not target_time:
+            raise ValueError("The deadline selection mode needs a target time")
+
+        candidates = [VariantCandidate(p, urljoin(playlist_url, p.uri)) for p in ranked]
+        # One probe measures the link: probes running side by side would split
+        # its bandwidth and each see only a share of it
+        probed = None
+        for candidate in candidates[:self.max_probes]:
+            self._probe(candidate)
+            if candidate.error is None and candidate.bytes_per_second:
+                probed = candidate
+                break
+            logger.info(f"Variant {candidate.uri}: probe failed ({candidate.error or 'no throughput'})")
+        if probed is None:
+            logger.warning("Variant probing failed, using the highest quality")
+            return candidates[0].uri, candidates[0].media_text
+
+        # Every variant is then estimated from the measured link and its advertised bitrate
+        for candidate in candidates:
+            if candidate is probed or candidate.error is not None:
+                continue
+            candidate.bytes_per_second = probed.bytes_per_second
+            candidate.total_duration = probed.total_duration
+            bandwidth = variant_quality_key(candidate.playlist)[1]
+            if bandwidth:
+                candidate.estimated_bytes = bandwidth / 8 * candidate.total_duration
+
+        measured = [c for c in candidates if c.error is None and c.estimated_time != float('inf')]
+        for candidate in measured:
+            logger.info(f"Variant {candidate.uri}: ~{candidate.estimated_time:.1f}s "
+                        f"at {candidate.bytes_per_second / 1e6:.2f} MB/s")
+        if not measured:
+            logger.warning("No variant could be estimated, using the highest quality")
+            return candidates[0].uri, candidates[0].media_text
+
+        fastest = min(measured, key=lambda c: c.estimated_time)
+        if mode == MODE_FASTEST:
+            chosen = fastest
+        else:
+            # Candidates are ordered best quality first
+            chosen = next((c for c in measured if c.estimated_time <= target_time), fastest)
+        return chosen.uri, chosen.media_text
+
+    def _probe(self, candidate):
+        """Fetch the media playlist of one variant and time its first segment to measure the link"""
+        try:
+            candidate.media_text = self.fetch_text(candidate.uri)
+            segments = SegmentTable.parse(iter_text_lines(candidate.media_text), candidate.uri)
+            if not len(segments):
+                raise ValueError("empty media playlist")
+            candidate.total_duration = segments.total_duration
+
+            first_url = segments.url(0)
+            segment_host = urlparse(first_url).netloc
+            bandwidth = variant_quality_key(candidate.playlist)[1]
+
+            cached = self.cache.get(segment_host)
+            if cached and bandwidth:
+                # A fresh measurement for this host plus the advertised bitrate is enough
+                candidate.bytes_per_second = cached
+                candidate.estimated_bytes = bandwidth / 8 * candidate.total_duration
+                return
+
+            size, segment_size, elapsed = self._time_segment(first_url)
+            candidate.bytes_per_second = size / elapsed if elapsed > 0 else None
+            if candidate.bytes_per_second:
+                self.cache.record(segment_host, candidate.bytes_per_second)
+
+            first_duration = segments.duration(0) or 0
+            if bandwidth:
+                candidate.estimated_bytes = bandwidth / 8 * candidate.total_duration
+            elif first_duration and segment_size:
+                candidate.estimated_bytes = segment_size / first_duration * candidate.total_duration
+        except Exception as e:
+            candidate.error = str(e)
+
+    def _time_segment(self, url):
+        """Read up to probe_bytes of a segment, returns (bytes read, segment size, seconds)"""
+        start = time.monotonic()
+        response, release = self.open_stream(url)
+        size = 0
+        try:
+            segment_size = int(response.headers.get('Content-Length') or 0)
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size >= self.probe_bytes:
+                    break
+        finally:
+            response.close()
+            release()
+        return size, segment_size or size, time.monotonic() - start
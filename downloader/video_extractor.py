@@ -7,9 +7,8 @@ import re
 from bs4 import BeautifulSoup
 import json
 import time
-from urllib.parse import urljoin, urlparse, parse_qs, unquote
+from urllib.parse import urljoin, urlparse, parse_qs
 import logging
-import base64
 import random
 from string import punctuation
 import cloudscraper
@@ -25,22 +24,96 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
 import threading
 import queue
+import codecs
+import weakref
+from contextlib import contextmanager, nullcontext
+from requests.structures import CaseInsensitiveDict
+
+from .cancellation import CancellationToken, DownloadCancelled, abort_response
+from .clearance_cache import ClearanceCache, is_challenge_response
+from .session_pool import SessionPool
+from . import scanners
+from . import deobfuscate
+from .capture import get_capture_store
+from .site_extractors import SiteRegistry
+from .profiling import create_profiler, NULL_PROFILER
+from .browser_profile import LEAN_CHROME_ARGUMENTS, BrowserMetrics, blocked_patterns
+from utils.config import Config
 
 logger = logging.getLogger('video_downloader')
 
-class EnhancedVideoExtractor:
+# Streaming page reads: bytes per read, and characters of the previous window rescanned so tags split across reads are seen whole
+PAGE_STREAM_CHUNK = 16 * 1024
+PAGE_WINDOW_OVERLAP = 4096
+
+class _ExtractionState(threading.local):
+    """State of the extraction running on the current thread"""
+
     def __init__(self):
-        self.session = cloudscraper.create_scraper(
-            browser={
-                'browser': 'chrome',
-                'platform': 'windows',
-                'desktop': True
-            },
-            delay=10
-        )
+        self.cancel_token = None
+        # Headers sent with every request made inside request_headers() blocks
+        self.headers = CaseInsensitiveDict()
+        # Page and player HTML fetched by the current static extraction, for the deobfuscation tier
+        self.fetched_pages = []
+        # Hosts of the players found by the current static extraction, whose allow lists the browser honours
+        self.player_hosts = set()
+        # Bytes read and time to decision of the last streamed page
+        self.page_metrics = None
+        self.profiler = NULL_PROFILER
+
+class _PageStream:
+    """A page body decoded and scanned as it arrives, which can be read on after a hit"""
+
+    def __init__(self, response):
+        self.response = response
+        try:
+            self._decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._chunks = response.iter_content(chunk_size=PAGE_STREAM_CHUNK)
+        self._parts = []
+        self.bytes_read = 0
+
+    def _decode(self, chunk):
+        self.bytes_read += len(chunk)
+        text = self._decoder.decode(chunk)
+        self._parts.append(text)
+        return text
+
+    def scan(self):
+        """Read up to the first decisive tag and return it as (kind, url), or None at the end of the page"""
+        window = ''
+        for chunk in self._chunks:
+            window = window[-PAGE_WINDOW_OVERLAP:] + self._decode(chunk)
+            hit = scanners.scan_page_window(window)
+            if hit:
+                return hit
+        return None
+
+    def read_rest(self):
+        """Whole page HTML: the part already scanned plus the rest of the body"""
+        for chunk in self._chunks:
+            self._decode(chunk)
+        self._parts.append(self._decoder.decode(b'', final=True))
+        return ''.join(self._parts)
+
+class EnhancedVideoExtractor:
+    """Extracts video info from web pages
+
+    One instance can serve extractions on several threads at once: requests
+    borrow sessions from a shared pool, per-extraction state is kept per
+    thread, and dynamic extractions take turns on the one browser.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.performance = self.config.performance()
+        
+        self._state = _ExtractionState()
+        self._cancel_tokens = weakref.WeakSet()
         
         # Enhanced headers that look more like a real browser
-        self.session.headers.update({
+        self.sessions = SessionPool(self._create_session, {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9',
@@ -54,8 +127,167 @@ class EnhancedVideoExtractor:
             'Connection': 'keep-alive'
         })
         
+        # Reuse anti-bot clearance from earlier runs so cold starts skip the challenge
+        self.clearance_cache = ClearanceCache()
+        self.clearance_cache.load(self.sessions)
+        
         self.selenium_driver = None
+        self._browser_lock = threading.RLock()
+        self.browser_settings = self.config.get('browser') or {}
+        self.lean_browser = self.browser_settings.get('lean', True)
+        # Page-load time and browser memory of the most recent dynamic extraction
+        self.browser_metrics = None
         self.network_requests = []
+        
+        # Bulk extraction plugs in a process pool for parsing and a per-host request limiter
+        self.parse_executor = None
+        self.request_gate = None
+        # Long-running services keep the browser open between pages instead of quitting it
+        self.keep_browser = False
+        # Opt-in capture of every response, and a CaptureStore to answer requests from instead of the network
+        self.capture_store = get_capture_store(self.config)
+        self.replay_store = None
+        # Profiles of runs sharing a scope (a service job id) go to one directory
+        self.profile_scope = None
+        # Site-specific extractors from site_configs, looked up by hostname
+        self.sites = SiteRegistry.from_config(self.config.get('site_configs'))
+
+    @staticmethod
+    def _create_session():
+        return cloudscraper.create_scraper(
+            browser={
+                'browser': 'chrome',
+                'platform': 'windows',
+                'desktop': True
+            },
+            delay=10
+        )
+
+    @property
+    def cancel_token(self):
+        """Cancellation token of the extraction running on the calling thread"""
+        if self._state.cancel_token is None:
+            self.cancel_token = CancellationToken()
+        return self._state.cancel_token
+
+    @cancel_token.setter
+    def cancel_token(self, cancel_token):
+        self._state.cancel_token = cancel_token
+        self._cancel_tokens.add(cancel_token)
+
+    @property
+    def page_metrics(self):
+        """Bytes read and time to decision of the calling thread's last streamed page"""
+        return self._state.page_metrics
+
+    @property
+    def _fetched_pages(self):
+        return self._state.fetched_pages
+
+    @_fetched_pages.setter
+    def _fetched_pages(self, pages):
+        self._state.fetched_pages = pages
+
+    @property
+    def _player_hosts(self):
+        return self._state.player_hosts
+
+    @_player_hosts.setter
+    def _player_hosts(self, hosts):
+        self._state.player_hosts = hosts
+
+    @property
+    def _profiler(self):
+        return self._state.profiler
+
+    @_profiler.setter
+    def _profiler(self, profiler):
+        self._state.profiler = profiler
+
+    def cancel(self):
+        """Cancel every running extraction, closing the browser and open requests"""
+        for cancel_token in list(self._cancel_tokens):
+            cancel_token.cancel()
+
+    @contextmanager
+    def request_headers(self, headers):
+        """Send headers with every request the calling thread makes inside the block"""
+        state = self._state
+        previous = state.headers
+        state.headers = CaseInsensitiveDict(previous)
+        state.headers.update(headers)
+        try:
+            yield
+        finally:
+            state.headers = previous
+
+    def _send(self, method, url, **kwargs):
+        """Streamed request on a pooled session, with the calling thread's request-scoped headers"""
+        if self._state.headers:
+            headers = CaseInsensitiveDict(self._state.headers)
+            headers.update(kwargs.get('headers') or {})
+            kwargs['headers'] = headers
+        with self.sessions.session(url) as session:
+            return session.request(method, url, stream=True, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        """Session request whose transfer is aborted when the job is cancelled"""
+        cancel_token = self.cancel_token
+        cancel_token.raise_if_cancelled()
+        kwargs.setdefault('timeout', self.performance['timeout'])
+        if self.request_gate is not None:
+            with self.request_gate.slot(url, cancel_token):
+                response = self._read_response(method, url, cancel_token, **kwargs)
+        else:
+            response = self._read_response(method, url, cancel_token, **kwargs)
+        self._check_clearance(response)
+        return response
+
+    def _check_clearance(self, response):
+        """Drop stale anti-bot clearance on a challenge, persist fresh clearance otherwise"""
+        if is_challenge_response(response):
+            self.clearance_cache.invalidate(self.sessions, urlparse(response.url).hostname or '')
+        else:
+            self.clearance_cache.save_if_changed(self.sessions)
+
+    def _read_response(self, method, url, cancel_token, **kwargs):
+        if self.replay_store is not None:
+            return self.replay_store.replay(method, url, kwargs.get('data'))
+        
+        try:
+            response = self._send(method, url, **kwargs)
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+
+        handle = cancel_token.register(lambda: abort_response(response))
+        try:
+            response.content
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            cancel_token.unregister(handle)
+        
+        if self.capture_store is not None:
+            self.capture_store.record_response(method, url, kwargs.get('data'), response)
+        return response
+
+    def _run_parser(self, func, *args):
+        """Run a CPU-bound scanner, in the parse process pool when one is attached"""
+        if self.parse_executor is None:
+            return func(*args)
+        return self.parse_executor.submit(func, *args).result()
+
+    def _quit_selenium_driver(self):
+        """Shut down the browser if one is running"""
+        driver = self.selenium_driver
+        self.selenium_driver = None
+        if driver:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.debug(f"Error quitting Selenium driver: {e}")
 
     def setup_selenium_driver(self):
         """Setup Selenium WebDriver with network monitoring"""
@@ -78,136 +310,345 @@ class EnhancedVideoExtractor:
             chrome_options.add_argument('--enable-logging')
             chrome_options.add_argument('--log-level=0')
             chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+            if self.lean_browser:
+                # Return from get() at DOMContentLoaded, the media request comes from scripts anyway
+                chrome_options.page_load_strategy = 'eager'
+                for argument in LEAN_CHROME_ARGUMENTS:
+                    chrome_options.add_argument(argument)
             
             service = Service(ChromeDriverManager().install())
             self.selenium_driver = webdriver.Chrome(service=service, options=chrome_options)
             self.selenium_driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            if self.lean_browser:
+                self.selenium_driver.execute_cdp_cmd('Network.enable', {})
             
         except Exception as e:
             logger.warning(f"Failed to setup Selenium driver: {e}")
             self.selenium_driver = None
 
-    def extract_video_info(self, webpage_url):
+    def extract_video_info(self, webpage_url, cancel_token=None):
         """Extract video information from webpage with dynamic loading support"""
+        profiler = create_profiler(self.config, 'extract', urlparse(webpage_url).hostname, self.profile_scope)
+        if profiler is None:
+            return self._extract_video_info(webpage_url, cancel_token)
+        with profiler:
+            self._profiler = profiler
+            try:
+                return self._extract_video_info(webpage_url, cancel_token)
+            finally:
+                self._profiler = NULL_PROFILER
+
+    def _extract_video_info(self, webpage_url, cancel_token):
+        if cancel_token is None:
+            cancel_token = CancellationToken()
+        self.cancel_token = cancel_token
+        
         try:
             logger.info(f"Fetching webpage: {webpage_url}")
             
             # First try the static method
             try:
-                result = self._extract_static_content(webpage_url)
+                with self._profiler.phase('static'):
+                    result = self._extract_without_browser(webpage_url)
                 if result:
                     return result
+            except DownloadCancelled:
+                raise
             except Exception as e:
                 logger.info(f"Static extraction failed: {e}")
             
             # If static fails, try dynamic method
             logger.info("Attempting dynamic extraction with browser automation...")
-            return self._extract_dynamic_content(webpage_url)
+            with self._profiler.phase('dynamic'):
+                return self._extract_dynamic_content(webpage_url)
             
+        except DownloadCancelled:
+            logger.info("Extraction cancelled")
+            raise
         except Exception as e:
+            if cancel_token.cancelled:
+                raise DownloadCancelled("Extraction cancelled")
             logger.error(f"Error during extraction: {str(e)}", exc_info=True)
             raise Exception(f"Failed to extract video info: {str(e)}")
 
-    def _extract_static_content(self, webpage_url):
-        """Original static content extraction method"""
-        response = self.session.get(webpage_url, timeout=60, allow_redirects=True)
+    def _extract_without_browser(self, webpage_url):
+        """Known sites get their own extractor, anything else the generic static cascade
+
+        Either way, pages that yielded nothing are deobfuscated before giving up.
+        """
+        self._fetched_pages = []
+        self._player_hosts = set()
+        try:
+            site = self.sites.lookup(webpage_url)
+            if site is not None:
+                logger.info(f"Using {site.handler} extractor for {site.host}")
+                result = site.extract(self, webpage_url)
+            else:
+                result = self._extract_static_content(webpage_url)
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            if not self._fetched_pages:
+                raise
+            logger.info(f"Static extraction failed: {e}")
+            result = None
+        return result or self._extract_deobfuscated(webpage_url)
+
+    def _remember_page(self, html):
+        """Keep fetched HTML for the deobfuscation tier"""
+        self._fetched_pages.append(html)
+
+    def _remember_player(self, player_url):
+        """Note a player the page embeds, so the browser honours its host's allow list"""
+        host = urlparse(player_url).hostname
+        if host:
+            self._player_hosts.add(host)
+
+    def _extract_deobfuscated(self, webpage_url):
+        """Unpack and decode obfuscated scripts of the fetched pages, the last step before the browser"""
+        pages, self._fetched_pages = self._fetched_pages, []
+        for html in pages:
+            self.cancel_token.raise_if_cancelled()
+            video_url = self._run_parser(deobfuscate.scan_obfuscated, html)
+            if video_url:
+                logger.info(f"Found video URL in deobfuscated script: {video_url}")
+                return self._create_video_info(video_url, webpage_url)
+        return None
+
+    def _fetch_page(self, webpage_url):
+        """Whole page HTML"""
+        response = self._request('GET', webpage_url, timeout=self.performance['page_timeout'], allow_redirects=True)
         response.raise_for_status()
-        logger.info(f"Page status code: {response.status_code}")
+        return response.text
 
-        html = response.text
-        soup = BeautifulSoup(html, 'html.parser')
+    def _stream_page(self, webpage_url):
+        """Fetch a page, scanning it as it arrives and stopping at the first decisive tag
 
-        # Save page content for debugging
-        with open('page_content.html', 'w', encoding='utf-8') as f:
-            f.write(html)
+        Returns (hit, html, stream). hit is ('player' | 'media', url) when the
+        scan stopped early, otherwise None with the whole page in html. After a
+        media hit the connection is closed. After a player hit the response is
+        left open in stream, so _finish_page can read the rest of the page
+        should the player not resolve; the caller closes it either way. Bytes
+        read and time to decision are kept in self.page_metrics.
+        """
+        if self.capture_store is not None:
+            # A capture has to hold the whole page to be replayable
+            return None, self._fetch_page(webpage_url), None
 
-        # Look for iframe or video player div
-        player_elements = soup.find_all(['iframe', 'div'], class_=lambda x: x and any(term in str(x).lower() for term in ['player', 'video-container', 'video-wrapper']))
-        
-        for player_elem in player_elements:
-            player_url = player_elem.get('src') if player_elem.name == 'iframe' else None
-            
-            if not player_url and player_elem.name == 'div':
-                # Try to find player URL in div's data attributes
-                for attr in player_elem.attrs:
-                    if attr.startswith('data-') and any(x in attr for x in ['src', 'url', 'source']):
-                        player_url = player_elem[attr]
-                        break
-            
-            if player_url:
-                logger.info(f"Found player URL: {player_url}")
-                
-                if not player_url.startswith(('http://', 'https://')):
-                    player_url = urljoin(webpage_url, player_url)
-
-                # Special handling for asmrfreeplayer.fun
-                if 'asmrfreeplayer.fun' in player_url:
-                    video_url = self._handle_asmrfree_player(player_url, webpage_url)
-                    if video_url:
-                        return self._create_video_info(video_url, webpage_url)
-
-                # Update headers for player request
-                self.session.headers.update({
-                    'Referer': webpage_url,
-                    'Origin': f"{urlparse(webpage_url).scheme}://{urlparse(webpage_url).netloc}",
-                    'Sec-Fetch-Dest': 'iframe'
-                })
-
-                # Get the player page with retry mechanism
-                max_retries = 3
-                retry_delay = 2
-                
-                for attempt in range(max_retries):
-                    try:
-                        player_response = self.session.get(player_url, timeout=30)
-                        if player_response.ok:
-                            player_html = player_response.text
-                            
-                            # Try multiple methods to find video URL
-                            video_url = (
-                                self._extract_from_json_sources(player_html) or
-                                self._extract_from_player_config(player_html) or
-                                self._extract_from_encoded_sources(player_html) or
-                                self._extract_from_script_variables(player_html)
-                            )
-                            
-                            if video_url:
-                                return self._create_video_info(video_url, webpage_url)
-                        break
-                    except requests.RequestException:
-                        if attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            retry_delay *= 2
-                        else:
-                            raise
+        cancel_token = self.cancel_token
+        cancel_token.raise_if_cancelled()
+        started = time.monotonic()
+        gate = self.request_gate.slot(webpage_url, cancel_token) if self.request_gate is not None else nullcontext()
+        with gate:
+            if self.replay_store is not None:
+                response = self.replay_store.replay('GET', webpage_url)
+            else:
+                try:
+                    response = self._send('GET', webpage_url, allow_redirects=True,
+                                          timeout=self.performance['page_timeout'])
+                except Exception:
+                    cancel_token.raise_if_cancelled()
+                    raise
+
+            handle = cancel_token.register(lambda: abort_response(response))
+            stream = hit = html = None
+            try:
+                if response.ok:
+                    stream = _PageStream(response)
+                    hit = stream.scan()
+                    if hit is None:
+                        html = stream.read_rest()
+                    bytes_read = stream.bytes_read
+                else:
+                    bytes_read = len(response.content)
+            except Exception:
+                cancel_token.raise_if_cancelled()
+                raise
+            finally:
+                cancel_token.unregister(handle)
+                if hit is None or hit[0] != 'player':
+                    # Closes the connection when the body was cut short, returns it to the pool otherwise
+                    response.close()
+                    stream = None
+
+        self._check_clearance(response)
+        response.raise_for_status()
+
+        self._state.page_metrics = {
+            'webpage_url': webpage_url,
+            'bytes_read': bytes_read,
+            'time_to_decision': time.monotonic() - started,
+            'decision': hit[0] if hit else 'full_parse'
+        }
+        logger.info(f"Page {webpage_url}: {self.page_metrics['decision']} after "
+                    f"{bytes_read / 1024:.1f} KiB in {self.page_metrics['time_to_decision']:.2f}s")
+        return hit, html, stream
+
+    def _finish_page(self, webpage_url, stream):
+        """Whole page HTML from a stream left open after a player hit, without requesting the page again"""
+        cancel_token = self.cancel_token
+        handle = cancel_token.register(lambda: abort_response(stream.response))
+        try:
+            html = stream.read_rest()
+        except requests.RequestException as e:
+            # The server may have dropped the idle connection while the player was tried
+            cancel_token.raise_if_cancelled()
+            logger.info(f"Reading the rest of {webpage_url} failed ({e}), fetching it again")
+            return self._fetch_page(webpage_url)
+        finally:
+            cancel_token.unregister(handle)
+            stream.response.close()
+        self._state.page_metrics['bytes_read'] = stream.bytes_read
+        return html
+
+    def _extract_static_content(self, webpage_url):
+        """Static extraction: stream the page, try its players, then WordPress AJAX"""
+        hit, html, stream = self._stream_page(webpage_url)
+        tried = set()
+        if hit is not None:
+            kind, url = hit
+            if kind == 'media':
+                return self._create_video_info(urljoin(webpage_url, url), webpage_url)
+            try:
+                video_info = self._extract_from_players([url], webpage_url)
+            except BaseException:
+                stream.response.close()
+                raise
+            if video_info:
+                stream.response.close()
+                return video_info
+            logger.info("Early player match gave no video URL, reading the rest of the page")
+            html = self._finish_page(webpage_url, stream)
+            tried.add(url)
+
+        self._remember_page(html)
+        page = self._run_parser(scanners.parse_page, html)
+        video_info = self._extract_from_players(
+            [player_url for player_url in page['player_urls'] if player_url not in tried], webpage_url
+        )
+        if video_info:
+            return video_info
 
         # Try WordPress ajax as fallback
-        post_id = self._extract_post_id(soup)
+        post_id = page['post_id']
         if post_id:
             logger.info(f"Found post ID: {post_id}")
-            video_url = self._try_wordpress_ajax(webpage_url, post_id, html)
+            video_url = self._try_wordpress_ajax(webpage_url, post_id, page['nonce'])
             if video_url and self._is_valid_video_url(video_url):
                 return self._create_video_info(video_url, webpage_url)
 
         return None
 
-    def _extract_dynamic_content(self, webpage_url):
-        """Extract video content using browser automation"""
+    def _extract_from_players(self, player_urls, webpage_url):
+        """Video info from the first of player_urls that yields a video URL"""
+        for player_url in player_urls:
+            logger.info(f"Found player URL: {player_url}")
+            
+            if not player_url.startswith(('http://', 'https://')):
+                player_url = urljoin(webpage_url, player_url)
+            self._remember_player(player_url)
+
+            # Players hosted on a known site go to that site's extractor first
+            player_site = self.sites.lookup(player_url)
+            if player_site is not None:
+                video_url = player_site.extract_player(self, player_url, webpage_url)
+                if video_url:
+                    return self._create_video_info(video_url, webpage_url)
+
+            player_headers = {
+                'Referer': webpage_url,
+                'Origin': f"{urlparse(webpage_url).scheme}://{urlparse(webpage_url).netloc}",
+                'Sec-Fetch-Dest': 'iframe'
+            }
+
+            # Get the player page with retry mechanism
+            max_retries = self.performance['max_retries']
+            retry_delay = 2
+            
+            for attempt in range(max_retries):
+                try:
+                    with self.request_headers(player_headers):
+                        player_response = self._request('GET', player_url)
+                    if player_response.ok:
+                        player_html = player_response.text
+                        self._remember_page(player_html)
+                        
+                        # Try multiple methods to find video URL
+                        video_url = self._run_parser(scanners.scan_player_html, player_html)
+                        
+                        if video_url:
+                            return self._create_video_info(video_url, webpage_url)
+                    break
+                except requests.RequestException:
+                    if attempt < max_retries - 1:
+                        self.cancel_token.sleep(retry_delay)
+                        retry_delay *= 2
+                    else:
+                        raise
+        return None
+
+    def _block_resources(self, webpage_url, metrics):
+        """Block requests that cannot carry media for this page, honouring its and its players' allow lists"""
+        player_hosts = self.sites.player_hosts() + sorted(self._player_hosts)
+        patterns = blocked_patterns(webpage_url, self.browser_settings, player_hosts) if self.lean_browser else []
+        try:
+            self.selenium_driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            metrics.blocked_patterns = len(patterns)
+        except Exception as e:
+            logger.debug(f"Failed to set blocked URLs: {e}")
+
+    def _browser_pid(self):
+        """PID of the ChromeDriver process, parent of the browser processes"""
+        try:
+            return self.selenium_driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def _extract_dynamic_content(self, webpage_url, player_hosts=None):
+        """Extract video content using browser automation
+
+        player_hosts are the players a static pass on another thread found on
+        the page; by default those of this thread's static pass are used.
+        """
+        self.cancel_token.raise_if_cancelled()
+        if player_hosts is not None:
+            self._player_hosts = set(player_hosts)
+        if self.replay_store is not None:
+            raise ValueError("Browser extraction cannot run from captured traffic")
+        # There is one browser per extractor, so concurrent extractions take turns
+        with self._browser_lock:
+            return self._extract_with_browser(webpage_url)
+
+    def _extract_with_browser(self, webpage_url):
         self.setup_selenium_driver()
         
         if not self.selenium_driver:
             raise Exception("Browser automation not available - please install ChromeDriver")
         
+        # Quitting the driver from the cancelling thread unblocks any pending WebDriver call
+        handle = self.cancel_token.register(self._quit_selenium_driver)
+        stop_monitor = threading.Event()
+        metrics = BrowserMetrics(webpage_url, self.lean_browser)
         try:
+            # Drop network entries a reused browser logged for earlier pages
+            try:
+                self.selenium_driver.get_log('performance')
+            except Exception:
+                pass
+            self._block_resources(webpage_url, metrics)
+
             # Navigate to the page
+            metrics.navigation_started()
             self.selenium_driver.get(webpage_url)
-            time.sleep(3)  # Wait for initial load
+            metrics.navigation_finished()
+            self.cancel_token.sleep(3)  # Wait for initial load
             
             # Start monitoring network requests
             request_queue = queue.Queue()
             monitor_thread = threading.Thread(
                 target=self._monitor_network_requests, 
-                args=(request_queue,)
+                args=(request_queue, stop_monitor, self.cancel_token)
             )
             monitor_thread.daemon = True
             monitor_thread.start()
@@ -233,11 +674,15 @@ class EnhancedVideoExtractor:
                             if self._interact_with_player(element):
                                 video_found = True
                                 break
+                        except DownloadCancelled:
+                            raise
                         except Exception as e:
                             logger.debug(f"Failed to interact with element {selector}: {e}")
                             continue
                     if video_found:
                         break
+                except DownloadCancelled:
+                    raise
                 except Exception as e:
                     logger.debug(f"Failed to find elements with selector {selector}: {e}")
                     continue
@@ -259,17 +704,19 @@ class EnhancedVideoExtractor:
                         for element in elements:
                             if element.is_displayed():
                                 self._safe_click(element)
-                                time.sleep(2)
+                                self.cancel_token.sleep(2)
                                 video_found = True
                                 break
                         if video_found:
                             break
+                    except DownloadCancelled:
+                        raise
                     except Exception as e:
                         logger.debug(f"Failed to click play button {selector}: {e}")
                         continue
             
             # Wait for network requests and analyze them
-            time.sleep(5)  # Give time for video requests to be made
+            self.cancel_token.sleep(5)  # Give time for video requests to be made
             
             # Check captured network requests for video URLs
             video_urls = []
@@ -297,12 +744,7 @@ class EnhancedVideoExtractor:
             # Try to extract video URLs from current page source
             if not video_urls:
                 current_html = self.selenium_driver.page_source
-                video_url = (
-                    self._extract_from_json_sources(current_html) or
-                    self._extract_from_player_config(current_html) or
-                    self._extract_from_encoded_sources(current_html) or
-                    self._extract_from_script_variables(current_html)
-                )
+                video_url = self._run_parser(scanners.scan_player_html, current_html)
                 if video_url:
                     video_urls.append(video_url)
             
@@ -314,14 +756,18 @@ class EnhancedVideoExtractor:
             raise ValueError("No video URL found after dynamic analysis")
             
         finally:
+            stop_monitor.set()
+            self.cancel_token.unregister(handle)
             if self.selenium_driver:
-                self.selenium_driver.quit()
-                self.selenium_driver = None
+                self.browser_metrics = metrics.finish(self._browser_pid())
+                logger.info(f"Browser extraction of {webpage_url}: {metrics}")
+            if not self.keep_browser:
+                self._quit_selenium_driver()
 
-    def _monitor_network_requests(self, request_queue):
+    def _monitor_network_requests(self, request_queue, stop_event, cancel_token):
         """Monitor network requests in a separate thread"""
         try:
-            while True:
+            while self.selenium_driver and not stop_event.is_set() and not cancel_token.cancelled:
                 try:
                     logs = self.selenium_driver.get_log('performance')
                     for log in logs:
@@ -333,7 +779,7 @@ class EnhancedVideoExtractor:
                                 request_queue.put({'url': url, 'timestamp': time.time()})
                 except:
                     pass
-                time.sleep(0.5)
+                stop_event.wait(0.5)
         except:
             pass
 
@@ -343,7 +789,7 @@ class EnhancedVideoExtractor:
             # First try to click the element itself
             if element.is_displayed():
                 self._safe_click(element)
-                time.sleep(2)
+                self.cancel_token.sleep(2)
                 
                 # If it's an iframe, switch to it and look for play button
                 if element.tag_name == 'iframe':
@@ -354,15 +800,19 @@ class EnhancedVideoExtractor:
                         for btn in play_buttons:
                             if btn.is_displayed():
                                 self._safe_click(btn)
-                                time.sleep(2)
+                                self.cancel_token.sleep(2)
                                 break
                         self.selenium_driver.switch_to.default_content()
+                    except DownloadCancelled:
+                        raise
                     except Exception as e:
                         logger.debug(f"Failed to interact with iframe content: {e}")
                         self.selenium_driver.switch_to.default_content()
                 
                 return True
                 
+        except DownloadCancelled:
+            raise
         except Exception as e:
             logger.debug(f"Failed to interact with player element: {e}")
             return False
@@ -400,153 +850,47 @@ class EnhancedVideoExtractor:
     # Keep all the existing extraction methods
     def _extract_from_json_sources(self, html):
         """Extract video URL from JSON sources in page"""
-        patterns = [
-            r'sources?\s*[:=]\s*(\[{[^}]+}\])',
-            r'playbackConfig\s*[:=]\s*({[^}]+})',
-            r'playerConfig\s*[:=]\s*({[^}]+})'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, html, re.IGNORECASE)
-            for match in matches:
-                try:
-                    data = json5.loads(match.group(1))
-                    if isinstance(data, list):
-                        for item in data:
-                            if isinstance(item, dict):
-                                url = item.get('file') or item.get('src') or item.get('url')
-                                if url and self._is_valid_video_url(url):
-                                    return url
-                    elif isinstance(data, dict):
-                        url = data.get('file') or data.get('videoUrl') or data.get('url')
-                        if url and self._is_valid_video_url(url):
-                            return url
-                except:
-                    continue
-        return None
+        return scanners.extract_from_json_sources(html)
 
     def _extract_from_player_config(self, html):
         """Extract video URL from player configuration"""
-        patterns = [
-            r'file\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
-            r'source\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
-            r'src\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']',
-            r'["\']?url["\']?\s*:\s*["\']([^"\']+\.(?:mp4|m3u8)[^"\']*)["\']'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, html, re.IGNORECASE)
-            for match in matches:
-                url = match.group(1)
-                if self._is_valid_video_url(url):
-                    return url
-        return None
+        return scanners.extract_from_player_config(html)
 
     def _extract_from_encoded_sources(self, html):
         """Extract video URL from encoded/encrypted sources"""
-        patterns = [
-            (r'atob\(["\']([^"\']+)["\']\)', 'base64'),
-            (r'decodeURIComponent\(escape\(atob\(["\']([^"\']+)["\']\)\)\)', 'base64'),
-            (r'decodeURIComponent\(["\']([^"\']+)["\']\)', 'uri'),
-            (r'unescape\(["\']([^"\']+)["\']\)', 'uri')
-        ]
-        
-        for pattern, encoding in patterns:
-            matches = re.finditer(pattern, html)
-            for match in matches:
-                try:
-                    encoded = match.group(1)
-                    if encoding == 'base64':
-                        decoded = base64.b64decode(encoded).decode('utf-8')
-                    else:  # uri
-                        from urllib.parse import unquote
-                        decoded = unquote(encoded)
-                    
-                    # Look for URLs in decoded content
-                    url_matches = re.findall(r'https?://[^\s<>"\']+?\.(?:mp4|m3u8)[^\s<>"\']*', decoded)
-                    for url in url_matches:
-                        if self._is_valid_video_url(url):
-                            return url
-                    
-                    # Try parsing as JSON
-                    try:
-                        data = json5.loads(decoded)
-                        if isinstance(data, dict):
-                            url = data.get('file') or data.get('url') or data.get('src')
-                            if url and self._is_valid_video_url(url):
-                                return url
-                    except:
-                        pass
-                except:
-                    continue
-        return None
+        return scanners.extract_from_encoded_sources(html)
 
     def _extract_from_script_variables(self, html):
         """Extract video URL from JavaScript variables"""
-        patterns = [
-            r'var\s+videoUrl\s*=\s*["\']([^"\']+)["\']',
-            r'var\s+videoSrc\s*=\s*["\']([^"\']+)["\']',
-            r'var\s+videoFile\s*=\s*["\']([^"\']+)["\']',
-            r'var\s+mp4Url\s*=\s*["\']([^"\']+)["\']'
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, html)
-            for match in matches:
-                url = match.group(1)
-                if self._is_valid_video_url(url):
-                    return url
-        return None
+        return scanners.extract_from_script_variables(html)
 
     def _is_valid_video_url(self, url):
         """Check if URL points to a valid video file"""
-        if not url or not isinstance(url, str):
-            return False
-            
-        if not url.startswith(('http://', 'https://')):
-            return False
-            
-        # Check extensions and paths
-        if not re.search(r'\.(?:mp4|m3u8)(?:\?[^&]*)?$', url, re.IGNORECASE):
-            return False
-            
-        # Exclude common script and library URLs
-        exclude_patterns = [
-            r'jwplayer\.js',
-            r'player\.js',
-            r'\.min\.js',
-            r'/assets/',
-            r'/static/',
-            r'/lib/',
-            r'/cdn-cgi/',
-            r'/wp-content/plugins/',
-            r'/wp-includes/'
-        ]
-        
-        return not any(re.search(pattern, url, re.IGNORECASE) for pattern in exclude_patterns)
+        return scanners.is_valid_video_url(url)
 
-    def _try_wordpress_ajax(self, webpage_url, post_id, html):
+    def _try_wordpress_ajax(self, webpage_url, post_id, nonce, ajax_url=None, actions=None):
         """Try WordPress AJAX methods to get video URL"""
-        ajax_url = urljoin(webpage_url, '/wp-admin/admin-ajax.php')
+        ajax_url = ajax_url or urljoin(webpage_url, '/wp-admin/admin-ajax.php')
         
-        actions = ['get_player', 'load_player', 'get_video']
+        actions = actions or ['get_player', 'load_player', 'get_video']
         
         for action in actions:
             try:
-                self.session.headers.update({
+                ajax_headers = {
                     'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
                     'X-Requested-With': 'XMLHttpRequest',
                     'Origin': urlparse(webpage_url).scheme + '://' + urlparse(webpage_url).netloc,
                     'Referer': webpage_url
-                })
+                }
                 
                 data = {
                     'action': action,
                     'post_id': post_id,
-                    'nonce': self._extract_nonce(html)
+                    'nonce': nonce
                 }
                 
-                response = self.session.post(ajax_url, data=data)
+                with self.request_headers(ajax_headers):
+                    response = self._request('POST', ajax_url, data=data)
                 
                 if response.ok:
                     try:
@@ -554,12 +898,13 @@ class EnhancedVideoExtractor:
                         if result.get('success'):
                             html_content = result.get('data', {}).get('html', '')
                             if html_content:
-                                url_matches = re.findall(r'https?://[^\s<>"\']+?\.(?:mp4|m3u8)[^\s<>"\']*', html_content)
-                                for url in url_matches:
-                                    if self._is_valid_video_url(url):
-                                        return url
+                                url_matches = scanners.find_media_urls(html_content)
+                                if url_matches:
+                                    return url_matches[0]
                     except:
                         pass
+            except DownloadCancelled:
+                raise
             except:
                 continue
                 
@@ -567,28 +912,11 @@ class EnhancedVideoExtractor:
 
     def _extract_nonce(self, html):
         """Extract WordPress nonce from page"""
-        patterns = [
-            r'nonce["\']?\s*:\s*["\']([^"\']+)["\']',
-            r'_wpnonce["\']?\s*:\s*["\']([^"\']+)["\']',
-            r'<input[^>]+?name=["\']\w*nonce\w*["\']\s+value=["\']([\w-]+)["\']'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, html, re.IGNORECASE)
-            if match:
-                return match.group(1)
-        
-        return ''
+        return scanners.extract_nonce(html)
 
     def _extract_post_id(self, soup):
         """Extract WordPress post ID from page"""
-        for element in soup.find_all(['article', 'div']):
-            classes = element.get('class', [])
-            if any('post-' in cls for cls in classes):
-                for cls in classes:
-                    if cls.startswith('post-'):
-                        return cls.replace('post-', '')
-        return None
+        return scanners.extract_post_id(soup)
 
     def _create_video_info(self, video_url, webpage_url):
         """Create video info dictionary"""
@@ -652,73 +980,78 @@ class EnhancedVideoExtractor:
             else:
                 player_url += f"?_t={timestamp}&token={token}"
             
-            # First request to get the player page
-            self.session.headers.update(player_headers)
-            player_response = self.session.get(player_url, timeout=30)
+            # The player's headers apply to its page and API requests, not to later ones
+            with self.request_headers(player_headers):
+                # First request to get the player page
+                player_response = self._request('GET', player_url)
             
-            if not player_response.ok:
-                logger.warning(f"Player request failed with status {player_response.status_code}")
-                return None
+                if not player_response.ok:
+                    logger.warning(f"Player request failed with status {player_response.status_code}")
+                    return None
                 
-            player_html = player_response.text
+                player_html = player_response.text
             
-            # Extract video configuration from various possible locations
-            video_url = None
+                # Extract video configuration from various possible locations
+                video_url = None
             
-            # Method 1: Look for JW Player setup
-            config_match = re.search(r'jwplayer\([\'"][^\'"]+[\'"]\)\.setup\s*\(\s*({[^}]+})', player_html)
-            if config_match:
-                try:
-                    config = json5.loads(config_match.group(1))
-                    if isinstance(config, dict):
-                        video_url = config.get('file') or config.get('source')
-                except Exception as e:
-                    logger.debug(f"Failed to parse JW Player config: {e}")
-
-            # Method 2: Look for source tags
-            if not video_url:
-                source_tags = BeautifulSoup(player_html, 'html.parser').find_all('source')
-                for source in source_tags:
-                    src = source.get('src')
-                    if src and self._is_valid_video_url(src):
-                        video_url = src
-                        break
-            
-            # Method 3: Look for video element
-            if not video_url:
-                video_elem = BeautifulSoup(player_html, 'html.parser').find('video')
-                if video_elem:
-                    video_url = video_elem.get('src')
-                    if not video_url:
-                        sources = video_elem.find_all('source')
-                        for source in sources:
-                            src = source.get('src')
-                            if src and self._is_valid_video_url(src):
-                                video_url = src
-                                break
+                # Method 1: Look for JW Player setup
+                config_match = re.search(r'jwplayer\([\'"][^\'"]+[\'"]\)\.setup\s*\(\s*({[^}]+})', player_html)
+                if config_match:
+                    try:
+                        config = json5.loads(config_match.group(1))
+                        if isinstance(config, dict):
+                            video_url = config.get('file') or config.get('source')
+                    except Exception as e:
+                        logger.debug(f"Failed to parse JW Player config: {e}")
+
+                # Method 2: Look for source tags
+                if not video_url:
+                    source_tags = BeautifulSoup(player_html, 'html.parser').find_all('source')
+                    for source in source_tags:
+                        src = source.get('src')
+                        if src and self._is_valid_video_url(src):
+                            video_url = src
+                            break
             
-            # Method 4: Try API endpoints
-            if not video_url:
-                api_url = urljoin(player_url, '/api/source')
-                try:
-                    api_response = self.session.post(api_url, data={'d': urlparse(player_url).netloc}, timeout=30)
-                    if api_response.ok:
-                        data = api_response.json()
-                        if data.get('success'):
-                            for file in data.get('data', []):
-                                file_url = file.get('file')
-                                if file_url and self._is_valid_video_url(file_url):
-                                    video_url = file_url
+                # Method 3: Look for video element
+                if not video_url:
+                    video_elem = BeautifulSoup(player_html, 'html.parser').find('video')
+                    if video_elem:
+                        video_url = video_elem.get('src')
+                        if not video_url:
+                            sources = video_elem.find_all('source')
+                            for source in sources:
+                                src = source.get('src')
+                                if src and self._is_valid_video_url(src):
+                                    video_url = src
                                     break
-                except Exception as e:
-                    logger.debug(f"API request failed: {e}")
             
-            if video_url:
-                logger.info(f"Successfully extracted video URL from asmrfreeplayer.fun: {video_url}")
-                return video_url
+                # Method 4: Try API endpoints
+                if not video_url:
+                    api_url = urljoin(player_url, '/api/source')
+                    try:
+                        api_response = self._request('POST', api_url, data={'d': urlparse(player_url).netloc})
+                        if api_response.ok:
+                            data = api_response.json()
+                            if data.get('success'):
+                                for file in data.get('data', []):
+                                    file_url = file.get('file')
+                                    if file_url and self._is_valid_video_url(file_url):
+                                        video_url = file_url
+                                        break
+                    except DownloadCancelled:
+                        raise
+                    except Exception as e:
+                        logger.debug(f"API request failed: {e}")
             
-            return None
+                if video_url:
+                    logger.info(f"Successfully extracted video URL from asmrfreeplayer.fun: {video_url}")
+                    return video_url
+            
+                return None
             
+        except DownloadCancelled:
+            raise
         except Exception as e:
             logger.warning(f"Failed to handle asmrfreeplayer.fun: {e}")
             return None
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Download throughput with segment transfers on threads versus worker processes
+
+The benchmark server runs in a process of its own so that serving does not
+compete with the downloader for the GIL, and every run downloads the same
+playlist from it with a different 'processes' setting.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from .bench_server import BenchmarkServer
+from .fragment_downloader import FragmentDownloader
+from utils.config import Config
+
+
+def _serve(options, connection):
+    """Benchmark server process: report the URL, then serve until told to stop"""
+    with BenchmarkServer(**options) as bench:
+        connection.send(bench.url)
+        connection.recv()
+
+
+def run(process_counts=(0, 1, 2, 4), segments=200, segment_size=2 * 1024 ** 2, concurrency=16, latency=0.01):
+    """[(processes, seconds, bytes)] for one download per entry of process_counts
+
+    processes 0 runs the segment transfers on threads of this process.
+    """
+    context = multiprocessing.get_context('spawn')
+    connection, child_connection = context.Pipe()
+    options = {'segments': segments, 'segment_size': segment_size, 'latency': latency}
+    server = context.Process(target=_serve, args=(options, child_connection), name='bench-server', daemon=True)
+    server.start()
+    work_dir = tempfile.mkdtemp(prefix='worker_bench_')
+    results = []
+    try:
+        url = connection.recv()
+        for processes in process_counts:
+            config = Config(os.path.join(work_dir, f"config_{processes}.json"))
+            config.set_performance({'concurrency': concurrency, 'processes': processes})
+            downloader = FragmentDownloader(config=config, transport='http1')
+            downloader.api_url = url
+            try:
+                # Untimed warm-up so worker start-up and connection set-up are not measured
+                downloader.download_video('bench', download_dir=work_dir, remux=False, duration=1)
+                started = time.perf_counter()
+                output_path = downloader.download_video('bench', download_dir=work_dir, remux=False)
+                elapsed = time.perf_counter() - started
+                results.append((processes, elapsed, os.path.getsize(output_path)))
+            finally:
+                downloader.close_workers()
+            for name in os.listdir(work_dir):
+                if not name.startswith('config_'):
+                    os.remove(os.path.join(work_dir, name))
+    finally:
+        connection.send(None)
+        server.join(timeout=10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
@@ -11,6 +11,7 @@ import traceback
 
 from downloader.video_extractor import EnhancedVideoExtractor
 from downloader.fragment_downloader import FragmentDownloader
+from downloader.cancellation import CancellationToken, DownloadCancelled
 from utils.config import Config
 from utils.logger import setup_logger
 
@@ -22,8 +23,8 @@ class VideoDownloaderApp(customtkinter.CTk):
         
         # Initialize components
         self.config = Config()
-        self.video_extractor = EnhancedVideoExtractor()
-        self.fragment_downloader = FragmentDownloader()
+        self.video_extractor = EnhancedVideoExtractor(config=self.config)
+        self.fragment_downloader = FragmentDownloader(config=self.config)
         
         # Configure window
         self.setup_window()
@@ -31,6 +32,7 @@ class VideoDownloaderApp(customtkinter.CTk):
         
         # Download state
         self.current_download = None
+        self.cancel_token = None
         
         # Bind cleanup to window close
         self.protocol("WM_DELETE_WINDOW", self.cleanup)
@@ -88,7 +90,7 @@ class VideoDownloaderApp(customtkinter.CTk):
             width=300
         )
         self.location_entry.pack(side="left", fill="x", expand=True, padx=5)
-        self.location_entry.insert(0, os.path.expanduser("~/Downloads"))
+        self.location_entry.insert(0, self.config.get('download_directory'))
         
         self.browse_button = customtkinter.CTkButton(
             self.location_frame,
@@ -142,6 +144,7 @@ class VideoDownloaderApp(customtkinter.CTk):
         if directory:
             self.location_entry.delete(0, tk.END)
             self.location_entry.insert(0, directory)
+            self.config.set('download_directory', directory)
     
     def update_progress(self, current, total):
         """Update progress bar and status"""
@@ -174,19 +177,20 @@ class VideoDownloaderApp(customtkinter.CTk):
         self.cancel_button.configure(state="normal")
         
         # Start download in background thread
+        self.cancel_token = CancellationToken()
         self.current_download = threading.Thread(
             target=self.download_video,
-            args=(url, save_dir)
+            args=(url, save_dir, self.cancel_token)
         )
         self.current_download.start()
     
-    def download_video(self, url, save_dir):
+    def download_video(self, url, save_dir, cancel_token):
         """Download video in background thread"""
         try:
             logger.info(f"Starting download from URL: {url}")
             self.status_label.configure(text="Extracting video information...")
             
-            video_info = self.video_extractor.extract_video_info(url)
+            video_info = self.video_extractor.extract_video_info(url, cancel_token=cancel_token)
             logger.info(f"Video info extracted: {video_info}")
             
             self.status_label.configure(text="Starting download...")
@@ -194,13 +198,18 @@ class VideoDownloaderApp(customtkinter.CTk):
                 video_info['video_id'],
                 quality='auto',
                 download_dir=save_dir,
-                progress_callback=self.update_progress
+                progress_callback=self.update_progress,
+                cancel_token=cancel_token
             )
             
             logger.info(f"Download completed: {output_path}")
             self.status_label.configure(text=f"Download complete! Saved to: {output_path}")
             messagebox.showinfo("Success", "Video downloaded successfully!")
             
+        except DownloadCancelled:
+            logger.info("Download cancelled by user")
+            self.status_label.configure(text="Download cancelled")
+            
         except Exception as e:
             logger.error(f"Download failed: {str(e)}\n{traceback.format_exc()}")
             self.status_label.configure(text="Download failed!")
@@ -223,13 +232,15 @@ class VideoDownloaderApp(customtkinter.CTk):
     def cancel_download(self):
         """Cancel current download"""
         if self.current_download and self.current_download.is_alive():
-            # Set a flag to stop the download
-            if hasattr(self.fragment_downloader, 'cancel_download'):
-                self.fragment_downloader.cancel_download()
+            # Aborts in-flight requests and the browser, then the worker unwinds
+            self.cancel_token.cancel()
+            self.cancel_button.configure(state="disabled")
             self.status_label.configure(text="Cancelling download...")
     
     def cleanup(self):
         """Clean up resources before closing"""
+        if self.cancel_token:
+            self.cancel_token.cancel()
         try:
             if self.video_extractor and hasattr(self.video_extractor, 'selenium_driver') and self.video_extractor.selenium_driver:
                 self.video_extractor.selenium_driver.quit()
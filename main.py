@@ -5,6 +5,8 @@ Main application entry point
 
 import sys
 import os
+import json
+import argparse
 from pathlib import Path
 
 # Add the current directory to Python path
@@ -12,13 +14,223 @@ current_dir = str(Path(__file__).parent.absolute())
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
-from gui.main_window import VideoDownloaderApp
+def run_gui():
+    """Launch the desktop application"""
+    from gui.main_window import VideoDownloaderApp
+
+    app = VideoDownloaderApp()
+    app.mainloop()  # CustomTkinter uses mainloop() like regular tkinter
+
+def run_verify(args):
+    """Verify (and optionally repair) a downloaded file against its segment manifest"""
+    from downloader.fragment_downloader import FragmentDownloader
+
+    downloader = FragmentDownloader()
+    if args.command == 'repair':
+        repaired = downloader.repair_output(args.file)
+        print(f"Repaired {repaired} segment(s)" if repaired else "All segments OK")
+        return
+
+    bad_segments = downloader.verify_output(args.file)
+    if bad_segments:
+        print(f"{len(bad_segments)} damaged segment(s): {', '.join(str(i) for i in bad_segments)}")
+        sys.exit(2)
+    print("All segments OK")
+
+def run_bulk(args):
+    """Resolve a file of page URLs, writing one JSON result per line as pages complete"""
+    from downloader.bulk_extractor import BulkExtractor
+
+    extractor = BulkExtractor(
+        fetch_workers=args.fetch_workers,
+        per_host_limit=args.per_host,
+        parse_workers=args.parse_workers,
+        browser_workers=args.browser_workers
+    )
+    source = sys.stdin if args.urls == '-' else open(args.urls, 'r', encoding='utf-8')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for result in extractor.extract_many(source):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+def run_service(args):
+    """Run the local job service until interrupted"""
+    from utils.logger import setup_logger
+    from service.jobs import JobManager
+    from service.http_api import serve
+
+    setup_logger()
+    manager = JobManager(workers=args.workers, default_download_dir=args.download_dir)
+    serve(manager, args.host, args.port)
+
+def run_autotune(args):
+    """Calibrate the link to a host and save the best performance profile"""
+    import logging
+    from utils.config import Config
+    from downloader.autotune import autotune, resolve_segment_urls
+    from downloader.bench_server import BenchmarkServer
+    from downloader.fragment_downloader import FragmentDownloader, DEFAULT_HEADERS
+    from downloader.transport import create_transport
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    config = Config()
+    bench = None
+    try:
+        if args.local:
+            # Local origin with a per-connection cap, so extra connections genuinely help up to a point
+            bench = BenchmarkServer(latency=0.05, connection_bandwidth=4 * 1024 ** 2,
+                                    total_bandwidth=40 * 1024 ** 2).start()
+            target = bench.media_url
+        elif not args.target:
+            raise ValueError("Give a playlist URL or video ID, or use --local")
+        else:
+            target = args.target
+
+        if target.startswith(('http://', 'https://')):
+            transport = create_transport(args.transport, DEFAULT_HEADERS)
+            try:
+                segment_urls = resolve_segment_urls(target, transport)
+            finally:
+                transport.close()
+        else:
+            fragments = FragmentDownloader(transport=args.transport, config=config).get_fragment_urls(target)
+            segment_urls = [fragment['url'] for fragment in fragments]
+
+        host, profile, best = autotune(
+            segment_urls, config, args.transport, DEFAULT_HEADERS, save=not (args.dry_run or args.local)
+        )
+        print(f"{host}: {best.throughput / 1024 ** 2:.2f} MiB/s with {json.dumps(profile)}")
+    finally:
+        if bench:
+            bench.stop()
+
+def run_playlist_bench(args):
+    """Time and measure parsing a synthetic media playlist each supported way"""
+    from downloader.playlist_bench import run
+
+    print(f"{args.segments} segments of {args.segment_duration}s")
+    for name, elapsed, peak, retained in run(args.segments, args.segment_duration):
+        print(f"{name:18s} {elapsed * 1000:8.1f} ms  peak {peak / 1024 ** 2:7.1f} MiB  "
+              f"retained {retained / 1024 ** 2:7.1f} MiB")
+
+def run_worker_bench(args):
+    """Compare download throughput with segment transfers on threads and on worker processes"""
+    from downloader.worker_bench import run
+
+    print(f"{args.segments} segments of {args.segment_size / 1024 ** 2:.1f} MiB, concurrency {args.concurrency}, "
+          f"{os.cpu_count()} CPU(s)")
+    for processes, elapsed, size in run(args.processes, args.segments, args.segment_size, args.concurrency):
+        mode = f"{processes} process(es)" if processes else "threads"
+        print(f"{mode:16s} {elapsed:7.2f} s  {size / elapsed / 1024 ** 2:8.1f} MiB/s")
+
+def run_replay(args):
+    """Extract and download a page entirely from captured traffic"""
+    import time
+    import logging
+    from utils.config import Config
+    from downloader.capture import CaptureStore, ReplayTransport
+    from downloader.video_extractor import EnhancedVideoExtractor
+    from downloader.fragment_downloader import FragmentDownloader
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    config = Config()
+    store = CaptureStore(args.capture_dir or (config.get('capture') or {}).get('directory'))
+
+    started = time.monotonic()
+    extractor = EnhancedVideoExtractor(config=config)
+    extractor.replay_store = store
+    video_info = extractor.extract_video_info(args.url)
+    extracted = time.monotonic()
+
+    downloader = FragmentDownloader(transport=ReplayTransport(store), config=config)
+    output_path = downloader.download_video(video_info['video_id'], download_dir=args.download_dir,
+                                            audio_language=args.audio_language, subtitles=args.subtitles)
+    finished = time.monotonic()
+    print(f"Replayed {args.url} -> {output_path}")
+    print(f"extraction {extracted - started:.3f}s, download {finished - extracted:.3f}s")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Abyss.to Video Downloader")
+    subparsers = parser.add_subparsers(dest='command')
+
+    verify_parser = subparsers.add_parser('verify', help="Check a download against its segment manifest")
+    verify_parser.add_argument('file', help="Downloaded .ts file")
+
+    repair_parser = subparsers.add_parser('repair', help="Re-fetch only the damaged segments of a download")
+    repair_parser.add_argument('file', help="Downloaded .ts file")
+
+    bulk_parser = subparsers.add_parser('bulk', help="Extract video info for many page URLs")
+    bulk_parser.add_argument('urls', help="File with one page URL per line ('-' for stdin)")
+    bulk_parser.add_argument('-o', '--output', default='-', help="JSON lines output file (default stdout)")
+    bulk_parser.add_argument('--fetch-workers', type=int, default=16, help="Concurrent page fetches")
+    bulk_parser.add_argument('--per-host', type=int, default=4, help="Concurrent requests per host")
+    bulk_parser.add_argument('--parse-workers', type=int, default=None,
+                             help="Parser processes (default: CPU count, 0 parses inline)")
+    bulk_parser.add_argument('--browser-workers', type=int, default=1,
+                             help="Browser instances for pages that need JavaScript (0 disables)")
+
+    serve_parser = subparsers.add_parser('serve', help="Run the local job service with an HTTP/JSON API")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default 127.0.0.1)")
+    serve_parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default 8765)")
+    serve_parser.add_argument('--workers', type=int, default=1, help="Jobs run at the same time")
+    serve_parser.add_argument('--download-dir', default=None, help="Directory for jobs that do not name one")
+
+    autotune_parser = subparsers.add_parser('autotune', help="Calibrate a host and save a tuned performance profile")
+    autotune_parser.add_argument('target', nargs='?', help="Master/media playlist URL or video ID")
+    autotune_parser.add_argument('--local', action='store_true',
+                                 help="Calibrate against the built-in benchmark server (nothing is saved)")
+    autotune_parser.add_argument('--dry-run', action='store_true', help="Print the profile without saving it")
+    autotune_parser.add_argument('--transport', default='auto', choices=['auto', 'http1', 'http2'])
+
+    replay_parser = subparsers.add_parser('replay', help="Run extraction and download from captured traffic only")
+    replay_parser.add_argument('url', help="Page URL that was captured")
+    replay_parser.add_argument('--capture-dir', default=None, help="Capture store directory (default from config)")
+    replay_parser.add_argument('--download-dir', default=None, help="Where to write the output (default cwd)")
+    replay_parser.add_argument('--audio-language', default=None, help="Language of the alternate audio track")
+    replay_parser.add_argument('--subtitles', nargs='?', const=True, default=False, metavar='LANG',
+                               help="Also fetch subtitles, the default track or LANG")
+
+    playlist_bench_parser = subparsers.add_parser('bench-playlist',
+                                                  help="Benchmark media playlist parsing on a synthetic playlist")
+    playlist_bench_parser.add_argument('--segments', type=int, default=50000, help="Segments in the playlist")
+    playlist_bench_parser.add_argument('--segment-duration', type=float, default=2.0, help="Seconds per segment")
+
+    worker_bench_parser = subparsers.add_parser('bench-workers',
+                                                help="Benchmark segment worker processes against the local server")
+    worker_bench_parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4],
+                                     help="Worker process counts to compare (0 runs transfers on threads)")
+    worker_bench_parser.add_argument('--segments', type=int, default=200, help="Segments in the playlist")
+    worker_bench_parser.add_argument('--segment-size', type=int, default=2 * 1024 ** 2, help="Bytes per segment")
+    worker_bench_parser.add_argument('--concurrency', type=int, default=16, help="Segments in flight")
+
+    return parser.parse_args(argv)
 
 def main():
     """Main application entry point"""
+    args = parse_args(sys.argv[1:])
     try:
-        app = VideoDownloaderApp()
-        app.mainloop()  # CustomTkinter uses mainloop() like regular tkinter
+        if args.command in ('verify', 'repair'):
+            run_verify(args)
+        elif args.command == 'bulk':
+            run_bulk(args)
+        elif args.command == 'serve':
+            run_service(args)
+        elif args.command == 'autotune':
+            run_autotune(args)
+        elif args.command == 'replay':
+            run_replay(args)
+        elif args.command == 'bench-playlist':
+            run_playlist_bench(args)
+        elif args.command == 'bench-workers':
+            run_worker_bench(args)
+        else:
+            run_gui()
     except Exception as e:
         print(f"Application error: {e}")
         sys.exit(1)
@@ -0,0 +1 @@
+"""Service package initialization"""
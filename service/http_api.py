@@ -0,0 +1,187 @@
+"""
+Local HTTP/JSON API for the download service, with Server-Sent Event progress streams
+
+    POST   /jobs               {"url": ..., "download_dir": ..., "quality": ...,
+                                "start": seconds, "end": seconds | "duration": seconds,
+                                "audio_language": code, "subtitles": true | code}
+    GET    /jobs[?state=...]   list jobs, newest first
+    GET    /jobs/<id>          one job
+    DELETE /jobs/<id>          cancel a queued or running job
+    GET    /jobs/<id>/events   SSE stream of one job, ends when it finishes
+    GET    /events             SSE stream of every job
+    GET    /status             worker, connection and cache state
+"""
+
+import json
+import queue
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from .jobs import FINAL_STATES
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Comment line sent on idle streams so proxies and clients keep the connection open
+SSE_KEEPALIVE_INTERVAL = 15.0
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'AbyssDownloader/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def manager(self):
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _route(self):
+        path = urlparse(self.path).path.rstrip('/')
+        return [part for part in path.split('/') if part]
+
+    def do_GET(self):
+        parts = self._route()
+        if parts == ['status']:
+            self._send_json(200, self.manager.status())
+        elif parts == ['jobs']:
+            query = parse_qs(urlparse(self.path).query)
+            state = query.get('state', [None])[0]
+            try:
+                limit = int(query.get('limit', [100])[0])
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                self._send_json(400, {'error': "'limit' must be a positive integer"})
+                return
+            self._send_json(200, {'jobs': self.manager.store.list(state, limit)})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.manager.store.get(parts[1])
+            if job is None:
+                self._send_json(404, {'error': 'job not found'})
+            else:
+                self._send_json(200, job)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            self._stream_events(parts[1])
+        elif parts == ['events']:
+            self._stream_events(None)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self._route() != ['jobs']:
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+        url = payload.get('url') if isinstance(payload, dict) else None
+        if not url:
+            self._send_json(400, {'error': "'url' is required"})
+            return
+        try:
+            job = self.manager.submit(url, payload.get('download_dir'), payload.get('quality', 'auto'),
+                                      payload.get('start'), payload.get('end'), payload.get('duration'),
+                                      payload.get('audio_language'), payload.get('subtitles', False))
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(201, job)
+
+    def do_DELETE(self):
+        parts = self._route()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'not found'})
+            return
+        job = self.manager.store.get(parts[1])
+        if job is None:
+            self._send_json(404, {'error': 'job not found'})
+        elif self.manager.cancel(parts[1]):
+            self._send_json(202, {'id': parts[1], 'cancelling': True})
+        else:
+            self._send_json(409, {'error': f"job already {job['state']}"})
+
+    def _write_event(self, event):
+        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _stream_events(self, job_id):
+        if job_id is not None:
+            job = self.manager.store.get(job_id)
+            if job is None:
+                self._send_json(404, {'error': 'job not found'})
+                return
+
+        # Subscribe before sending the snapshot so no update falls in between
+        subscription = self.manager.events.subscribe(job_id)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+
+            if job_id is not None:
+                job = self.manager.store.get(job_id)
+                self._write_event(job)
+                if job['state'] in FINAL_STATES:
+                    return
+
+            events = subscription[1]
+            while not self.manager.stopping.is_set():
+                try:
+                    event = events.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                self._write_event(event)
+                if job_id is not None and event.get('state') in FINAL_STATES:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.manager.events.unsubscribe(subscription)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, manager, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.manager = manager
+        super().__init__((host, port), ServiceRequestHandler)
+
+
+def serve(manager, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Run the API until interrupted, then stop the workers"""
+    server = ServiceServer(manager, host, port)
+    manager.start()
+    logger.info(f"Download service listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.stop()
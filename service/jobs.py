@@ -0,0 +1,389 @@
+"""
+Persistent job queue and warm workers for the download service
+"""
+
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+import logging
+
+from downloader.video_extractor import EnhancedVideoExtractor
+from downloader.fragment_downloader import FragmentDownloader
+from downloader.segment_store import SegmentStore
+from downloader.playlist import resolve_time_range
+from downloader.cancellation import CancellationToken, DownloadCancelled
+from utils.config import Config
+
+logger = logging.getLogger('video_downloader')
+
+DEFAULT_JOBS_DB = os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "jobs.sqlite")
+
+STATE_QUEUED = 'queued'
+STATE_EXTRACTING = 'extracting'
+STATE_DOWNLOADING = 'downloading'
+STATE_COMPLETED = 'completed'
+STATE_FAILED = 'failed'
+STATE_CANCELLED = 'cancelled'
+FINAL_STATES = (STATE_COMPLETED, STATE_FAILED, STATE_CANCELLED)
+
+JOB_FIELDS = ('id', 'url', 'download_dir', 'quality', 'state', 'current', 'total',
+              'output_path', 'error', 'created_at', 'updated_at', 'start_time', 'end_time',
+              'audio_language', 'subtitles')
+
+# Stored subtitles value for the variant's default subtitle track, rather than a language code
+SUBTITLES_DEFAULT = 'default'
+
+# Progress is written to the database at most this often per job
+PROGRESS_PERSIST_INTERVAL = 1.0
+
+
+class JobStore:
+    """sqlite-backed job queue that survives service restarts"""
+
+    def __init__(self, path=DEFAULT_JOBS_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                download_dir TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                state TEXT NOT NULL,
+                current INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                output_path TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                start_time REAL,
+                end_time REAL,
+                audio_language TEXT,
+                subtitles TEXT
+            )
+        """)
+        # Databases from before clip downloads and rendition options lack their columns
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (('start_time', 'REAL'), ('end_time', 'REAL'), ('audio_language', 'TEXT'),
+                             ('subtitles', 'TEXT')):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        self._db.commit()
+
+    def _row(self, row):
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def add(self, url, download_dir, quality='auto', start_time=None, end_time=None, audio_language=None,
+            subtitles=None):
+        """Queue a job; subtitles is None for none, SUBTITLES_DEFAULT or a language code"""
+        now = time.time()
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, url, download_dir, quality, state, created_at, updated_at, start_time, end_time, "
+                "audio_language, subtitles) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, url, download_dir, quality, STATE_QUEUED, now, now, start_time, end_time,
+                 audio_language, subtitles)
+            )
+            self._db.commit()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row)
+
+    def list(self, state=None, limit=100):
+        query = f"SELECT {', '.join(JOB_FIELDS)} FROM jobs"
+        params = ()
+        if state:
+            query += " WHERE state = ?"
+            params = (state,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, params + (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", tuple(fields.values()) + (job_id,))
+            self._db.commit()
+
+    def claim_next(self):
+        """Move the oldest queued job to the extracting state and return it"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1",
+                (STATE_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                (STATE_EXTRACTING, time.time(), row[0])
+            )
+            self._db.commit()
+        job = self._row(row)
+        job['state'] = STATE_EXTRACTING
+        return job
+
+    def cancel_queued(self, job_id):
+        """Cancel a job that no worker has claimed yet"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                (STATE_CANCELLED, time.time(), job_id, STATE_QUEUED)
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def requeue_interrupted(self):
+        """Put jobs that were running when the service stopped back in the queue"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE state IN (?, ?)",
+                (STATE_QUEUED, time.time(), STATE_EXTRACTING, STATE_DOWNLOADING)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class EventHub:
+    """Fans job events out to Server-Sent Event subscribers"""
+
+    def __init__(self, max_backlog=1000):
+        self.max_backlog = max_backlog
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, job_id=None):
+        """Queue receiving the events of one job, or of every job when job_id is None"""
+        subscription = (job_id, queue.Queue(self.max_backlog))
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for job_id, events in subscribers:
+            if job_id is not None and job_id != event['id']:
+                continue
+            # A slow client loses its oldest progress updates, never the newest state
+            while True:
+                try:
+                    events.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        events.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class JobWorker:
+    """Runs jobs one at a time on an extractor and downloader kept warm between jobs"""
+
+    def __init__(self, manager, index, segment_store):
+        self.manager = manager
+        self.extractor = EnhancedVideoExtractor(config=manager.config)
+        self.extractor.keep_browser = True
+        self.downloader = FragmentDownloader(segment_store=segment_store, config=manager.config)
+        self.job_id = None
+        self.cancel_token = None
+        self.jobs_done = 0
+        self._thread = threading.Thread(target=self._run, name=f'job-worker-{index}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def cancel(self, job_id=None):
+        token = self.cancel_token
+        if token is not None and (job_id is None or job_id == self.job_id):
+            token.cancel()
+            return True
+        return False
+
+    def _run(self):
+        manager = self.manager
+        while not manager.stopping.is_set():
+            job = manager.claim(self)
+            if job is None:
+                manager.wake.wait(1.0)
+                manager.wake.clear()
+                continue
+            self._run_job(job)
+
+        self.extractor._quit_selenium_driver()
+        self.downloader.close_workers()
+
+    def _run_job(self, job):
+        manager = self.manager
+        # With profiling on, the job's extraction and download profiles share a directory
+        self.extractor.profile_scope = self.downloader.profile_scope = job['id']
+        manager.publish(job['id'], state=STATE_EXTRACTING)
+        last_persist = [0.0]
+
+        def progress(current, total):
+            now = time.monotonic()
+            persist = now - last_persist[0] >= PROGRESS_PERSIST_INTERVAL or current >= total
+            if persist:
+                last_persist[0] = now
+            manager.publish(job['id'], persist=persist, current=current, total=total)
+
+        try:
+            video_info = self.extractor.extract_video_info(job['url'], cancel_token=self.cancel_token)
+            manager.publish(job['id'], state=STATE_DOWNLOADING)
+            output_path = self.downloader.download_video(
+                video_info['video_id'],
+                quality=job['quality'],
+                download_dir=job['download_dir'],
+                progress_callback=progress,
+                cancel_token=self.cancel_token,
+                start_time=job['start_time'],
+                end_time=job['end_time'],
+                audio_language=job['audio_language'],
+                subtitles=True if job['subtitles'] == SUBTITLES_DEFAULT else job['subtitles'] or False
+            )
+            manager.publish(job['id'], state=STATE_COMPLETED, output_path=output_path,
+                            metrics=self.downloader.last_metrics)
+        except DownloadCancelled:
+            # Cancelled by a client, or by shutdown, which leaves the job queued for the next start
+            if manager.stopping.is_set():
+                manager.publish(job['id'], state=STATE_QUEUED)
+            else:
+                manager.publish(job['id'], state=STATE_CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            manager.publish(job['id'], state=STATE_FAILED, error=str(e))
+        finally:
+            self.jobs_done += 1
+            self.job_id = None
+            self.cancel_token = None
+
+
+class JobManager:
+    """Owns the job queue, the warm workers and progress fan-out"""
+
+    def __init__(self, store=None, workers=1, segment_store=None, default_download_dir=None, config=None):
+        self.config = config or Config()
+        self.store = store or JobStore()
+        self.events = EventHub()
+        self.default_download_dir = default_download_dir or self.config.get('download_directory')
+        self.stopping = threading.Event()
+        self.wake = threading.Event()
+        self.started_at = time.time()
+        # Held while a worker claims a job and takes its cancel token, so a
+        # cancel never finds the job claimed but not yet cancellable
+        self._claim_lock = threading.Lock()
+        # One segment store shared by every worker, so repeated segments are never re-fetched
+        self.segment_store = segment_store or SegmentStore()
+
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            logger.info(f"Re-queued {requeued} job(s) interrupted by the last shutdown")
+
+        self.workers = [JobWorker(self, index, self.segment_store) for index in range(workers)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=30):
+        self.stopping.set()
+        self.wake.set()
+        for worker in self.workers:
+            worker.cancel()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.store.close()
+        self.segment_store.close()
+
+    def submit(self, url, download_dir=None, quality='auto', start_time=None, end_time=None, duration=None,
+               audio_language=None, subtitles=False):
+        """Queue a job; start_time with end_time or duration (seconds) downloads only that clip
+
+        audio_language picks the alternate audio track; subtitles is True for
+        the default subtitle track or a language code.
+        """
+        if start_time is not None or end_time is not None or duration is not None:
+            start_time, end_time = resolve_time_range(start_time, end_time, duration)
+        if audio_language is not None and not isinstance(audio_language, str):
+            raise ValueError("'audio_language' must be a language code")
+        if subtitles is not None and not isinstance(subtitles, (bool, str)):
+            raise ValueError("'subtitles' must be true, false or a language code")
+        if subtitles is True:
+            subtitles = SUBTITLES_DEFAULT
+        job = self.store.add(url, download_dir or self.default_download_dir, quality, start_time, end_time,
+                             audio_language or None, subtitles or None)
+        self.events.publish({'id': job['id'], 'state': job['state'], 'url': url})
+        self.wake.set()
+        return job
+
+    def claim(self, worker):
+        """Claim the oldest queued job for worker and give it a cancel token, or None"""
+        with self._claim_lock:
+            job = self.store.claim_next()
+            if job is not None:
+                worker.job_id = job['id']
+                worker.cancel_token = CancellationToken()
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job, returns False if it already finished"""
+        with self._claim_lock:
+            if self.store.cancel_queued(job_id):
+                self.events.publish({'id': job_id, 'state': STATE_CANCELLED})
+                return True
+            return any(worker.cancel(job_id) for worker in self.workers)
+
+    def publish(self, job_id, persist=True, metrics=None, **fields):
+        """Record a job change and push it to event subscribers"""
+        if persist:
+            self.store.update(job_id, **fields)
+        event = dict(fields, id=job_id)
+        if metrics:
+            event['metrics'] = metrics
+        self.events.publish(event)
+
+    def status(self):
+        return {
+            'uptime': round(time.time() - self.started_at, 1),
+            'workers': [
+                {
+                    'job': worker.job_id,
+                    'jobs_done': worker.jobs_done,
+                    'browser_warm': worker.extractor.selenium_driver is not None,
+                    'transport': worker.downloader.transport.name,
+                    'connections': worker.downloader.transport.stats.snapshot()
+                }
+                for worker in self.workers
+            ],
+            'host_health': {
+                host: health
+                for worker in self.workers
+                for host, health in worker.downloader.host_health.snapshot().items()
+            },
+            'segment_store_bytes': self.segment_store.size()
+        }
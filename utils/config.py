@@ -4,32 +4,156 @@ Configuration management
 
 import os
 import json
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger('video_downloader')
+
+# name: (type, minimum, maximum, default)
+PERFORMANCE_SETTINGS = {
+    # Segments fetched in parallel
+    'concurrency': (int, 1, 64, 8),
+    # Bytes read per iteration when streaming a segment to disk
+    'chunk_size': (int, 4096, 4 * 1024 ** 2, 64 * 1024),
+    # Bytes of finished segments allowed to wait ahead of the output writer
+    'buffer_budget': (int, 1024 ** 2, 4 * 1024 ** 3, 64 * 1024 ** 2),
+    # Seconds to wait on a playlist, segment or player request
+    'timeout': (float, 1, 600, 30),
+    # Seconds to wait on a web page
+    'page_timeout': (float, 1, 600, 60),
+    # Attempts per host for a failed request
+    'max_retries': (int, 1, 10, 3),
+    # Largest request that adjacent EXT-X-BYTERANGE segments are merged into (0 fetches each on its own)
+    'range_request_size': (int, 0, 256 * 1024 ** 2, 8 * 1024 ** 2),
+    # Worker processes segment transfers are sharded across (0 runs them on threads of this process)
+    'processes': (int, 0, 64, 0),
+}
+
+
+def validate_performance(values, strict=True):
+    """Check performance settings against PERFORMANCE_SETTINGS
+
+    Returns the cleaned values. Unknown names or out-of-range values raise
+    ValueError, or with strict=False are logged and dropped.
+    """
+    cleaned = {}
+    for name, value in (values or {}).items():
+        try:
+            if name not in PERFORMANCE_SETTINGS:
+                raise ValueError(f"Unknown performance setting '{name}'")
+            kind, minimum, maximum, _ = PERFORMANCE_SETTINGS[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Performance setting '{name}' must be a number, got {value!r}")
+            if kind is int and value != int(value):
+                raise ValueError(f"Performance setting '{name}' must be a whole number, got {value!r}")
+            if not minimum <= value <= maximum:
+                raise ValueError(f"Performance setting '{name}' must be between {minimum} and {maximum}, got {value}")
+            cleaned[name] = kind(value)
+        except ValueError as e:
+            if strict:
+                raise
+            logger.warning(f"Ignoring invalid configuration: {e}")
+    return cleaned
+
+
+def _lowercase_hosts(profiles):
+    """performance_profiles keyed by lowercased hostname, merging entries that differ only in case"""
+    lowered = {}
+    for host, profile in (profiles or {}).items():
+        lowered[host.lower()] = dict(lowered.get(host.lower(), {}), **profile)
+    return lowered
+
 
 class Config:
-    def __init__(self):
-        self.config_file = "config.json"
+    def __init__(self, config_file="config.json"):
+        self.config_file = config_file
+        self._dirty = False
+        self._batch_depth = 0
         self.config = self.load_config()
-    
+
     def load_config(self):
         """Load configuration from file"""
+        config = self.get_default_config()
+        site_configs = config['site_configs']
+        stored = {}
         if os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r') as f:
-                    return json.load(f)
+                    stored = json.load(f)
             except:
                 pass
-        return self.get_default_config()
-    
+        if not isinstance(stored, dict):
+            stored = {}
+        # Only the file's own keys and later set() calls are written back, so
+        # defaults are never frozen into the file
+        self._stored = self._migrate(stored)
+        config.update(self._stored)
+        # Sites from the file add to or replace the built-in ones rather than hiding them all
+        config['site_configs'] = dict(site_configs, **(config.get('site_configs') or {}))
+        return config
+
+    def _migrate(self, config):
+        """Bring older configuration files up to date"""
+        # Older defaults used 'download_dir' while saved files use 'download_directory'
+        if 'download_dir' in config:
+            config.setdefault('download_directory', config['download_dir'])
+            del config['download_dir']
+
+        # Top-level timeout and max_retries predate the performance section
+        performance = dict(config.get('performance') or {})
+        for name in ('timeout', 'max_retries'):
+            if name in config:
+                performance.setdefault(name, config.pop(name))
+        if performance or 'performance' in config:
+            config['performance'] = validate_performance(performance, strict=False)
+
+        if 'performance_profiles' in config:
+            config['performance_profiles'] = _lowercase_hosts({
+                host: validate_performance(profile, strict=False)
+                for host, profile in (config.get('performance_profiles') or {}).items()
+            })
+        return config
+
     def get_default_config(self):
         """Get default configuration"""
         return {
-            'download_dir': os.path.expanduser("~/Downloads"),
+            'download_directory': os.path.expanduser("~/Downloads"),
             'default_quality': 'auto',
+            'performance': {},
+            'performance_profiles': {},
+            # Opt-in capture of HTTP traffic for offline replay (python main.py replay)
+            'capture': {
+                'enabled': False,
+                'directory': os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "captures"),
+                'max_bytes': 256 * 1024 ** 2,
+                # Captured bodies waiting to be written; more are dropped rather than held in memory
+                'queue_bytes': 64 * 1024 ** 2
+            },
+            # Opt-in CPU/memory/thread profiling of every extraction and download run
+            'profiling': {
+                'enabled': False,
+                'directory': os.path.join(os.path.expanduser("~"), ".cache", "abyss_downloader", "profiles"),
+                'sample_interval': 0.005
+            },
+            # Headless browser used when static extraction fails
+            'browser': {
+                # Eager page loads, blocked images/fonts/styles/ads and memory-capping flags
+                'lean': True,
+                # Extra Network.setBlockedURLs wildcard patterns
+                'blocked_urls': [],
+                # Per-host patterns to let through, e.g. {"player.example.com": ["*.css"]}
+                'allow': {}
+            },
+            # Per-host extractors, see downloader/site_extractors.py for the handlers and their keys
             'site_configs': {
                 'asmrfree.com': {
+                    'handler': 'wordpress',
                     'token_pattern': r'var\s+token\s*=\s*["\']([^"\']+)["\']',
                     'post_id_pattern': r'post-(\d+)',
                     'ajax_url': 'https://asmrfree.com/wp-admin/admin-ajax.php'
+                },
+                'asmrfreeplayer.fun': {
+                    'handler': 'asmrfree_player'
                 }
             },
             'headers': {
@@ -38,20 +162,68 @@ class Config:
                 'Accept-Language': 'en-US,en;q=0.5'
             }
         }
-    
+
     def save_config(self):
         """Save configuration to file"""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            tmp_file = f"{self.config_file}.tmp"
+            stored = dict(self._stored)
+            if 'performance_profiles' in stored:
+                stored['performance_profiles'] = _lowercase_hosts(stored['performance_profiles'])
+            with open(tmp_file, 'w') as f:
+                json.dump(stored, f, indent=4)
+            os.replace(tmp_file, self.config_file)
+            self._dirty = False
         except Exception as e:
             print(f"Failed to save config: {e}")
-    
+
     def get(self, key, default=None):
         """Get configuration value"""
         return self.config.get(key, default)
-    
+
     def set(self, key, value):
-        """Set configuration value"""
+        """Set configuration value, saving only when it changed and no batch is open"""
+        if key == 'performance_profiles':
+            # Profiles are looked up by lowercased hostname
+            value = _lowercase_hosts(value)
+        if key in self.config and self.config[key] == value:
+            return
         self.config[key] = value
-        self.save_config()
+        self._stored[key] = value
+        self._dirty = True
+        if not self._batch_depth:
+            self.save_config()
+
+    @contextmanager
+    def batch(self):
+        """Group several set() calls into a single save"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self.save_config()
+
+    def performance(self, host=None):
+        """Effective performance settings: defaults, then the config section, then host's tuned profile"""
+        settings = {name: spec[3] for name, spec in PERFORMANCE_SETTINGS.items()}
+        settings.update(self.config.get('performance', {}))
+        if host:
+            settings.update(self.config.get('performance_profiles', {}).get(host.lower(), {}))
+        return settings
+
+    def max_concurrency(self):
+        """Highest concurrency any host may use, for sizing connection pools"""
+        profiles = [self.performance()] + list(self.config.get('performance_profiles', {}).values())
+        return max(profile.get('concurrency', 0) for profile in profiles) or PERFORMANCE_SETTINGS['concurrency'][3]
+
+    def set_performance(self, values, host=None):
+        """Validate and store performance settings, globally or as host's profile"""
+        values = validate_performance(values)
+        if host is None:
+            self.set('performance', dict(self.config.get('performance', {}), **values))
+        else:
+            profiles = dict(self.config.get('performance_profiles', {}))
+            profiles[host.lower()] = dict(profiles.get(host.lower(), {}), **values)
+            self.set('performance_profiles', profiles)